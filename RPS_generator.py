@@ -4,7 +4,12 @@ import h5py
 from datetime import datetime, timedelta
 from tqdm import tqdm
 import os
-from hikyuu.interactive import *
+import sys
+import argparse
+from rps_store import atomic_h5
+# 以 spawn 方式启动的工作进程会以 __mp_main__ 导入本脚本，工作进程只加载各自所需的证券
+if __name__ != '__mp_main__':
+    from hikyuu.interactive import *
 
 def calculate_daily_rps(start_date=None, end_date=None, periods=[10, 20, 50, 120, 250], output_file='daily_rps.h5'):
     """
@@ -51,8 +56,8 @@ def calculate_daily_rps(start_date=None, end_date=None, periods=[10, 20, 50, 120
     
     print(f"获取到 {len(stock_list_date)} 只股票的上市日期")
     
-    # 创建HDF5文件
-    with h5py.File(output_file, 'w') as f:
+    # 创建HDF5文件：在临时文件上写入，完成后改名替换，计算期间读取方仍读到上一个完整的文件
+    with atomic_h5(output_file, copy=False) as tmp_file, h5py.File(tmp_file, 'w') as f:
         # 为每个交易日创建一个组
         for date in tqdm(trading_dates, desc="处理交易日"):
             date_group = f.create_group(str(date.ymd))
@@ -211,40 +216,68 @@ def get_top_rps_stocks(h5_file, date, periods=[10, 20, 50, 120, 250], top_n=5, w
     rps_sum.sort(key=lambda x: x[1], reverse=True)
     return rps_sum[:top_n]
 
-# 使用示例
-if __name__ == "__main__":
-    # 初始化Hikyuu
-    # import hikyuu as hku
-    # hku.init()
-    
-    # 定义输出文件
-    output_file = 'daily_rps.h5'
-    
-    # 计算每日RPS数据
-    # 注意：这个过程可能会很耗时，取决于股票数量和日期范围
-    start_date = Datetime('2024-01-01')
-    end_date = Datetime('2025-03-21')
-    
-    # 如果文件不存在，则计算并保存RPS数据
-    if not os.path.exists(output_file):
-        calculate_daily_rps(start_date=start_date, end_date=end_date, output_file=output_file)
-    
-    # 查询特定日期的RPS排名前5的股票
-    # test_date = '20250320'  # 确保这是交易日
-    # top_stocks = get_top_rps_stocks(output_file, test_date, top_n=5)
-    
-    # print(f"\n{test_date} RPS总和排名前5的股票:")
-    # for code, rps_sum in top_stocks:
-    #     stock = get_stock(code)
-    #     print(f"{code} {stock.name}: RPS总和 = {rps_sum:.2f}")
-    
-    # # 查看特定股票在特定日期的各周期RPS值
-    # if top_stocks:
-    #     top_code = top_stocks[0][0]
-    #     print(f"\n股票 {top_code} 在 {test_date} 的各周期RPS值:")
-    #     for period in [10, 20, 50, 120, 250]:
-    #         rps_dict = load_rps_data(output_file, test_date, period)
-    #         if top_code in rps_dict:
-    #             print(f"RPS{period} = {rps_dict[top_code]:.2f}")
+def resolve_pool(pool):
+    """
+    解析命令行指定的证券池
+
+    参数:
+        pool: 'blocka' 全部 A 股；以 .EBK 结尾的通达信自选股文件；
+              '板块分类:板块名称'，如 '指数板块:沪深300'；或 stock_pool 默认注册表中的名称
+
+    返回:
+        证券代码列表
+    """
+    if pool == 'blocka':
+        return [s.market_code for s in blocka]
+    if pool.lower().endswith('.ebk'):
+        from utils import read_guchi
+        return [code.upper() for code in read_guchi(pool)]
+    if ':' in pool:
+        category, name = pool.split(':', 1)
+        return [s.market_code for s in sm.get_block(category, name)]
+    from stock_pool import registry
+    return registry.codes(pool)
 
 
+def main(argv=None):
+    """
+    每日 RPS 计算命令行，各阶段的吞吐量以 JSON 行输出到标准输出
+
+    示例:
+        python RPS_generator.py --start 2024-01-01                 # 增量补齐缺少的交易日
+        python RPS_generator.py --start 2024-01-01 --mode full -j 8
+        python RPS_generator.py --start 2025-01-01 --mode verify
+        python RPS_generator.py --pool guchi.EBK --periods 10,20 --layout yearly -o rps_guchi
+    """
+    import time
+    import rps_pipeline
+    parser = argparse.ArgumentParser(description="计算每日 RPS 并保存为 HDF5")
+    parser.add_argument('--start', default='2024-01-01', help="开始日期 YYYY-MM-DD")
+    parser.add_argument('--end', default=None, help="结束日期 YYYY-MM-DD（不含），默认计算到最新交易日")
+    parser.add_argument('--periods', default='10,20,50,120,250', help="逗号分隔的 RPS 周期")
+    parser.add_argument('--pool', default='blocka', help="证券池: blocka、EBK 文件、'板块分类:板块名称' 或注册表名称")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="读取 K 线的工作进程数，0 表示不使用子进程")
+    parser.add_argument('--chunk-size', type=int, default=300, help="每个工作进程任务的证券数量")
+    parser.add_argument('--mode', choices=['incremental', 'full', 'verify'], default='incremental',
+                        help="incremental 补齐缺少的交易日；full 重建；verify 重算并与已保存结果比较")
+    parser.add_argument('--layout', choices=list(rps_pipeline.LAYOUTS), default='single',
+                        help="single 单个文件；yearly/monthly 按年/按月分区的目录（见 rps_store.py）")
+    parser.add_argument('-o', '--output', default='daily_rps.h5', help="输出文件或目录")
+    parser.add_argument('--metrics', default=None, help="同时追加保存阶段统计的 JSON 行文件")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    codes = resolve_pool(args.pool)
+    rps_pipeline._emit('pool', args.metrics, pool=args.pool, stocks=len(codes),
+                       seconds=round(time.perf_counter() - t0, 3))
+    end_date = Datetime(args.end) if args.end else Datetime.today() + Days(1)
+    stats = rps_pipeline.generate(codes, Datetime(args.start), end_date,
+                                  periods=[int(p) for p in args.periods.split(',')], output=args.output,
+                                  layout=args.layout, mode=args.mode, workers=args.workers,
+                                  chunk_size=args.chunk_size, metrics_file=args.metrics)
+    # verify 发现不一致时以非零状态退出，便于定时任务报警
+    return 1 if any(s['stage'] == 'verify' and s['mismatches'] for s in stats) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
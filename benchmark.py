@@ -0,0 +1,324 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows 下无 resource 模块，不统计内存
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 标准规模: 股票数量、年数、calculate_daily_rps 计算的交易日数
+SIZES = {
+    'small': {'stocks': 200, 'years': 3, 'rps_days': 20},
+    'medium': {'stocks': 1000, 'years': 10, 'rps_days': 60},
+    'market': {'stocks': 5000, 'years': 20, 'rps_days': 250},
+}
+
+RESULT_PREFIX = 'BENCH_RESULT '
+
+
+def _status_mb(field):
+    """读取 /proc/self/status 中的内存字段（VmRSS、VmHWM），非 Linux 返回 None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Linux 下重置 VmHWM，使之后的峰值只反映用例本身，而不是准备数据阶段"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    peak = _status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _rps_dates(rps_file):
+    import h5py
+    with h5py.File(rps_file, 'r') as f:
+        return sorted(f.keys())
+
+
+# ----------------------------------------------------------------------
+# 测试用例：在子进程中执行，完成准备工作后返回需要计时的无参函数
+# ----------------------------------------------------------------------
+def _case_calculate_daily_rps(ctx):
+    from hikyuu import Datetime, Days
+    import RPS_generator
+    dates = ctx['market'].dates
+    start = Datetime(int(dates[-ctx['rps_days']]))
+    end = Datetime(int(dates[-1])) + Days(1)
+    output = os.path.join(ctx['data'], 'bench_rps.h5')
+    return lambda: RPS_generator.calculate_daily_rps(start_date=start, end_date=end, output_file=output)
+
+
+def _case_read_rps_to_dataframe(ctx):
+    from rps import read_rps_to_dataframe
+    return lambda: read_rps_to_dataframe(ctx['rps_file'], 10)
+
+
+def _case_read_rps_file(ctx):
+    from utils import read_rps_file
+    return lambda: read_rps_file(ctx['rps_file'], 10)
+
+
+def _case_load_rps_data(ctx):
+    from RPS_generator import load_rps_data
+    dates = _rps_dates(ctx['rps_file'])
+    return lambda: [load_rps_data(ctx['rps_file'], d, 10) for d in dates]
+
+
+def _case_get_top_rps_stocks(ctx):
+    from RPS_generator import get_top_rps_stocks
+    dates = _rps_dates(ctx['rps_file'])
+    return lambda: [get_top_rps_stocks(ctx['rps_file'], d) for d in dates]
+
+
+def _case_rps_simple_calculate_rps(ctx):
+    import rps_simple
+    return lambda: rps_simple.calculate_rps(market='ALL')
+
+
+def _case_rps10_part(ctx):
+    # RPS10 部件从当前目录读取 daily_rps.h5
+    path = os.path.join(REPO_DIR, 'hikyuu_hub', 'ind', 'RPS10', 'part.py')
+    spec = importlib.util.spec_from_file_location('rps10_part', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.part
+
+
+def _case_se_pf(ctx):
+    from hikyuu.interactive import (sm, Query, Datetime, crtTM, SG_Cross, MA, CLOSE, MM_FixedCount,
+                                    SYS_Simple, SE_Signal, AF_EqualWeight, PF_Simple)
+    stks = [s for s in sm.get_block('指数板块', '沪深300')][:300]
+    start = Datetime(int(ctx['market'].dates[-250]))
+
+    def run():
+        my_sys = SYS_Simple(sg=SG_Cross(MA(CLOSE(), 5), MA(CLOSE(), 20)), mm=MM_FixedCount(100))
+        my_se = SE_Signal(stks, my_sys)
+        my_pf = PF_Simple(tm=crtTM(start), af=AF_EqualWeight(), se=my_se, adjust_cycle=1,
+                          adjust_mode='day', delay_to_trading_day=True)
+        my_pf.run(Query(start))
+        return my_pf
+    return run
+
+
+CASES = {
+    'calculate_daily_rps': _case_calculate_daily_rps,
+    'read_rps_to_dataframe': _case_read_rps_to_dataframe,
+    'read_rps_file': _case_read_rps_file,
+    'load_rps_data': _case_load_rps_data,
+    'get_top_rps_stocks': _case_get_top_rps_stocks,
+    'rps_simple.calculate_rps': _case_rps_simple_calculate_rps,
+    'RPS10': _case_rps10_part,
+    'se_pf': _case_se_pf,
+}
+
+
+def run_case(name, size, data, repeat=1):
+    """子进程入口：准备、计时并输出一行 JSON 结果"""
+    from synthetic import SyntheticMarket
+    spec = SIZES[size]
+    ctx = {**spec, 'data': data, 'rps_file': os.path.join(data, 'daily_rps.h5'),
+           'market': SyntheticMarket(spec['stocks'], spec['years'])}
+    result = {'case': name, 'size': size}
+    try:
+        func = CASES[name](ctx)
+        result['setup_rss_mb'] = _peak_rss_mb()
+        # 用例的内存增量 = 用例期间的峰值 - 开始时的常驻内存；无法重置峰值的平台上包含准备阶段的峰值
+        base_rss = _status_mb('VmRSS')
+        reset = _reset_peak_rss()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        result.update({'seconds': min(times), 'mean_seconds': sum(times) / len(times), 'repeat': repeat,
+                       'peak_rss_mb': _peak_rss_mb()})
+        if reset and base_rss is not None:
+            result['case_rss_mb'] = max(result['peak_rss_mb'] - base_rss, 0.0)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    print(RESULT_PREFIX + json.dumps(result, ensure_ascii=False), flush=True)
+
+
+# ----------------------------------------------------------------------
+# 主进程：准备数据、逐个用例启动子进程、保存历史并与基线比较
+# ----------------------------------------------------------------------
+def prepare(size, root):
+    """
+    生成合成数据目录，并写入 home/.hikyuu/hikyuu.ini，
+    子进程以该目录为 HOME 运行，使 load_hikyuu 与 hikyuu.interactive 读取合成数据
+
+    返回:
+        (数据目录, HOME 目录)
+    """
+    from synthetic import SyntheticMarket
+    spec = SIZES[size]
+    data = os.path.abspath(os.path.join(root, size))
+    home = os.path.join(data, 'home')
+    marker = os.path.join(data, '.done')
+    if not os.path.exists(marker):
+        print(f"生成 {size} 规模合成数据: {spec['stocks']} 只股票 × {spec['years']} 年")
+        config = SyntheticMarket(spec['stocks'], spec['years']).write(data)
+        os.makedirs(os.path.join(home, '.hikyuu'), exist_ok=True)
+        shutil.copy(config, os.path.join(home, '.hikyuu', 'hikyuu.ini'))
+        with open(marker, 'w') as f:
+            f.write(datetime.datetime.now().isoformat())
+    return data, home
+
+
+def _spawn(name, size, data, home, repeat, timeout):
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-case', name, '--size', size,
+           '--data', data, '--repeat', str(repeat)]
+    try:
+        proc = subprocess.run(cmd, cwd=data, env=env, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'case': name, 'size': size, 'error': f"超时 ({timeout}s)"}
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return {'case': name, 'size': size, 'error': (proc.stderr or proc.stdout).strip()[-500:]}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线比较，耗时或峰值内存超过基线 (1 + tolerance) 倍的用例标记为回退
+
+    返回:
+        回退用例名称列表
+    """
+    regressions = []
+    for r in results:
+        base = baseline.get(r['size'], {}).get(r['case'])
+        if base is None or 'error' in r or 'error' in base:
+            continue
+        r['time_ratio'] = r['seconds'] / base['seconds'] if base['seconds'] > 0 else None
+        # 优先比较用例本身的内存增量，准备数据阶段的内存不计入
+        key = 'case_rss_mb' if r.get('case_rss_mb') and base.get('case_rss_mb') else 'peak_rss_mb'
+        if r.get(key) and base.get(key):
+            r['rss_ratio'] = r[key] / base[key]
+        if (r['time_ratio'] or 0) > 1 + tolerance or r.get('rss_ratio', 0) > 1 + tolerance:
+            regressions.append(r['case'])
+    return regressions
+
+
+def report(results, regressions):
+    print(f"\n{'用例':<28}{'规模':<8}{'耗时(s)':>10}{'用例内存(MB)':>14}{'耗时比':>8}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['case']:<28}{r['size']:<8}  出错: {r['error']}")
+            continue
+        rss = r.get('case_rss_mb', r.get('peak_rss_mb'))
+        rss = f"{rss:.0f}" if rss is not None else '-'
+        ratio = f"{r['time_ratio']:.2f}" if r.get('time_ratio') else '-'
+        flag = '  <- 回退' if r['case'] in regressions else ''
+        print(f"{r['case']:<28}{r['size']:<8}{r['seconds']:>10.3f}{rss:>14}{ratio:>8}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RPS 与回测流程的基准测试（使用合成数据）")
+    parser.add_argument('--size', choices=list(SIZES), default='small', help="数据规模")
+    parser.add_argument('--cases', default=None, help="逗号分隔的用例名称，默认全部: " + ', '.join(CASES))
+    parser.add_argument('--root', default='bench_data', help="合成数据目录")
+    parser.add_argument('--repeat', type=int, default=1, help="每个用例重复次数，取最短耗时")
+    parser.add_argument('--timeout', type=int, default=3600, help="单个用例超时秒数")
+    parser.add_argument('--history', default='benchmark_history.jsonl', help="历史结果文件")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="基线文件")
+    parser.add_argument('--save-baseline', action='store_true', help="将本次结果保存为基线")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="允许的回退比例")
+    parser.add_argument('--run-case', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--data', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case, args.size, args.data, args.repeat)
+        return 0
+
+    names = list(CASES) if args.cases is None else [c.strip() for c in args.cases.split(',')]
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"未知的用例: {unknown}")
+
+    data, home = prepare(args.size, args.root)
+    # 读取类用例需要 daily_rps.h5，先按 calculate_daily_rps 的方式生成（不计时）
+    if not os.path.exists(os.path.join(data, 'daily_rps.h5')) and any(
+            n in names for n in ('read_rps_to_dataframe', 'read_rps_file', 'load_rps_data',
+                                 'get_top_rps_stocks', 'RPS10')):
+        r = _spawn('calculate_daily_rps', args.size, data, home, 1, args.timeout)
+        if 'error' in r:
+            print(f"生成 daily_rps.h5 出错: {r['error']}")
+        elif os.path.exists(os.path.join(data, 'bench_rps.h5')):
+            os.replace(os.path.join(data, 'bench_rps.h5'), os.path.join(data, 'daily_rps.h5'))
+
+    results = []
+    for name in names:
+        print(f"运行 {name} ...")
+        results.append(_spawn(name, args.size, data, home, args.repeat, args.timeout))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    report(results, regressions)
+
+    stamp = {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': _git_commit(),
+             'python': platform.python_version(), 'platform': platform.platform()}
+    with open(args.history, 'a', encoding='utf-8') as f:
+        for r in results:
+            f.write(json.dumps({**stamp, **r}, ensure_ascii=False) + '\n')
+
+    if args.save_baseline:
+        for r in results:
+            if 'error' not in r:
+                baseline.setdefault(r['size'], {})[r['case']] = {**stamp, **r}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.baseline}")
+
+    if regressions:
+        print(f"性能回退: {regressions}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+import json
+import math
+import os
+import re
+import numpy as np
+import pandas as pd
+from hikyuu import *
+from trade_log import TRADE_DTYPE, trade_records, to_datetime
+
+# 文件格式: MAGIC + 4 字节头部长度 + JSON 头部 + 连续的 TRADE_DTYPE 定长记录
+# 记录定长，追加写入只需把新记录接在文件末尾
+MAGIC = b'HKEV1\n'
+
+# hikyuu BUSINESS 枚举值
+BUSINESS_INIT = 0
+BUSINESS_BUY = 1
+BUSINESS_SELL = 2
+BUSINESS_GIFT = 3
+BUSINESS_BONUS = 4
+BUSINESS_CHECKIN = 5
+BUSINESS_CHECKOUT = 6
+BUSINESS_CHECKIN_STOCK = 7
+BUSINESS_CHECKOUT_STOCK = 8
+
+# 事件日志可表示的业务: 名称 -> (枚举值, 现金方向, 持仓方向)
+# 买卖的现金变化为 成交价 × 数量 ∓ 成本；分红、存取现金的金额记录在成交价字段
+BUSINESS_TYPES = {
+    'BUY': (BUSINESS_BUY, -1, 1),
+    'SELL': (BUSINESS_SELL, 1, -1),
+    'GIFT': (BUSINESS_GIFT, 0, 1),
+    'BONUS': (BUSINESS_BONUS, 1, 0),
+    'CHECKIN': (BUSINESS_CHECKIN, 1, 0),
+    'CHECKOUT': (BUSINESS_CHECKOUT, -1, 0),
+    'CHECKIN_STOCK': (BUSINESS_CHECKIN_STOCK, 0, 1),
+    'CHECKOUT_STOCK': (BUSINESS_CHECKOUT_STOCK, 0, -1),
+}
+_CASH_SIGN = {v[0]: v[1] for v in BUSINESS_TYPES.values()}
+_POSITION_SIGN = {v[0]: v[2] for v in BUSINESS_TYPES.values()}
+
+# 信号来源 SystemPart 在 tocsv 中的缩写
+PART_NAMES = ['EV', 'CN', 'SG', 'ST', 'TP', 'MM', 'PG', 'SP', 'AF']
+PART_INVALID = len(PART_NAMES)
+
+_CRT_PATTERN = re.compile(
+    r"crtTM\(datetime=Datetime\('([^']+)'\),\s*initCash=([^,]+),\s*costFunc=([^,]+\)),\s*name='([^']*)'\)")
+_ACTION_PATTERN = re.compile(r"my_tm\.(buy|sell)\(Datetime\('([^']+)'\),\s*sm\['(\w+)'\],\s*([^)]*)\)")
+_COST_PATTERN = re.compile(r"^(TC_\w+)\(\)$")
+
+
+def _check_business(events):
+    """事件日志只能表示 BUSINESS_TYPES 中的业务，融资融券等其他业务直接报错，避免回放结果失真"""
+    unknown = sorted(set(np.unique(events['business']).tolist()) - set(_CASH_SIGN))
+    if unknown:
+        raise ValueError(f"事件日志不支持的业务类型: {unknown}")
+
+
+def _datetime_number(text):
+    """'2024-01-16 00:00:00' 转换为 Datetime.number"""
+    return int(re.sub(r'\D', '', text)[:12].ljust(12, '0'))
+
+
+def make_meta(init_datetime, init_cash, cost_func='TC_Zero()', name='SYS'):
+    """
+    事件日志头部
+
+    参数:
+        init_datetime: 账户建立日期, Datetime.number
+        init_cash: 初始资金
+        cost_func: 交易成本函数的文本形式，如 'TC_Zero()'
+        name: 账户名称
+    """
+    return {'init_datetime': int(init_datetime), 'init_cash': float(init_cash),
+            'cost_func': cost_func, 'name': name}
+
+
+def tm_events(tm):
+    """
+    从交易账户提取事件日志
+
+    返回:
+        (meta, events)，events 为 TRADE_DTYPE 结构化数组，包含除建仓（INIT）外的全部记录
+    """
+    events = trade_records(tm)
+    events = events[events['business'] != BUSINESS_INIT]
+    _check_business(events)
+    meta = make_meta(tm.init_datetime.number, tm.init_cash, str(tm.cost_func), tm.name)
+    return meta, events
+
+
+def parse_trades(path):
+    """
+    解析 tm.tocsv 生成的交易记录文件（如 SYS_交易记录.csv），包含分红、送股等全部业务
+
+    返回:
+        TRADE_DTYPE 结构化数组，不含建仓（INIT）记录
+    """
+    df = pd.read_csv(path, encoding='utf-8', dtype={'证券代码': str})
+    df = df[df['业务名称'] != 'INIT']
+    unknown = sorted(set(df['业务名称']) - set(BUSINESS_TYPES))
+    if unknown:
+        raise ValueError(f"事件日志不支持的业务类型: {unknown}")
+    parts = {name: i for i, name in enumerate(PART_NAMES)}
+    return np.array([
+        (_datetime_number(row['#成交日期']), row['证券代码'] if isinstance(row['证券代码'], str) else '',
+         BUSINESS_TYPES[row['业务名称']][0], row['计划交易价格'], row['实际成交价格'], row['目标价格'],
+         row['成交数量'], row['交易总成本'], row['止损价'], row['现金余额'], parts.get(row['信号来源'], PART_INVALID))
+        for _, row in df.iterrows()
+    ], dtype=TRADE_DTYPE)
+
+
+def parse_actions(path, trades_csv=None):
+    """
+    解析 tm.tocsv 生成的 SYS_actions.txt，无需逐行 exec
+
+    SYS_actions.txt 只记录买卖操作，分红、送股等由权息数据产生的记录需从同目录的交易记录文件补充
+
+    参数:
+        path: SYS_actions.txt 路径
+        trades_csv: 交易记录文件，默认为同目录下同名前缀的 _交易记录.csv，存在时合并其中的非买卖记录
+
+    返回:
+        (meta, events)，买卖记录的现金与成本字段为 NaN，可由 replay_state 计算
+    """
+    if trades_csv is None:
+        prefix = os.path.basename(path)
+        prefix = prefix[:-len('_actions.txt')] if prefix.endswith('_actions.txt') else os.path.splitext(prefix)[0]
+        trades_csv = os.path.join(os.path.dirname(path), f"{prefix}_交易记录.csv")
+    meta = None
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            m = _CRT_PATTERN.search(line)
+            if m:
+                meta = make_meta(_datetime_number(m.group(1)), float(m.group(2)), m.group(3).strip(), m.group(4))
+                continue
+            m = _ACTION_PATTERN.search(line)
+            if not m:
+                continue
+            # 参数依次为 real_price, number, stoploss, goal_price, plan_price, part
+            real_price, number, stoploss, goal_price, plan_price, part = \
+                [float(v) for v in m.group(4).split(',')]
+            business = BUSINESS_BUY if m.group(1) == 'buy' else BUSINESS_SELL
+            rows.append((_datetime_number(m.group(2)), m.group(3).upper(), business, plan_price, real_price,
+                         goal_price, number, np.nan, stoploss, np.nan, int(part)))
+    if meta is None:
+        raise ValueError(f"未找到 crtTM 语句: {path}")
+    events = np.array(rows, dtype=TRADE_DTYPE)
+    if os.path.exists(trades_csv):
+        others = parse_trades(trades_csv)
+        others = others[~np.isin(others['business'], (BUSINESS_BUY, BUSINESS_SELL))]
+        events = np.concatenate([others, events])
+        # 权息记录在当日交易之前处理，同一日期内非买卖记录排在前面
+        order = np.lexsort((np.isin(events['business'], (BUSINESS_BUY, BUSINESS_SELL)), events['datetime']))
+        events = events[order]
+    return meta, events
+
+
+def write_log(path, meta, events):
+    """写入事件日志，覆盖已有文件"""
+    header = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(4, 'little'))
+        f.write(header)
+        f.write(np.ascontiguousarray(events, dtype=TRADE_DTYPE).tobytes())
+
+
+def append_log(path, events):
+    """在事件日志末尾追加记录，用于持续运行的模拟账户"""
+    with open(path, 'ab') as f:
+        f.write(np.ascontiguousarray(events, dtype=TRADE_DTYPE).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_log(path):
+    """
+    读取事件日志
+
+    返回:
+        (meta, events)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是事件日志文件: {path}")
+        size = int.from_bytes(f.read(4), 'little')
+        meta = json.loads(f.read(size).decode('utf-8'))
+        offset = f.tell()
+    events = np.fromfile(path, dtype=TRADE_DTYPE, offset=offset)
+    return meta, events
+
+
+def _load(source):
+    """source 可以为事件日志路径、SYS_actions.txt 路径或 (meta, events)"""
+    if isinstance(source, tuple):
+        meta, events = source
+    elif source.endswith('.txt'):
+        meta, events = parse_actions(source)
+    else:
+        meta, events = read_log(source)
+    _check_business(events)
+    return meta, events
+
+
+def replay_tm(source, cost_func=None):
+    """
+    按事件日志重建交易账户
+
+    参数:
+        source: 事件日志路径、SYS_actions.txt 路径或 (meta, events)
+        cost_func: 交易成本函数，None 时按头部记录创建（仅支持无参数的 TC_ 函数）
+
+    返回:
+        交易账户
+    """
+    meta, events = _load(source)
+    if cost_func is None:
+        m = _COST_PATTERN.match(meta['cost_func'])
+        if not m:
+            raise ValueError(f"无法根据 {meta['cost_func']} 创建交易成本函数，请指定 cost_func")
+        cost_func = globals()[m.group(1)]()
+
+    my_tm = crtTM(Datetime(meta['init_datetime']), meta['init_cash'], cost_func, meta['name'])
+    weight_events = []
+    for i, e in enumerate(events):
+        business = int(e['business'])
+        date = Datetime(int(e['datetime']))
+        stk = sm[str(e['code'])] if e['code'] else Stock()
+        price, number = float(e['real_price']), float(e['number'])
+        if business in (BUSINESS_BUY, BUSINESS_SELL):
+            goal = float(e['goal_price'])
+            args = (date, stk, price, number, float(e['stoploss']),
+                    goal if not math.isnan(goal) else constant.null_price, float(e['plan_price']), int(e['part']))
+            record = my_tm.buy(*args) if business == BUSINESS_BUY else my_tm.sell(*args)
+        elif business == BUSINESS_CHECKIN:
+            record = my_tm.checkin(date, price)
+        elif business == BUSINESS_CHECKOUT:
+            record = my_tm.checkout(date, price)
+        elif business == BUSINESS_CHECKIN_STOCK:
+            record = my_tm.checkin_stock(date, stk, price, number)
+        elif business == BUSINESS_CHECKOUT_STOCK:
+            record = my_tm.checkout_stock(date, stk, price, number)
+        else:
+            # 分红、送股由交易账户根据权息数据自动产生，回放结束后核对
+            weight_events.append((int(e['datetime']), str(e['code']).upper(), business))
+            continue
+        if record.business == BUSINESS.INVALID:
+            raise ValueError(f"第 {i} 条记录回放失败: {date} {e['code']} 业务 {business} 价格 {price} 数量 {number}")
+
+    if weight_events:
+        rebuilt = set((t.datetime.number, t.stock.market_code.upper(), int(t.business))
+                      for t in my_tm.get_trade_list() if not t.stock.is_null())
+        missing = [e for e in weight_events if e not in rebuilt]
+        if missing:
+            raise ValueError(f"重建的账户缺少 {len(missing)} 条分红、送股记录（需以 load_weight=True 加载权息数据），"
+                             f"首条: {missing[0]}")
+    return my_tm
+
+
+def replay_state(source):
+    """
+    不创建交易账户，直接以数组运算回放现金与持仓
+
+    参数:
+        source: 事件日志路径、SYS_actions.txt 路径或 (meta, events)
+
+    返回:
+        (cash, positions)
+            cash: 每条记录之后的现金，与 events 等长
+            positions: 当前持仓 DataFrame: code, number, buy_money, take_datetime
+    """
+    meta, events = _load(source)
+    business = events['business']
+    is_trade = np.isin(business, (BUSINESS_BUY, BUSINESS_SELL))
+    cash_sign = np.array([_CASH_SIGN[b] for b in business.tolist()], dtype=np.float64)
+    position_sign = np.array([_POSITION_SIGN[b] for b in business.tolist()], dtype=np.float64)
+    cost = np.nan_to_num(events['cost'])
+    # 买卖按 成交价 × 数量 计算金额，分红、存取现金的金额即成交价
+    amount = np.where(is_trade, events['real_price'] * events['number'], events['real_price'])
+    cash = meta['init_cash'] + np.cumsum(cash_sign * amount - cost)
+
+    moves = position_sign != 0
+    df = pd.DataFrame({'code': events['code'][moves], 'datetime': events['datetime'][moves],
+                       'number': (position_sign * events['number'])[moves],
+                       'buy_money': np.where(np.isin(business, (BUSINESS_BUY, BUSINESS_CHECKIN_STOCK)),
+                                             events['real_price'] * events['number'], 0.0)[moves]})
+    if len(df) == 0:
+        return cash, pd.DataFrame(columns=['code', 'number', 'buy_money', 'take_datetime'])
+    grouped = df.groupby('code', sort=False)
+    df['position'] = grouped['number'].cumsum()
+    # 持仓清零后重新开始计数，当前持仓只统计最后一轮建仓以来的记录
+    df['round'] = (df['position'] == 0).astype(int)
+    df['round'] = df.groupby('code', sort=False)['round'].transform(lambda s: s.shift(fill_value=0).cumsum())
+    last_round = df.groupby('code', sort=False)['round'].transform('max')
+    current = df[df['round'] == last_round].groupby('code', sort=False).agg(
+        number=('number', 'sum'), buy_money=('buy_money', 'sum'), take_datetime=('datetime', 'first'))
+    positions = current[current['number'] > 0].reset_index()
+    return cash, positions
+
+
+def diff_runs(a, b, price_tolerance=1e-6):
+    """
+    比较两次运行的事件日志，无需重新运行策略
+
+    参数:
+        a, b: 事件日志路径、SYS_actions.txt 路径或 (meta, events)
+        price_tolerance: 成交价差异容忍度
+
+    返回:
+        不一致记录的 DataFrame，status 为 '仅A'、'仅B' 或 '不同'
+    """
+    frames = []
+    for source in (a, b):
+        _, events = _load(source)
+        df = pd.DataFrame(events)[['datetime', 'code', 'business', 'real_price', 'number']]
+        # 同一天同一证券同方向的多笔记录按出现顺序配对
+        df['seq'] = df.groupby(['datetime', 'code', 'business']).cumcount()
+        frames.append(df)
+    keys = ['datetime', 'code', 'business', 'seq']
+    merged = frames[0].merge(frames[1], on=keys, how='outer', suffixes=('_a', '_b'), indicator=True)
+    different = (merged['_merge'] == 'both') & (
+        ((merged['real_price_a'] - merged['real_price_b']).abs() > price_tolerance)
+        | (merged['number_a'] != merged['number_b']))
+    merged['status'] = merged['_merge'].map({'left_only': '仅A', 'right_only': '仅B', 'both': '不同'}).astype(str)
+    result = merged[(merged['_merge'] != 'both') | different].drop(columns=['_merge', 'seq'])
+    result = result.sort_values(['datetime', 'code']).reset_index(drop=True)
+    result['datetime'] = to_datetime(result['datetime'])
+    return result
+
+
+if __name__ == "__main__":
+    meta, events = parse_actions('SYS_actions.txt')
+    write_log('SYS_events.bin', meta, events)
+    cash, positions = replay_state('SYS_events.bin')
+    print(f"记录数: {len(events)}, 当前现金: {cash[-1] if len(cash) else meta['init_cash']:.2f}")
+    print(positions)
@@ -0,0 +1,312 @@
+import itertools
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from hikyuu import *
+from panel import datetime_numbers
+
+# 快速回测支持的部件组合，其余部件（CN/EV/PG/SP/TP 等）需要走完整的 my_sys.run
+SUPPORTED_MM = ('MM_FixedCount', 'MM_Nothing')
+SUPPORTED_ST = ('ST_FixedPercent',)
+SUPPORTED_TC = ('TC_Zero',)
+
+TRADE_DTYPE = np.dtype([
+    ('entry_date', 'i8'),   # 买入日期, Datetime.number
+    ('entry_price', 'f8'),
+    ('exit_date', 'i8'),    # 卖出日期, 未平仓时为 0
+    ('exit_price', 'f8'),   # 未平仓时为最后一个收盘价
+    ('number', 'f8'),
+    ('profit', 'f8'),
+    ('reason', 'U3'),       # SG: 信号卖出, ST: 止损卖出, END: 期末未平仓
+])
+
+
+class FastResult:
+    """快速回测结果，各数组与 K 线逐 bar 对齐"""
+
+    def __init__(self, code, dates, close, position, cash, trades, init_cash):
+        self.code = code
+        self.dates = dates
+        self.close = close
+        self.position = position
+        self.cash = cash
+        self.equity = cash + position * close
+        self.trades = trades
+        self.init_cash = init_cash
+
+    def stats(self):
+        """汇总统计，用于候选排序"""
+        equity = self.equity
+        if len(equity) == 0:
+            return {'code': self.code, 'total_return': np.nan, 'max_drawdown': np.nan,
+                    'trade_count': 0, 'win_rate': np.nan, 'final_equity': self.init_cash}
+        peak = np.maximum.accumulate(equity)
+        drawdown = np.where(peak > 0, equity / peak - 1, 0.0)
+        closed = self.trades[self.trades['reason'] != 'END']
+        return {
+            'code': self.code,
+            'total_return': (equity[-1] / self.init_cash - 1) * 100,
+            'max_drawdown': drawdown.min() * 100,
+            'trade_count': len(self.trades),
+            'win_rate': (closed['profit'] > 0).mean() * 100 if len(closed) else np.nan,
+            'final_equity': equity[-1],
+        }
+
+    def trades_dataframe(self):
+        df = pd.DataFrame(self.trades)
+        for col in ('entry_date', 'exit_date'):
+            df[col] = pd.to_datetime(df[col].astype(str), format='%Y%m%d%H%M', errors='coerce')
+        return df
+
+
+def _check_supported(my_sys):
+    """检查交易系统是否只包含快速回测能模拟的部件，不支持时抛出 ValueError"""
+    for attr in ('ev', 'cn', 'pg', 'sp', 'tp'):
+        if getattr(my_sys, attr, None) is not None:
+            raise ValueError(f"快速回测不支持 {attr.upper()} 部件: {my_sys.name}")
+    if my_sys.sg is None:
+        raise ValueError(f"交易系统缺少信号指示器: {my_sys.name}")
+    if my_sys.mm is None or my_sys.mm.name not in SUPPORTED_MM:
+        raise ValueError(f"快速回测仅支持 {SUPPORTED_MM}, 当前为: {my_sys.mm}")
+    if my_sys.st is not None and my_sys.st.name not in SUPPORTED_ST:
+        raise ValueError(f"快速回测仅支持 {SUPPORTED_ST}, 当前为: {my_sys.st.name}")
+    tm = my_sys.tm
+    if tm is not None and tm.cost_func is not None and tm.cost_func.name not in SUPPORTED_TC:
+        raise ValueError(f"快速回测仅支持 {SUPPORTED_TC}, 当前为: {tm.cost_func.name}")
+
+
+def extract_signals(sg, kdata):
+    """
+    计算信号指示器在 kdata 上的买卖信号，并转换为与 K 线对齐的布尔数组
+
+    参数:
+        sg: 信号指示器，内部会先 clone，不影响原有实例
+        kdata: K线数据
+
+    返回:
+        (dates, buy, sell)，dates 为 Datetime.number 数组
+    """
+    sg = sg.clone()
+    sg.to = kdata
+    dates = datetime_numbers(kdata.get_datetime_list())
+    buy = np.isin(dates, datetime_numbers(sg.get_buy_signal()))
+    sell = np.isin(dates, datetime_numbers(sg.get_sell_signal()))
+    return dates, buy, sell
+
+
+def simulate(dates, open_, close, buy, sell, init_cash, mm='MM_Nothing', mm_n=100,
+             stoploss_p=None, buy_delay=True, sell_delay=True, min_trade_number=100, code=''):
+    """
+    根据信号数组模拟单只股票的持仓与资金，近似 SYS_Simple + TC_Zero 的行为
+
+    同一 bar 同时出现买卖信号时视为无信号；止损按收盘价跌破 买入价 * (1 - p) 触发；
+    延迟模式下在下一 bar 开盘价成交，否则在信号 bar 收盘价成交。
+    循环只按交易次数进行，逐 bar 的持仓与资金通过累加计算。
+
+    参数:
+        dates, open_, close: 与 K 线对齐的日期、开盘价、收盘价数组
+        buy, sell: 买入、卖出信号布尔数组
+        init_cash: 初始资金
+        mm: 资金管理方式, 'MM_FixedCount' 或 'MM_Nothing'
+        mm_n: MM_FixedCount 每次买入数量
+        stoploss_p: ST_FixedPercent 止损百分比, None 表示不止损
+        buy_delay, sell_delay: 对应 SYS_Simple 的 buy_delay / sell_delay 参数
+        min_trade_number: 最小交易数量
+
+    返回:
+        FastResult
+    """
+    n = len(close)
+    buy_idx = np.flatnonzero(buy & ~sell)
+    sell_idx = np.flatnonzero(sell & ~buy)
+    shares_delta = np.zeros(n)
+    cash_delta = np.zeros(n)
+    trades = []
+    cash = float(init_cash)
+    pos = 0
+    while True:
+        i = np.searchsorted(buy_idx, pos)
+        if i >= len(buy_idx):
+            break
+        signal_bar = buy_idx[i]
+        entry = signal_bar + 1 if buy_delay else signal_bar
+        if entry >= n:
+            break
+        price = open_[entry] if buy_delay else close[entry]
+        if not price > 0:
+            pos = signal_bar + 1
+            continue
+        lot_cash = price * min_trade_number
+        max_number = np.floor(cash / lot_cash) * min_trade_number
+        number = min(mm_n, max_number) if mm == 'MM_FixedCount' else max_number
+        if number <= 0:
+            pos = signal_bar + 1
+            continue
+
+        # 卖出信号
+        j = np.searchsorted(sell_idx, signal_bar, side='right')
+        exit_signal = sell_idx[j] if j < len(sell_idx) else n
+        reason = 'SG'
+        # 止损：在持仓区间内找第一个收盘价跌破止损价的 bar
+        if stoploss_p is not None:
+            stop_price = price * (1 - stoploss_p)
+            hit = np.flatnonzero(close[entry:exit_signal] < stop_price)
+            if len(hit) > 0:
+                exit_signal = entry + hit[0]
+                reason = 'ST'
+        exit_bar = exit_signal + 1 if sell_delay else exit_signal
+        if exit_bar >= n:
+            # 期末未平仓
+            shares_delta[entry] += number
+            cash_delta[entry] -= number * price
+            cash -= number * price
+            trades.append((dates[entry], price, 0, close[-1], number,
+                           number * (close[-1] - price), 'END'))
+            break
+
+        exit_price = open_[exit_bar] if sell_delay else close[exit_bar]
+        shares_delta[entry] += number
+        shares_delta[exit_bar] -= number
+        cash_delta[entry] -= number * price
+        cash_delta[exit_bar] += number * exit_price
+        cash += number * (exit_price - price)
+        trades.append((dates[entry], price, dates[exit_bar], exit_price, number,
+                       number * (exit_price - price), reason))
+        pos = exit_signal + 1
+
+    position = np.cumsum(shares_delta)
+    cash_curve = init_cash + np.cumsum(cash_delta)
+    return FastResult(code, dates, close, position, cash_curve,
+                      np.array(trades, dtype=TRADE_DTYPE), init_cash)
+
+
+def fast_run(my_sys, stk, query, init_cash=None):
+    """
+    使用信号数组对 SYS_Simple 做近似的快速回测，代替 my_sys.run(stk, query)
+
+    仅支持 SG + MM_FixedCount/MM_Nothing，可选 ST_FixedPercent，成本为 TC_Zero
+
+    参数:
+        my_sys: 交易系统实例
+        stk: 证券
+        query: 查询条件
+        init_cash: 初始资金，默认取 my_sys.tm 的初始资金，无 tm 时为 100000
+
+    返回:
+        FastResult
+    """
+    _check_supported(my_sys)
+    if init_cash is None:
+        init_cash = my_sys.tm.init_cash if my_sys.tm is not None else 100000.0
+
+    kdata = stk.get_kdata(query)
+    dates, buy, sell = extract_signals(my_sys.sg, kdata)
+    arr = kdata.to_np()
+
+    mm = my_sys.mm
+    stoploss_p = my_sys.st.get_param("p") if my_sys.st is not None else None
+    return simulate(
+        dates, arr['open'], arr['close'], buy, sell, init_cash,
+        mm=mm.name,
+        mm_n=mm.get_param("n") if mm.name == 'MM_FixedCount' else 0,
+        stoploss_p=stoploss_p,
+        buy_delay=my_sys.get_param("buy_delay"),
+        sell_delay=my_sys.get_param("sell_delay"),
+        min_trade_number=stk.min_trade_number,
+        code=stk.market_code,
+    )
+
+
+def cross_check(my_sys, stk, query, result, tolerance=0.01):
+    """
+    使用真实 TM 回测同一组合，与快速回测结果进行核对
+
+    参数:
+        my_sys: 交易系统实例（会被 clone，不影响原实例）
+        stk: 证券
+        query: 查询条件
+        result: fast_run 的返回结果
+        tolerance: 期末权益允许的相对误差
+
+    返回:
+        核对结果字典
+    """
+    kdata = stk.get_kdata(query)
+    if len(kdata) == 0:
+        raise ValueError(f"{stk.market_code} 在查询范围内没有 K 线数据，无法核对")
+    real_sys = my_sys.clone()
+    real_sys.tm = crtTM(kdata[0].datetime, init_cash=result.init_cash, cost_func=TC_Zero())
+    real_sys.run(kdata)
+    funds = real_sys.tm.get_funds_curve(kdata.get_datetime_list())
+    real_equity = funds[-1] if len(funds) > 0 else result.init_cash
+    fast_equity = result.equity[-1] if len(result.equity) > 0 else result.init_cash
+    real_trades = len([t for t in real_sys.tm.get_trade_list() if t.business == BUSINESS.BUY])
+    diff = abs(fast_equity - real_equity) / real_equity if real_equity else np.nan
+    return {
+        'code': stk.market_code,
+        'fast_equity': fast_equity,
+        'real_equity': real_equity,
+        'fast_trades': len(result.trades),
+        'real_trades': real_trades,
+        'equity_diff': diff,
+        'ok': diff <= tolerance and len(result.trades) == real_trades,
+    }
+
+
+def screen(part_name, stks, param_grid, query, mm=None, init_cash=100000.0,
+           sort_by='total_return', verify=5):
+    """
+    对 (股票, 参数) 组合做快速回测筛选，只对排名靠前的候选使用真实 TM 核对
+
+    参数:
+        part_name: 交易系统部件名称，如 'default.sys.双均线金叉'
+        stks: 证券列表
+        param_grid: 参数网格，如 {'fastn': [5, 10], 'slown': [20, 60]}
+        query: 查询条件
+        mm: 部件未指定资金管理时使用的资金管理器，默认 MM_Nothing()
+        init_cash: 初始资金
+        sort_by: 排序字段
+        verify: 对前 verify 名进行真实回测核对, 0 表示不核对
+
+    返回:
+        按 sort_by 降序排列的 DataFrame
+    """
+    names = list(param_grid.keys())
+    combos = list(itertools.product(*[param_grid[name] for name in names]))
+    rows = []
+    systems = {}
+    for values in tqdm(combos, desc="快速回测"):
+        params = dict(zip(names, values))
+        my_sys = get_part(part_name, **params)
+        if my_sys.mm is None:
+            my_sys.mm = mm if mm is not None else MM_Nothing()
+        _check_supported(my_sys)
+        for stk in stks:
+            try:
+                result = fast_run(my_sys, stk, query, init_cash=init_cash)
+            except Exception as e:
+                print(f"快速回测 {stk.market_code} {params} 时出错: {e}")
+                continue
+            if len(result.equity) == 0:
+                # 查询范围内没有 K 线
+                continue
+            row = result.stats()
+            row.update(params)
+            rows.append(row)
+            systems[(stk.market_code, values)] = (my_sys, stk, result)
+
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df = df.sort_values(by=sort_by, ascending=False).reset_index(drop=True)
+
+    if verify > 0:
+        df['verified'] = np.nan
+        for i in range(min(verify, len(df))):
+            values = tuple(df.loc[i, name] for name in names)
+            my_sys, stk, result = systems[(df.loc[i, 'code'], values)]
+            check = cross_check(my_sys, stk, query, result)
+            df.loc[i, 'verified'] = check['ok']
+            if not check['ok']:
+                print(f"核对不一致: {check}")
+    return df
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+#
+# 部件清单：记录全部部件的类型、名称、模块路径、参数签名、帮助说明、修改时间与内容哈希
+#
+# 清单通过解析 part.py 的语法树生成，不导入任何部件。列出部件与查看帮助只读取清单，
+# get_part 只导入所请求的部件。
+
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+
+HUB_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE = os.path.join(HUB_DIR, "manifest.json")
+
+PART_DIRS = ['sys', 'pf', 'ind', 'other', 'part/af',
+             'part/cn', 'part/ev', 'part/mm', 'part/pg', 'part/se', 'part/sg', 'part/sp', 'part/st',]
+
+
+def _parse_part(path):
+    """解析 part.py，返回签名、帮助说明、作者与版本"""
+    with open(path, 'rb') as f:
+        source = f.read()
+    info = {'signature': None, 'doc': '', 'doc_ref': None, 'author': None, 'version': None,
+            'hash': hashlib.md5(source).hexdigest()}
+    tree = ast.parse(source, filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'part':
+            info['signature'] = f"({ast.unparse(node.args)})"
+            if node.returns is not None:
+                info['signature'] += f" -> {ast.unparse(node.returns)}"
+            info['doc'] = ast.get_docstring(node) or ''
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target = node.targets[0]
+            if isinstance(target, ast.Name) and target.id in ('author', 'version') \
+                    and isinstance(node.value, ast.Constant):
+                info[target.id] = str(node.value.value)
+            # 形如 part.__doc__ = SE_Signal.__doc__ 的帮助说明在运行时才能确定，记录其来源
+            elif isinstance(target, ast.Attribute) and target.attr == '__doc__' \
+                    and isinstance(target.value, ast.Name) and target.value.id == 'part':
+                info['doc_ref'] = ast.unparse(node.value)
+    return info
+
+
+def build_manifest(hub_dir=HUB_DIR, previous=None):
+    """
+    扫描部件目录生成清单，修改时间未变化的部件直接沿用 previous 中的记录
+
+    返回:
+        {'ind.射击之星': {...}, ...}
+    """
+    previous = previous or {}
+    manifest = {}
+    for item in PART_DIRS:
+        part_dir = f"{hub_dir}/{item}"
+        if not os.path.lexists(part_dir):
+            continue
+        part_type = item.split('/')[-1]
+        with os.scandir(part_dir) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                if entry.name.startswith('.') or not entry.is_dir() or entry.name == "__pycache__":
+                    continue
+                path = f"{part_dir}/{entry.name}/part.py"
+                if not os.path.exists(path):
+                    continue
+                key = f"{part_type}.{entry.name}"
+                mtime = os.path.getmtime(path)
+                old = previous.get(key)
+                if old is not None and old.get('mtime') == mtime:
+                    manifest[key] = old
+                    continue
+                try:
+                    info = _parse_part(path)
+                except SyntaxError as e:
+                    print(f"解析 {path} 出错: {e}")
+                    continue
+                manifest[key] = {
+                    'type': part_type,
+                    'name': entry.name,
+                    'module': f"{item}/{entry.name}/part.py",
+                    'cpp': os.path.exists(f"{part_dir}/{entry.name}/main.cpp"),
+                    'mtime': mtime,
+                    **info,
+                }
+    return manifest
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """读取清单，默认清单文件不存在时先生成"""
+    if not os.path.exists(path):
+        if path != MANIFEST_FILE:
+            return {}
+        return update_manifest(path)[0]
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def update_manifest(path=MANIFEST_FILE, hub_dir=HUB_DIR):
+    """增量更新清单文件，返回 (清单, 新增或修改的部件, 删除的部件)"""
+    previous = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    manifest = build_manifest(hub_dir, previous)
+    changed = [k for k, v in manifest.items() if previous.get(k) != v]
+    removed = [k for k in previous if k not in manifest]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest, changed, removed
+
+
+def _key(name):
+    """支持 'ind.射击之星' 与带仓库名的 'local_SXHCG.ind.射击之星'"""
+    parts = name.split('.')
+    return '.'.join(parts[-2:])
+
+
+def list_parts(part_type=None, path=MANIFEST_FILE):
+    """按清单列出部件名称，不导入任何部件"""
+    return [k for k, v in load_manifest(path).items() if part_type is None or v['type'] == part_type]
+
+
+def part_info(name, path=MANIFEST_FILE):
+    """部件的清单记录"""
+    manifest = load_manifest(path)
+    key = _key(name)
+    if key not in manifest:
+        raise ValueError(f"清单中没有部件: {name}，请执行 python setup.py manifest 更新清单")
+    return manifest[key]
+
+
+def part_doc(name, path=MANIFEST_FILE):
+    """部件的签名与帮助说明，帮助说明在运行时才能确定的部件只导入该部件"""
+    info = part_info(name, path)
+    doc = info['doc']
+    if not doc and info.get('doc_ref'):
+        doc = _import_part(info).part.__doc__ or ''
+    return f"{_key(name)}{info['signature']}\n\n{doc}"
+
+
+def _import_part(info):
+    path = os.path.join(HUB_DIR, info['module'])
+    spec = importlib.util.spec_from_file_location(f"hub_part_{info['type']}_{info['name']}", path)
+    module = importlib.util.module_from_spec(spec)
+    # c++ 部件的 part.py 以绝对导入方式加载同目录下的 mypart 与 export 模块
+    part_dir = os.path.dirname(path)
+    sys.path.insert(0, part_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(part_dir)
+    return module
+
+
+def get_part(name, path=MANIFEST_FILE, **kwargs):
+    """
+    只导入所请求的部件并创建实例，用法同 hikyuu.get_part
+
+    示例:
+        from hub_manifest import get_part
+        ind = get_part('ind.射击之星')
+    """
+    return _import_part(part_info(name, path)).part(**kwargs)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import sys
+import numpy as np
+from hikyuu import *
+
+author = "admin"
+version = "20241019"
+
+
+class SE_FactorPanel(SelectorBase):
+    """
+    与 se.最低单因子 功能相同的选股器，但在计算时一次性生成整个证券池的因子面板
+    (交易日 × 证券)，并预先用 argpartition 选出每日因子值最低的 bottomn 支证券，
+    get_selected 只做数组查找
+
+    与 se.最低单因子（SE_MultiFactor + MF_EqualWeight）的差异：
+        - 直接按 REF(ind, 1) 的原始值排序，不做 MultiFactor 的标准化、极值处理等截面预处理，
+          为 MultiFactor 设置了这些处理时两者的选股结果可能不同
+        - 因子值缺失（停牌、上市前）的证券不参与选股，不足 bottomn 支时少选
+        - 面板只在 query 范围内计算，回测区间超出该范围的日期没有选股结果
+    """
+
+    def __init__(self, ind, bottomn=2, query=None):
+        super(SE_FactorPanel, self).__init__("SE_FactorPanel")
+        self.set_param("bottomn", int(bottomn))
+        self._ind = ind
+        self._query = query
+        self._reset()
+
+    def _reset(self):
+        self._dates = np.array([], dtype=np.int64)
+        self._panel = None
+        self._selected = None
+
+    def _clone(self):
+        return SE_FactorPanel(self._ind, self.get_param("bottomn"), self._query)
+
+    def is_match_af(self, af):
+        return True
+
+    def _calculate(self):
+        query = self._query if self._query is not None else Query(0)
+        self._dates, self._panel = self._build_panel(self.real_sys_list, query)
+        self._selected = self._select_bottom(self._panel, self.get_param("bottomn"))
+
+    def _build_panel(self, sys_list, query, market='SH'):
+        """生成 交易日 × 证券 的因子面板，停牌或无数据处为 NaN"""
+        dates = np.array([d.number for d in sm.get_trading_calendar(query, market)], dtype=np.int64)
+        panel = np.full((len(dates), len(sys_list)), np.nan)
+
+        # 与 se.最低单因子 一致，使用前一交易日的因子值，避免使用当日收盘后才能得到的数据
+        ref_ind = REF(self._ind, 1)
+        for j, my_sys in enumerate(sys_list):
+            k = my_sys.stock.get_kdata(query)
+            if len(k) == 0 or len(dates) == 0:
+                continue
+            values = ref_ind(k).to_np()
+            k_dates = np.array([d.number for d in k.get_datetime_list()], dtype=np.int64)
+            pos = np.searchsorted(dates, k_dates)
+            keep = (pos < len(dates)) & (dates[np.minimum(pos, len(dates) - 1)] == k_dates)
+            panel[pos[keep], j] = values[keep]
+        return dates, panel
+
+    def selection_matrix(self, query=None, market='SH'):
+        """
+        返回整个查询范围的选股矩阵，供批量比对使用
+
+        :param Query query: 查询范围，默认使用创建时指定的范围
+        :param str market: 交易日历所属市场
+        :return: (dates, codes, selected, scores)，dates 为 Datetime.number 数组，
+                 selected 为 交易日 × 证券 的布尔矩阵，scores 为因子值
+        """
+        sys_list = self.real_sys_list
+        if len(sys_list) == 0:
+            sys_list = self.proto_sys_list
+        if query is None:
+            query = self._query if self._query is not None else Query(0)
+        dates, panel = self._build_panel(sys_list, query, market)
+        idx = self._select_bottom(panel, self.get_param("bottomn"))
+        selected = np.zeros(panel.shape, dtype=bool)
+        rows = np.repeat(np.arange(len(dates)), idx.shape[1])
+        cols = idx.ravel()
+        selected[rows[cols >= 0], cols[cols >= 0]] = True
+        codes = [my_sys.stock.market_code for my_sys in sys_list]
+        return dates, codes, selected, np.where(selected, panel, np.nan)
+
+    @staticmethod
+    def _select_bottom(panel, bottomn):
+        """每日选出因子值最低的 bottomn 支证券的列号，按因子值升序，不足时以 -1 填充"""
+        rows, cols = panel.shape
+        n = min(bottomn, cols)
+        if rows == 0 or n == 0:
+            return np.full((rows, n), -1, dtype=np.int64)
+        filled = np.where(np.isfinite(panel), panel, np.inf)
+        if n < cols:
+            idx = np.argpartition(filled, n - 1, axis=1)[:, :n]
+        else:
+            idx = np.tile(np.arange(cols), (rows, 1))
+        values = np.take_along_axis(filled, idx, axis=1)
+        order = np.argsort(values, axis=1, kind='stable')
+        idx = np.take_along_axis(idx, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+        idx[np.isinf(values)] = -1
+        return idx
+
+    def _row(self, date):
+        """date 对应的面板行号，非交易日取之前最近的交易日，无数据返回 -1"""
+        if self._selected is None or len(self._dates) == 0:
+            return -1
+        return int(np.searchsorted(self._dates, date.number, side='right')) - 1
+
+    def get_selected(self, date):
+        i = self._row(date)
+        if i < 0:
+            return []
+        sys_list = self.real_sys_list
+        return [SystemWeight(sys_list[j], 1.0) for j in self._selected[i] if j >= 0]
+
+
+def part(ind: Indicator, bottomn: int = 2, query: Query = None):
+    """
+    选取因子值最低的 bottomn 支证券，功能同 se.最低单因子，适合大证券池轮动回测。
+
+    在计算时一次性生成整个证券池的因子面板，每日按 argpartition 选出最低的 bottomn 支，
+    调仓日直接按日期查表，不再逐只证券计算因子值。
+
+    :param Indicator ind: 单因子
+    :param int bottomn: 选取因子值最低的 bottomn 支证券
+    :param Query query: 因子面板的计算范围，默认全部历史数据，应覆盖回测区间
+    """
+    return SE_FactorPanel(ind, bottomn, query)
+
+
+if __name__ == "__main__":
+    # 执行 testall 命令时，会多传入一个参数，防止测试时间过长
+    # 比如如果在测试代码中执行了绘图操作，可以打开下面的注释代码
+    # 此时执行 testall 命令时，将直接返回
+    if len(sys.argv) > 1:
+        print("ignore test")
+        exit(0)
+
+    if sys.platform == 'win32':
+        import os
+        os.system('chcp 65001')
+
+    from hikyuu.interactive import *
+
+    # 请在下方编写测试代码
+    local_hub = get_current_hub(__file__)
+    update_hub(local_hub)
+
+    my_se = get_part(f"{local_hub}.se.最低单因子面板", ind=ROC(CLOSE))
+    print(my_se)
@@ -11,7 +11,7 @@ version = "20240514"
 
 def part(tm: TradeManager, ind: Indicator, bottomn: int = 2, stks: Sequence = None,
          ref_stk: Stock = None, adjust_cycle: int = 10, adjust_mode: str = "query",
-         delay_to_trading_day: bool = True):
+         delay_to_trading_day: bool = True, use_panel: bool = False, query: Query = None):
     """
     始终持有沪深300银行指数成分股中市净率最低的股份制银行，每5个交易日检查一次，
     如果发现有新的股份制银行市净率低于原有的股票，则予以换仓。
@@ -24,8 +24,13 @@ def part(tm: TradeManager, ind: Indicator, bottomn: int = 2, stks: Sequence = No
     :param int adjust_cycle: 调仓周期，默认10个交易日
     :param str adjust_mode: 调仓方式
     :param bool delay_to_trading_day: 非交易日调仓时是否延迟到交易日
+    :param bool use_panel: 使用预计算因子面板的选股器，适合大证券池
+    :param Query query: use_panel 时因子面板的计算范围，默认全部历史数据，传入回测的查询条件可避免计算全历史
     """
-    my_se = get_part("default.se.最低单因子", ind=ind, bottomn=bottomn)
+    if use_panel:
+        my_se = get_part("default.se.最低单因子面板", ind=ind, bottomn=bottomn, query=query)
+    else:
+        my_se = get_part("default.se.最低单因子", ind=ind, bottomn=bottomn)
     if ref_stk is None:
         my_se.set_param("ref_stk", get_stock("sh000300"))
     my_sys = get_part("default.sys.调仓日买入")
@@ -9,6 +9,11 @@ import sys
 import shutil
 import subprocess
 import datetime
+import json
+import time
+import hashlib
+import tempfile
+import concurrent.futures
 import click
 import hikyuu
 
@@ -345,6 +350,12 @@ def cli():
     pass
 
 
+def _update_manifest():
+    """创建部件后同步更新部件清单"""
+    from hub_manifest import update_manifest
+    update_manifest()
+
+
 @click.command()
 @click.option(
     '-t',
@@ -377,6 +388,7 @@ def create(t, n, cpp):
             today=today.strftime("%Y%m%d"), user=username, name=n)
         with open(f"{part_dir}/part.py", 'w', encoding='utf=8') as f:
             f.write(python)
+        _update_manifest()
         return
 
     xmake_lua = xmake_template.format(
@@ -403,6 +415,7 @@ def create(t, n, cpp):
         f.write(python)
 
     print(f'Success create "{part_dir}!"')
+    _update_manifest()
 
 
 @click.command()
@@ -457,29 +470,96 @@ def build(t, n, v):
             f"cd {part_dir} ; xmake f -c -y ; xmake{verbose}")
 
 
+BUILD_HASH_FILE = ".build_hash"
+SOURCE_SUFFIXES = ('.cpp', '.cc', '.cxx', '.c', '.h', '.hpp', '.hxx', '.lua')
+
+
+def _hikyuu_version_key():
+    """hikyuu 版本、头文件版本信息及 Python 版本，hikyuu 或 Python 升级后所有 c++ 部件都需要重新编译"""
+    key = getattr(hikyuu, '__version__', '') + "-py{}{}".format(*sys.version_info[:2])
+    version_h = f"{include_dir}/hikyuu/version.h".replace('\\\\', '\\')
+    if os.path.exists(version_h):
+        with open(version_h, 'rb') as f:
+            key += hashlib.md5(f.read()).hexdigest()
+    return key
+
+
+def _part_build_hash(part_dir, version_key):
+    """部件源文件（含生成的 xmake.lua）内容与 hikyuu 版本的哈希"""
+    md5 = hashlib.md5(version_key.encode('utf-8'))
+    for root, dirs, files in os.walk(part_dir):
+        dirs[:] = sorted(d for d in dirs if d not in ('build', '.xmake', '__pycache__') and not d.startswith('.'))
+        for name in sorted(files):
+            if name.endswith(SOURCE_SUFFIXES):
+                path = os.path.join(root, name)
+                md5.update(os.path.relpath(path, part_dir).replace('\\', '/').encode('utf-8'))
+                with open(path, 'rb') as f:
+                    md5.update(f.read())
+    return md5.hexdigest()
+
+
+def _has_build_output(part_dir):
+    """是否存在当前 Python 版本的编译结果，如 export312.so / export312.pyd"""
+    name = "export{}{}".format(*sys.version_info[:2])
+    return any(os.path.exists(os.path.join(part_dir, name + suffix)) for suffix in ('.so', '.pyd'))
+
+
+def _build_part(part_dir, verbose):
+    """依次执行 xmake f -c -y、xmake、python part.py，返回 (是否成功, 耗时, 输出)"""
+    start = time.time()
+    commands = [["xmake", "f", "-c", "-y"], ["xmake", "-vD"] if verbose else ["xmake"], [sys.executable, "part.py"]]
+    output = []
+    ok = True
+    for cmd in commands:
+        proc = subprocess.run(cmd, cwd=part_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output.append(proc.stdout.decode('utf-8', errors='replace'))
+        if proc.returncode != 0:
+            ok = False
+            break
+    return ok, time.time() - start, ''.join(output)
+
+
 @click.command()
 @click.option('-v', '--v', is_flag=True, help='显示详细的编译信息')
-def buildall(v):
-    part_dirs = ['sys', 'pf', 'ind', 'other', 'part/af',
-                 'part/cn', 'part/ev', 'part/mm', 'part/pg', 'part/se', 'part/sg', 'part/sp', 'part/st',]
-    for item in part_dirs:
-        part_dir = f"{CURRENT_DIR}/{item}"
-        if not os.path.lexists(part_dir):
+@click.option('-j', '--jobs', type=int, default=os.cpu_count(), help='并行编译的部件数量')
+@click.option('-f', '--force', is_flag=True, help='忽略编译缓存，重新编译全部部件')
+def buildall(v, jobs, force):
+    version_key = _hikyuu_version_key()
+    todo = []
+    for part_dir in _list_part_dirs():
+        if not os.path.exists(f"{part_dir}/xmake.lua"):
             continue
-        with os.scandir(part_dir) as it:
-            for entry in it:
-                if (not entry.name.startswith('.')) and entry.is_dir() and (entry.name != "__pycache__"):
-                    if os.path.exists(f"{part_dir}/{entry.name}/xmake.lua"):
-                        part_xmake = f"{part_dir}/{entry.name}"
-                        print(
-                            f"========================\nbuilding {part_xmake} ...\n========================")
-                        verbose = " -vD" if v else ""
-                        if sys.platform == 'win32':
-                            os.system(
-                                f"cd {part_xmake} & xmake f -c -y & xmake{verbose} & python part.py")
-                        else:
-                            os.system(
-                                f"cd {part_xmake} ; xmake f -c -y ; xmake{verbose} ; python part.py")
+        digest = _part_build_hash(part_dir, version_key)
+        hash_file = f"{part_dir}/{BUILD_HASH_FILE}"
+        if not force and os.path.exists(hash_file) and _has_build_output(part_dir):
+            with open(hash_file, 'r', encoding='utf-8') as f:
+                if f.read().strip() == digest:
+                    print(f"up to date: {part_dir}")
+                    continue
+        todo.append((part_dir, digest))
+
+    print(f"building {len(todo)} parts with {jobs} jobs ...")
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {executor.submit(_build_part, part_dir, v): (part_dir, digest) for part_dir, digest in todo}
+        for future in concurrent.futures.as_completed(futures):
+            part_dir, digest = futures[future]
+            ok, seconds, output = future.result()
+            print(f"========================\n{'built' if ok else 'FAILED'} {part_dir} ({seconds:.1f}s)\n========================")
+            if v or not ok:
+                print(output)
+            hash_file = f"{part_dir}/{BUILD_HASH_FILE}"
+            if ok:
+                with open(hash_file, 'w', encoding='utf-8') as f:
+                    f.write(digest)
+            else:
+                failed.append(part_dir)
+                if os.path.exists(hash_file):
+                    os.remove(hash_file)
+    if failed:
+        print(f"failed: {len(failed)}")
+        for part_dir in failed:
+            print(f"  {part_dir}")
 
 
 @click.command()
@@ -516,33 +596,326 @@ def test(t, n):
             f"cd {part_dir} ; python part.py")
 
 
-@click.command()
-def testall():
+def _list_part_dirs():
+    """所有部件目录，按类别排列"""
     part_dirs = ['sys', 'pf', 'ind', 'other', 'part/af',
                  'part/cn', 'part/ev', 'part/mm', 'part/pg', 'part/se', 'part/sg', 'part/sp', 'part/st',]
+    result = []
     for item in part_dirs:
         part_dir = f"{CURRENT_DIR}/{item}"
         if not os.path.lexists(part_dir):
             continue
         with os.scandir(part_dir) as it:
-            for entry in it:
+            for entry in sorted(it, key=lambda e: e.name):
                 if (not entry.name.startswith('.')) and entry.is_dir() and (entry.name != "__pycache__"):
-                    part_name = f"{part_dir}/{entry.name}"
-                    print(
-                        f"========================\ntesting {part_name} ...\n========================")
-                    if not os.path.exists(f"{part_name}/part.py"):
-                        print(
-                            "*****************************************************************")
-                        print(
-                            f'Failed!!!!\n"{part_dir}/part.py" is not existed!')
-                        print(
-                            "*****************************************************************")
-                    if sys.platform == 'win32':
-                        os.system(
-                            f"cd {part_name}  & python part.py 1")
-                    else:
-                        os.system(
-                            f"cd {part_name} ; python part.py 1")
+                    result.append(f"{part_dir}/{entry.name}")
+    return result
+
+
+def _run_part_test(part_dir, timeout):
+    """
+    在独立进程中执行 part.py 1，返回耗时、峰值内存与输出
+
+    通过 os.wait4 获取该子进程自身的峰值内存，不支持 wait4 的系统（如 windows）不统计内存
+    """
+    name = os.path.relpath(part_dir, CURRENT_DIR).replace('\\', '/')
+    result = {'part': name, 'status': 'ok', 'seconds': 0.0, 'peak_rss_mb': None, 'returncode': None}
+    if not os.path.exists(f"{part_dir}/part.py"):
+        result['status'] = 'missing'
+        result['output'] = f'"{part_dir}/part.py" is not existed!'
+        return result
+
+    start = time.time()
+    with tempfile.TemporaryFile() as log:
+        proc = subprocess.Popen([sys.executable, "part.py", "1"], cwd=part_dir, stdout=log, stderr=subprocess.STDOUT)
+        while True:
+            if hasattr(os, 'wait4'):
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid != 0:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    # linux 下单位为 KB，macosx 下为字节
+                    rss = usage.ru_maxrss
+                    result['peak_rss_mb'] = rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+                    break
+            elif proc.poll() is not None:
+                break
+            if time.time() - start > timeout:
+                proc.kill()
+                proc.wait()
+                result['status'] = 'timeout'
+                break
+            time.sleep(0.05)
+        result['seconds'] = time.time() - start
+        result['returncode'] = proc.returncode
+        log.seek(0)
+        result['output'] = log.read().decode('utf-8', errors='replace')[-2000:]
+    if result['status'] == 'ok' and proc.returncode != 0:
+        result['status'] = 'failed'
+    return result
+
+
+@click.command()
+@click.option('-j', '--jobs', type=int, default=os.cpu_count(), help='并行执行的部件数量')
+@click.option('--timeout', type=int, default=600, help='单个部件的超时时间（秒）')
+@click.option('-o', '--output', type=str, default='testall_result.json', help='测试结果输出文件（JSON）')
+def testall(jobs, timeout, output):
+    parts = _list_part_dirs()
+    print(f"testing {len(parts)} parts with {jobs} jobs ...")
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [executor.submit(_run_part_test, part_dir, timeout) for part_dir in parts]
+        for future in concurrent.futures.as_completed(futures):
+            r = future.result()
+            results.append(r)
+            print(f"[{len(results)}/{len(parts)}] {r['status']:<8} {r['seconds']:8.2f}s  {r['part']}")
+
+    results.sort(key=lambda r: r['seconds'], reverse=True)
+    print("========================")
+    print(f"{'seconds':>10} {'peak MB':>10}  {'status':<8} part")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else '-'
+        print(f"{r['seconds']:>10.2f} {rss:>10}  {r['status']:<8} {r['part']}")
+
+    failed = [r for r in results if r['status'] != 'ok']
+    for r in failed:
+        print("*****************************************************************")
+        print(f"{r['status']}: {r['part']}")
+        print(r['output'])
+    print("========================")
+    print(f"total: {len(results)}, failed: {len(failed)}")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'jobs': jobs, 'timeout': timeout, 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"results saved to {output}")
+
+
+# bench 使用的标准证券列表，均为上市较早、数据完整的证券
+BENCH_STOCKS = ['sh600000', 'sh600036', 'sh600519', 'sh601318', 'sh600030', 'sh600276', 'sh600887',
+                'sh601166', 'sh600048', 'sh601398', 'sz000001', 'sz000002', 'sz000333', 'sz000651',
+                'sz000858', 'sz002415', 'sz000725', 'sz002304', 'sz000063', 'sz000100']
+BENCH_RESULT_PREFIX = "BENCH_RESULT "
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def _bench_args(func):
+    """为没有默认值的参数提供基准测试用的值，无法提供时返回 None"""
+    import inspect
+    from hikyuu import crtTM, CLOSE, Indicator, TradeManager
+    kwargs = {}
+    for name, param in inspect.signature(func).parameters.items():
+        if param.default is not inspect.Parameter.empty:
+            continue
+        if name == 'tm' or param.annotation is TradeManager:
+            kwargs[name] = crtTM()
+        elif name == 'ind' or param.annotation is Indicator:
+            kwargs[name] = CLOSE()
+        else:
+            return None
+    return kwargs
+
+
+def _bench_run(part_dir, stocks, bars):
+    """在当前进程中加载数据并测试一个部件，返回结果字典"""
+    import importlib.util
+    options = {
+        'stock_list': BENCH_STOCKS[:stocks],
+        'ktype_list': ['day'],
+        'preload_num': {'day_max': bars + 100},
+        'load_history_finance': False,
+        'load_weight': False,
+        'start_spot': False,
+        'spot_worker_num': 1,
+    }
+    hikyuu.load_hikyuu(**options)
+    from hikyuu import (sm, Query, crtTM, Indicator, SignalBase, System, SelectorBase, Portfolio, SYS_Simple,
+                        SG_Cross, MA, CLOSE, MM_FixedCount, PF_Simple, AF_EqualWeight)
+
+    result = {'rss_after_load_mb': _peak_rss_mb()}
+    spec = importlib.util.spec_from_file_location("bench_part", f"{part_dir}/part.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    kwargs = _bench_args(module.part)
+    if kwargs is None:
+        result['status'] = 'skipped'
+        result['reason'] = 'part() 的参数无法自动提供'
+        return result
+
+    start = time.perf_counter()
+    obj = module.part(**kwargs)
+    result['construct_seconds'] = time.perf_counter() - start
+
+    stks = [s for s in (sm[code] for code in options['stock_list']) if not s.is_null()]
+    query = Query(-bars)
+    kdatas = [s.get_kdata(query) for s in stks]
+    total_bars = sum(len(k) for k in kdatas)
+    result['stocks'] = len(stks)
+    result['bars'] = total_bars
+
+    start = time.perf_counter()
+    if isinstance(obj, Indicator):
+        for k in kdatas:
+            obj(k)
+        result['kind'] = 'ind'
+        result['per_1000_bars_seconds'] = (time.perf_counter() - start) / max(total_bars, 1) * 1000
+    elif isinstance(obj, SignalBase):
+        for k in kdatas:
+            sg = obj.clone()
+            sg.to = k
+            sg.get_buy_signal()
+        result['kind'] = 'sg'
+        result['per_stock_seconds'] = (time.perf_counter() - start) / max(len(stks), 1)
+    elif isinstance(obj, System):
+        if obj.tm is None:
+            obj.tm = crtTM()
+        if obj.mm is None:
+            obj.mm = MM_FixedCount(100)
+        for stk in stks:
+            my_sys = obj.clone()
+            my_sys.run(stk, query)
+        result['kind'] = 'sys'
+        result['per_stock_seconds'] = (time.perf_counter() - start) / max(len(stks), 1)
+    elif isinstance(obj, (SelectorBase, Portfolio)):
+        if isinstance(obj, SelectorBase):
+            if len(obj.proto_sys_list) == 0:
+                obj.add_stock_list(stks, SYS_Simple(sg=SG_Cross(MA(CLOSE(), 5), MA(CLOSE(), 20)),
+                                                    mm=MM_FixedCount(100)))
+            start_date = kdatas[0][0].datetime if len(kdatas) > 0 and len(kdatas[0]) > 0 else None
+            obj = PF_Simple(tm=crtTM(start_date) if start_date is not None else crtTM(),
+                            se=obj, af=AF_EqualWeight())
+            start = time.perf_counter()
+        obj.run(query)
+        result['kind'] = 'pf'
+        result['run_seconds'] = time.perf_counter() - start
+    else:
+        result['kind'] = 'other'
+    result['peak_rss_mb'] = _peak_rss_mb()
+    result['status'] = 'ok'
+    return result
+
+
+@click.command(name='bench-part', hidden=True)
+@click.argument('part_dir')
+@click.option('--stocks', type=int, default=10)
+@click.option('--bars', type=int, default=1000)
+def bench_part(part_dir, stocks, bars):
+    try:
+        result = _bench_run(part_dir, stocks, bars)
+    except Exception as e:
+        result = {'status': 'error', 'reason': f"{type(e).__name__}: {e}"}
+    print(BENCH_RESULT_PREFIX + json.dumps(result, ensure_ascii=False), flush=True)
+
+
+BENCH_METRICS = ('construct_seconds', 'per_1000_bars_seconds', 'per_stock_seconds', 'run_seconds', 'peak_rss_mb')
+
+
+def _last_bench_results(history):
+    """历史文件中每个部件的最近一次成功结果"""
+    last = {}
+    if os.path.exists(history):
+        with open(history, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                if r.get('status') == 'ok':
+                    last[r['part']] = r
+    return last
+
+
+@click.command()
+@click.option(
+    '-t',
+    '--t',
+    type=click.Choice(
+        ['af', 'cn', 'ev', 'mm', 'pg', 'se', 'sg', 'sp', 'st', 'pf', 'sys', 'ind', 'other']),
+    help="组件类型，不指定时测试全部部件"
+)
+@click.option(
+    '-n',
+    '--n',
+    type=str,
+    help="名称，不指定时测试该类型的全部部件"
+)
+@click.option('--stocks', type=int, default=10, help='测试使用的证券数量')
+@click.option('--bars', type=int, default=1000, help='每只证券的 K 线数量')
+@click.option('--timeout', type=int, default=600, help='单个部件的超时时间（秒）')
+@click.option('--history', type=str, default='bench_history.jsonl', help='历史结果文件')
+@click.option('--tolerance', type=float, default=0.2, help='与上一次结果相比允许的变慢比例')
+def bench(t, n, stocks, bars, timeout, history, tolerance):
+    if t is None:
+        parts = _list_part_dirs()
+    else:
+        type_dir = f"{CURRENT_DIR}/{t}" if t in ("ind", "sys", "pf", "other") else f"{CURRENT_DIR}/part/{t}"
+        parts = [d for d in _list_part_dirs() if os.path.dirname(d) == type_dir]
+        if n is not None:
+            parts = [d for d in parts if os.path.basename(d) == n]
+    if not parts:
+        print("no part found!")
+        return
+
+    last = _last_bench_results(history)
+    stamp = datetime.datetime.now().isoformat(timespec='seconds')
+    results = []
+    for part_dir in parts:
+        name = os.path.relpath(part_dir, CURRENT_DIR).replace('\\', '/')
+        with open(f"{part_dir}/part.py", 'rb') as f:
+            digest = hashlib.md5(f.read()).hexdigest()
+        print(f"bench {name} ...")
+        cmd = [sys.executable, os.path.abspath(__file__), 'bench-part', part_dir,
+               '--stocks', str(stocks), '--bars', str(bars)]
+        try:
+            proc = subprocess.run(cmd, cwd=part_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  timeout=timeout)
+            output = proc.stdout.decode('utf-8', errors='replace')
+            lines = [l for l in output.splitlines() if l.startswith(BENCH_RESULT_PREFIX)]
+            r = json.loads(lines[-1][len(BENCH_RESULT_PREFIX):]) if lines else \
+                {'status': 'error', 'reason': output.strip()[-500:]}
+        except subprocess.TimeoutExpired:
+            r = {'status': 'timeout'}
+        r.update({'part': name, 'hash': digest, 'date': stamp})
+
+        # 与上一次成功结果比较
+        prev = last.get(name)
+        r['regressed'] = []
+        if prev is not None and r['status'] == 'ok':
+            r['changed'] = prev.get('hash') != digest
+            for key in BENCH_METRICS:
+                if r.get(key) and prev.get(key) and r[key] > prev[key] * (1 + tolerance):
+                    r['regressed'].append(key)
+        results.append(r)
+
+    with open(history, 'a', encoding='utf-8') as f:
+        for r in results:
+            f.write(json.dumps(r, ensure_ascii=False) + '\n')
+
+    def fmt(value, scale=1.0):
+        return f"{value * scale:.3f}" if value is not None else '-'
+
+    print("========================")
+    print(f"{'construct ms':>12} {'ms/1000bars':>12} {'ms/stock':>10} {'run s':>8} {'peak MB':>9}  part")
+    for r in results:
+        if r['status'] != 'ok':
+            print(f"{r['status']:>12}  {r['part']}  {r.get('reason', '')}")
+            continue
+        flag = ''
+        if r['regressed']:
+            flag = f"  <- regressed: {', '.join(r['regressed'])}" + (' (edited)' if r.get('changed') else '')
+        print(f"{fmt(r.get('construct_seconds'), 1000):>12} {fmt(r.get('per_1000_bars_seconds'), 1000):>12} "
+              f"{fmt(r.get('per_stock_seconds'), 1000):>10} {fmt(r.get('run_seconds')):>8} "
+              f"{fmt(r.get('peak_rss_mb')):>9}  {r['part']}{flag}")
+    regressed = [r['part'] for r in results if r.get('regressed')]
+    if regressed:
+        print(f"regressed: {len(regressed)}")
 
 
 @click.command()
@@ -598,6 +971,18 @@ def clearall():
                     f"{part_dir}/{entry.name}/.virtual_documents", True)
 
 
+@click.command()
+def manifest():
+    """生成或增量更新部件清单 manifest.json"""
+    from hub_manifest import update_manifest, MANIFEST_FILE
+    parts, changed, removed = update_manifest()
+    for key in changed:
+        print(f"updated: {key}")
+    for key in removed:
+        print(f"removed: {key}")
+    print(f"{len(parts)} parts in {MANIFEST_FILE}")
+
+
 cli.add_command(create)
 cli.add_command(update)
 cli.add_command(build)
@@ -606,6 +991,9 @@ cli.add_command(test)
 cli.add_command(testall)
 cli.add_command(clear)
 cli.add_command(clearall)
+cli.add_command(bench)
+cli.add_command(bench_part)
+cli.add_command(manifest)
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,173 @@
+import datetime
+import json
+import os
+import numpy as np
+from parallel import load_options, ensure_loaded, run_tasks
+
+# 实测回看长度的缓存，测量需要加载探针证券的全部历史，结果按部件与参数缓存
+CACHE_FILE = '.lookback_cache.json'
+
+
+def _same(a, b, rtol):
+    return bool(np.all(np.isclose(a, b, rtol=rtol, atol=rtol, equal_nan=True)))
+
+
+def _evaluator(obj):
+    """
+    返回 f(kdata) -> ndarray 的计算函数
+
+    支持指标、信号指示器与交易系统（取其信号指示器），信号以 买入 1 / 卖出 -1 / 无 0 表示
+    """
+    import hikyuu as hku
+    if isinstance(obj, hku.Indicator):
+        return lambda k: obj(k).to_np()
+    sg = obj.sg if isinstance(obj, hku.System) else obj
+    if not isinstance(sg, hku.SignalBase):
+        raise ValueError(f"不支持的部件类型: {type(obj)}")
+
+    def evaluate(k):
+        my_sg = sg.clone()
+        my_sg.to = k
+        dates = np.array([d.number for d in k.get_datetime_list()], dtype=np.int64)
+        buy = np.isin(dates, [d.number for d in my_sg.get_buy_signal()])
+        sell = np.isin(dates, [d.number for d in my_sg.get_sell_signal()])
+        return buy.astype(np.int8) - sell.astype(np.int8)
+    return evaluate
+
+
+def measure_lookback(obj, stk, ktype='day', check=1, rtol=1e-6):
+    """
+    实测部件的最小回看长度
+
+    在探针证券的全部历史上计算一次作为基准，再寻找最短的尾部长度 L，使只用最后 L 根 K 线
+    计算的最后 check 个值与基准一致。除 MA、REF、COUNT 等固定窗口外，也覆盖 EMA、SMA 等
+    递推指标的收敛所需长度
+
+    参数:
+        obj: 指标、信号指示器或交易系统
+        stk: 探针证券，应有足够长的历史
+        ktype: K 线类型
+        check: 需要一致的尾部值个数，选股只关心最后一根时为 1
+        rtol: 相对误差容忍度
+
+    返回:
+        最小回看长度（K 线根数），探针历史不足以收敛时返回其全部长度
+    """
+    import hikyuu as hku
+    evaluate = _evaluator(obj)
+    kdata = stk.get_kdata(hku.Query(0, hku.constant.null_int64, ktype.upper()))
+    n = len(kdata)
+    if n == 0:
+        raise ValueError(f"探针证券没有数据: {stk.market_code}")
+    full = evaluate(kdata)[-check:]
+
+    def matches(length):
+        tail = evaluate(stk.get_kdata(hku.Query(n - length, n, ktype.upper())))
+        return len(tail) >= check and _same(tail[-check:], full, rtol)
+
+    # 先倍增找到满足条件的长度，再二分收缩
+    low, high = 0, check
+    while high < n and not matches(high):
+        low, high = high, min(high * 2, n)
+    while high - low > 1:
+        mid = (low + high) // 2
+        if matches(mid):
+            high = mid
+        else:
+            low = mid
+    return high
+
+
+def _measure_worker(task):
+    part_name, params, probe, ktype, check = task
+    ensure_loaded(load_options([probe], ktype_list=(ktype,), preload_num={f'{ktype}_max': 1000000}))
+    import hikyuu as hku
+    return measure_lookback(hku.get_part(part_name, **params), hku.sm[probe], ktype, check)
+
+
+def _cache_key(part_name, params, probe, ktype, check):
+    return json.dumps([part_name, params, probe.lower(), ktype, check], sort_keys=True, ensure_ascii=False)
+
+
+def part_lookback(part_name, params=None, probe='sh000001', ktype='day', check=1, cache_file=CACHE_FILE):
+    """
+    部件的最小回看长度，在只加载探针证券的独立进程中测量，结果写入缓存
+
+    参数:
+        part_name: 部件名称，如 'default.ind.通达信百变一阳指'
+        params: 部件参数
+        probe: 探针证券代码
+        ktype: K 线类型
+        check: 见 measure_lookback
+        cache_file: 缓存文件，None 表示不使用缓存
+
+    返回:
+        最小回看长度
+    """
+    params = params or {}
+    key = _cache_key(part_name, params, probe, ktype, check)
+    cache = {}
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if key in cache:
+            return cache[key]
+
+    task = (part_name, params, probe, ktype, check)
+    results = [result for _, result in run_tasks(_measure_worker, [task], workers=1, desc="测量回看长度")]
+    if not results:
+        raise RuntimeError(f"测量回看长度失败: {part_name}")
+    if cache_file is not None:
+        cache[key] = results[0]
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    return results[0]
+
+
+def bars_needed(query, lookback):
+    """
+    查询所需的 K 线根数：查询区间本身加上回看长度
+
+    日期查询按工作日估算区间长度（不扣除节假日，结果偏多），无需事先加载交易日历
+    """
+    from hikyuu import Query
+    if query.query_type == Query.DATE:
+        start = query.start_datetime
+        start = datetime.date(start.year, start.month, start.day)
+        return int(np.busday_count(start, datetime.date.today() + datetime.timedelta(days=1))) + lookback
+    if query.start < 0:
+        return -query.start + lookback
+    # 绝对下标查询需要从头加载
+    return None
+
+
+def minimal_options(stock_list, query, lookback, margin=10, **kwargs):
+    """
+    根据回看长度生成最小的 load_hikyuu 参数
+
+    参数:
+        stock_list: 证券代码列表
+        query: 策略使用的查询条件
+        lookback: 回看长度，见 part_lookback
+        margin: 额外预留的 K 线根数
+        kwargs: 传递给 parallel.load_options 的其他参数
+
+    返回:
+        load_hikyuu 参数字典
+    """
+    ktype = query.ktype.lower()
+    needed = bars_needed(query, lookback)
+    preload_num = None if needed is None else {f'{ktype}_max': needed + margin}
+    return load_options(stock_list, ktype_list=(ktype,), preload_num=preload_num, **kwargs)
+
+
+def part_options(part_name, stock_list, query, params=None, probe='sh000001', margin=10, **kwargs):
+    """
+    part_lookback 与 minimal_options 的组合，在 load_hikyuu 之前调用
+
+    示例:
+        options = part_options('default.ind.通达信百变一阳指', ['sz000001'], Query(-100))
+        load_hikyuu(**options)
+    """
+    lookback = part_lookback(part_name, params, probe, query.ktype.lower())
+    return minimal_options(stock_list, query, lookback, margin, **kwargs)
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+from trade_log import load_runs
+
+# hikyuu BUSINESS 枚举值
+BUSINESS_BUY = 1
+BUSINESS_SELL = 2
+
+
+def funds_matrix(funds_df):
+    """
+    将 trade_log.load_runs(directory, 'funds') 的长表转换为 运行 × 日期 的矩阵
+
+    返回:
+        (run_ids, dates, funds)，funds 为二维数组，缺失处为 NaN；没有记录时为空数组
+    """
+    if len(funds_df) == 0:
+        return np.array([]), np.array([], dtype=np.int64), np.empty((0, 0))
+    wide = funds_df.pivot(index='run_id', columns='datetime', values='funds').sort_index(axis=1)
+    return wide.index.to_numpy(), wide.columns.to_numpy(dtype=np.int64), wide.to_numpy(dtype=np.float64)
+
+
+def _returns(funds):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rets = funds[:, 1:] / funds[:, :-1] - 1
+    return np.where(np.isfinite(rets), rets, np.nan)
+
+
+def _annualized(first, last, n, periods_per_year):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (last / first) ** (periods_per_year / np.maximum(n - 1, 1)) - 1
+
+
+def _first_last(funds):
+    """每行第一个与最后一个有效值及有效长度，兼容不同起止日期的运行"""
+    valid = np.isfinite(funds) & (funds > 0)
+    n = valid.sum(axis=1)
+    cols = np.arange(funds.shape[1])
+    first_idx = np.where(valid, cols, funds.shape[1]).min(axis=1, initial=funds.shape[1])
+    last_idx = np.where(valid, cols, -1).max(axis=1, initial=-1)
+    rows = np.arange(funds.shape[0])
+    first = np.where(n > 0, funds[rows, np.minimum(first_idx, funds.shape[1] - 1)], np.nan)
+    last = np.where(n > 0, funds[rows, np.maximum(last_idx, 0)], np.nan)
+    return first, last, n
+
+
+def drawdown(funds):
+    """
+    最大回撤及其持续时间
+
+    参数:
+        funds: 运行 × 日期 的资金曲线
+
+    返回:
+        (最大回撤比例, 最长回撤持续 bar 数)，回撤比例为正数
+    """
+    filled = np.where(np.isfinite(funds), funds, -np.inf)
+    peak = np.maximum.accumulate(filled, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dd = np.where(np.isfinite(funds) & (peak > 0), 1 - funds / peak, 0.0)
+    cols = np.arange(funds.shape[1])
+    last_peak = np.maximum.accumulate(np.where(filled >= peak, cols, 0), axis=1)
+    return dd.max(axis=1, initial=0.0), (cols - last_peak).max(axis=1, initial=0)
+
+
+def trade_stats(trades_df=None, positions_df=None):
+    """
+    按运行统计胜率与成交金额
+
+    参数:
+        trades_df: trade_log.load_runs(directory, 'trades') 的结果
+        positions_df: trade_log.load_runs(directory, 'positions') 的结果
+
+    返回:
+        以 run_id 为索引的 DataFrame: win_rate（已平仓盈利次数占比 %）、closed_count、traded_amount
+    """
+    result = pd.DataFrame()
+    if positions_df is not None and len(positions_df) > 0:
+        closed = positions_df[positions_df['clean_datetime'] > 0]
+        profit = closed['sell_money'] - closed['buy_money'] - closed['total_cost']
+        grouped = (profit > 0).groupby(closed['run_id'])
+        result['win_rate'] = grouped.mean() * 100
+        result['closed_count'] = grouped.size()
+    if trades_df is not None and len(trades_df) > 0:
+        traded = trades_df[trades_df['business'].isin([BUSINESS_BUY, BUSINESS_SELL])]
+        amount = traded['real_price'] * traded['number']
+        result = result.join(amount.groupby(traded['run_id']).sum().rename('traded_amount'), how='outer')
+    return result
+
+
+def batch_metrics(funds, run_ids=None, benchmark=None, trades_df=None, positions_df=None,
+                  periods_per_year=252, risk_free=0.0):
+    """
+    批量计算资金曲线的绩效指标，全部为数组运算，适合对上千次参数运行排序
+
+    参数:
+        funds: 运行 × 日期 的资金曲线，缺失处为 NaN
+        run_ids: 各行的运行标识，默认为行号
+        benchmark: 与 funds 列对齐的参考曲线，如沪深300收盘价，用于计算超额收益；
+                   参考收益按各运行自身的起止日期区间分别年化
+        trades_df, positions_df: trade_log 导出的交易与持仓记录，用于胜率与换手率
+        periods_per_year: 年化周期数
+        risk_free: 年化无风险利率
+
+    返回:
+        以 run_id 为索引的 DataFrame
+    """
+    funds = np.atleast_2d(np.asarray(funds, dtype=np.float64))
+    if run_ids is None:
+        run_ids = np.arange(funds.shape[0])
+
+    first, last, n = _first_last(funds)
+    rets = _returns(funds)
+    excess_rets = rets - risk_free / periods_per_year
+    mean = np.nanmean(excess_rets, axis=1)
+    std = np.nanstd(rets, axis=1)
+    downside = np.sqrt(np.nanmean(np.minimum(excess_rets, 0) ** 2, axis=1))
+    scale = np.sqrt(periods_per_year)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, mean / std * scale, np.nan)
+        sortino = np.where(downside > 0, mean / downside * scale, np.nan)
+    max_dd, dd_bars = drawdown(funds)
+
+    df = pd.DataFrame({
+        'total_return': (last / first - 1) * 100,
+        'annual_return': _annualized(first, last, n, periods_per_year) * 100,
+        'max_drawdown': max_dd * 100,
+        'max_drawdown_bars': dd_bars,
+        'sharpe': sharpe,
+        'sortino': sortino,
+    }, index=pd.Index(run_ids, name='run_id'))
+
+    if benchmark is not None:
+        benchmark = np.asarray(benchmark, dtype=np.float64)
+        # 只取每个运行第一个到最后一个有效值之间的参考曲线，不同起止日期的运行各自比较
+        valid = np.isfinite(funds) & (funds > 0)
+        span = np.logical_or.accumulate(valid, axis=1) & np.logical_or.accumulate(valid[:, ::-1], axis=1)[:, ::-1]
+        b_first, b_last, b_n = _first_last(np.where(span, benchmark[np.newaxis, :], np.nan))
+        b_annual = _annualized(b_first, b_last, b_n, periods_per_year)
+        df['excess_return'] = df['annual_return'] - b_annual * 100
+
+    if trades_df is not None or positions_df is not None:
+        stats = trade_stats(trades_df, positions_df)
+        df = df.join(stats)
+        if 'traded_amount' in df:
+            avg_funds = pd.Series(np.nanmean(funds, axis=1), index=df.index)
+            df['turnover'] = df['traded_amount'] / avg_funds
+    return df
+
+
+def runs_metrics(directory, benchmark=None, **kwargs):
+    """
+    读取 trade_log 导出目录下的全部运行，计算绩效指标表
+
+    参数:
+        directory: trade_log.export_tm 的输出目录
+        benchmark: 参考证券，如 sm['sh000300']，按资金曲线日期对齐其收盘价
+        kwargs: 传递给 batch_metrics 的其他参数
+
+    返回:
+        以 run_id 为索引的 DataFrame
+    """
+    run_ids, dates, funds = funds_matrix(load_runs(directory, 'funds'))
+    bench = None
+    if benchmark is not None and len(dates) > 0:
+        from hikyuu import Query, Datetime, Days
+        from panel import align, datetime_numbers
+        k = benchmark.get_kdata(Query(Datetime(int(dates[0])), Datetime(int(dates[-1])) + Days(1)))
+        bench = align(dates, datetime_numbers(k.get_datetime_list()), k.to_np()['close'])
+    return batch_metrics(funds, run_ids, bench, load_runs(directory, 'trades'),
+                         load_runs(directory, 'positions'), **kwargs)
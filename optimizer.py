@@ -0,0 +1,184 @@
+import hashlib
+import itertools
+import json
+import os
+import pandas as pd
+from trade_log import export_tm
+from parallel import load_options, ensure_loaded, stock_codes, query_to_spec, spec_to_query, chunked, run_tasks
+
+
+def param_combinations(param_space):
+    """
+    展开参数空间
+
+    参数:
+        param_space: 参数空间，如 {'fastn': [5, 10], 'slown': [20, 60]}
+
+    返回:
+        参数字典列表
+    """
+    names = list(param_space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[param_space[n] for n in names])]
+
+
+def run_key(part_name, code, params):
+    """单次运行的唯一标识，用于断点续跑"""
+    return json.dumps([part_name, code, params], sort_keys=True, ensure_ascii=False)
+
+
+def run_id(key):
+    """由 run_key 生成的短标识，用作交易记录文件名"""
+    return hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+
+
+class ResultStore:
+    """
+    优化结果存储，JSON lines 格式，每行对应一次运行
+
+    每完成一批运行就追加写入，程序中断后重新运行时根据已有的 key 跳过已完成的组合
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def done_keys(self):
+        keys = set()
+        if not os.path.exists(self.path):
+            return keys
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    keys.add(json.loads(line)['key'])
+                except (ValueError, KeyError):
+                    # 中断时可能残留不完整的行，忽略即可
+                    continue
+        return keys
+
+    def append(self, rows):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def to_dataframe(self):
+        rows = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue
+                    params = row.pop('params')
+                    stats = row.pop('stats')
+                    rows.append({**row, **params, **stats})
+        return pd.DataFrame(rows)
+
+
+def _performance_dict(tm, end_datetime):
+    from hikyuu import Performance
+    per = Performance()
+    per.statistics(tm, end_datetime)
+    return {name: float(value) for name, value in zip(per.names(), per.values())}
+
+
+def _optimize_worker(task):
+    """
+    工作进程：只加载本批证券，依次运行本批证券的全部参数组合
+    """
+    part_name, codes, combos, query_spec, init_cash, cost_func, done, trade_dir = task
+    ensure_loaded(load_options(codes))
+    import hikyuu as hku
+
+    query = spec_to_query(query_spec)
+    rows = []
+    for code in codes:
+        stk = hku.sm[code]
+        if stk.is_null():
+            print(f"未找到证券: {code}")
+            continue
+        kdata = stk.get_kdata(query)
+        if len(kdata) == 0:
+            continue
+        for params in combos:
+            key = run_key(part_name, code, params)
+            if key in done:
+                continue
+            try:
+                my_sys = hku.get_part(part_name, **params)
+                if my_sys.mm is None:
+                    my_sys.mm = hku.MM_Nothing()
+                my_sys.tm = hku.crtTM(kdata[0].datetime, init_cash=init_cash,
+                                      cost_func=getattr(hku, cost_func)())
+                my_sys.run(kdata)
+                stats = _performance_dict(my_sys.tm, kdata[-1].datetime)
+                if trade_dir is not None:
+                    export_tm(my_sys.tm, trade_dir, run_id(key), dates=kdata.get_datetime_list())
+            except Exception as e:
+                print(f"运行 {part_name} {code} {params} 时出错: {e}")
+                continue
+            rows.append({'key': key, 'run_id': run_id(key), 'part': part_name, 'code': code,
+                         'params': params, 'stats': stats})
+    return rows
+
+
+def optimize(part_name, param_space, stks, query, store='optimize_result.jsonl',
+             workers=None, chunk_size=20, init_cash=100000.0, cost_func='TC_Zero', trade_dir=None):
+    """
+    在多进程中对交易系统部件做 (股票, 参数) 网格优化
+
+    参数:
+        part_name: 交易系统部件名称，如 'default.sys.趋势双均线'
+        param_space: 参数空间，如 {'fast_n': [5, 10], 'slow_n': [60, 120]}
+        stks: 证券或证券代码列表
+        query: 查询条件
+        store: 结果文件路径，已存在时跳过已完成的运行（断点续跑）
+        workers: 工作进程数，默认 CPU 核数
+        chunk_size: 每个工作进程任务包含的证券数量，工作进程只加载这些证券
+        init_cash: 初始资金
+        cost_func: 交易成本函数名称，如 'TC_Zero'、'TC_FixedA2017'
+        trade_dir: 指定时将每次运行的交易记录以 trade_log 列式格式导出到该目录，文件名为 run_id
+
+    返回:
+        包含全部已完成运行的 DataFrame，每行为一次运行的 Performance 统计
+        有任务出错时抛出 RuntimeError，已完成的运行保留在结果存储中
+    """
+    store = ResultStore(store)
+    done = store.done_keys()
+    combos = param_combinations(param_space)
+    codes = stock_codes(stks)
+    query_spec = query_to_spec(query)
+
+    all_keys = {run_key(part_name, code, p) for code in codes for p in combos}
+    tasks = []
+    for chunk in chunked(codes, chunk_size):
+        chunk_done = {run_key(part_name, code, p) for code in chunk for p in combos} & done
+        if len(chunk_done) == len(chunk) * len(combos):
+            continue
+        tasks.append((part_name, chunk, combos, query_spec, init_cash, cost_func, chunk_done, trade_dir))
+
+    print(f"共 {len(all_keys)} 次运行，已完成 {len(all_keys & done)} 次，待运行 {len(tasks)} 个任务")
+    errors = []
+    for _, rows in run_tasks(_optimize_worker, tasks, workers=workers, desc=f"优化 {part_name}", errors=errors):
+        store.append(rows)
+    if errors:
+        # 已完成的运行已写入结果存储，重新调用 optimize 只会重跑出错的任务
+        codes = [code for task, _ in errors for code in task[1]]
+        raise RuntimeError(f"{len(errors)} 个任务执行出错（{len(codes)} 只证券: {', '.join(codes[:10])}），"
+                           f"首个错误: {errors[0][1]!r}") from errors[0][1]
+
+    return store.to_dataframe()
+
+
+# 使用示例
+if __name__ == "__main__":
+    from hikyuu import Query, Datetime
+
+    stks = ['sz000001', 'sh600000', 'sh600036']
+    df = optimize('default.sys.趋势双均线', {'fast_n': [5, 10, 20], 'slow_n': [60, 120]},
+                  stks, Query(Datetime(20200101)), workers=4)
+    print(df.sort_values(by='帐户平均年收益率%', ascending=False).head(10))
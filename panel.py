@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from hikyuu import *
+
+
+def datetime_numbers(dates):
+    """Datetime 序列转换为 Datetime.number (YYYYMMDDhhmm) 整数数组"""
+    return np.array([d.number for d in dates], dtype=np.int64)
+
+
+def numbers_to_index(numbers):
+    """Datetime.number 数组转换为 pandas 日期索引"""
+    return pd.DatetimeIndex(pd.to_datetime(pd.Series(numbers).astype(str), format='%Y%m%d%H%M'))
+
+
+def trading_dates(query, market='SH'):
+    """查询范围内的交易日历，返回 Datetime.number 数组"""
+    return datetime_numbers(sm.get_trading_calendar(query, market))
+
+
+def align(dates, k_dates, values, fill=np.nan):
+    """
+    将按 K 线日期排列的数值对齐到 dates 上，缺失（停牌、未上市）处填充 fill
+
+    参数:
+        dates: 目标日期数组 (Datetime.number)，需有序
+        k_dates: 数值对应的日期数组
+        values: 数值数组
+
+    返回:
+        与 dates 等长的数组
+    """
+    values = np.asarray(values)
+    out = np.full(len(dates), fill, dtype=np.result_type(values.dtype, np.asarray(fill).dtype))
+    if len(dates) == 0 or len(k_dates) == 0:
+        return out
+    pos = np.searchsorted(dates, k_dates)
+    keep = (pos < len(dates)) & (dates[np.minimum(pos, len(dates) - 1)] == k_dates)
+    out[pos[keep]] = values[keep]
+    return out
+
+
+class Panel:
+    """
+    交易日 × 证券 的二维面板
+
+    dates 为 Datetime.number 数组，codes 为 market_code 列表，values 的行与 dates 对应、列与 codes 对应
+    """
+
+    def __init__(self, dates, codes, values):
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.codes = list(codes)
+        self.values = values
+        self._code_index = None
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def code_index(self, code):
+        if self._code_index is None:
+            self._code_index = {c: i for i, c in enumerate(self.codes)}
+        return self._code_index[code]
+
+    def column(self, code):
+        return self.values[:, self.code_index(code)]
+
+    def row(self, date):
+        """date 当日的截面，date 可以为 Datetime 或 Datetime.number，非交易日返回 None"""
+        number = date if isinstance(date, (int, np.integer)) else date.number
+        i = np.searchsorted(self.dates, number)
+        if i >= len(self.dates) or self.dates[i] != number:
+            return None
+        return self.values[i]
+
+    def slice(self, start=None, end=None):
+        """按日期截取 [start, end) 区间，start/end 为 Datetime.number，共享底层数组"""
+        lo = 0 if start is None else np.searchsorted(self.dates, start)
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, end)
+        return Panel(self.dates[lo:hi], self.codes, self.values[lo:hi])
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.values, index=numbers_to_index(self.dates), columns=self.codes)
+
+
+def kdata_panel(stks, query, fields=('open', 'high', 'low', 'close', 'volume'), market='SH'):
+    """
+    一次读取证券池的 K 线，生成各字段的面板
+
+    参数:
+        stks: 证券列表
+        query: 查询条件
+        fields: KData.to_np() 中的字段名
+        market: 交易日历所属市场
+
+    返回:
+        {字段名: Panel}
+    """
+    dates = trading_dates(query, market)
+    codes = [s.market_code for s in stks]
+    values = {field: np.full((len(dates), len(stks)), np.nan) for field in fields}
+    for j, stk in enumerate(tqdm(stks, desc="读取K线")):
+        k = stk.get_kdata(query)
+        if len(k) == 0:
+            continue
+        arr = k.to_np()
+        k_dates = datetime_numbers(k.get_datetime_list())
+        for field in fields:
+            values[field][:, j] = align(dates, k_dates, arr[field])
+    return {field: Panel(dates, codes, values[field]) for field in fields}
+
+
+def indicator_panel(ind, stks, query, market='SH'):
+    """
+    在证券池上计算指标，按交易日历对齐为面板；指标在各证券自身的 K 线上计算，停牌日为 NaN
+
+    参数:
+        ind: 指标，如 REF(get_part('default.ind.市净率'), 1)
+        stks: 证券列表
+        query: 查询条件
+
+    返回:
+        Panel
+    """
+    dates = trading_dates(query, market)
+    values = np.full((len(dates), len(stks)), np.nan)
+    for j, stk in enumerate(tqdm(stks, desc=f"计算{ind.name}")):
+        k = stk.get_kdata(query)
+        if len(k) == 0:
+            continue
+        values[:, j] = align(dates, datetime_numbers(k.get_datetime_list()), ind(k).to_np())
+    return Panel(dates, [s.market_code for s in stks], values)
+
+
+def signal_panel(sg, stks, query, market='SH'):
+    """
+    在证券池上计算信号指示器，返回买入、卖出信号的布尔面板
+
+    返回:
+        (buy Panel, sell Panel)
+    """
+    dates = trading_dates(query, market)
+    codes = [s.market_code for s in stks]
+    buy = np.zeros((len(dates), len(stks)), dtype=bool)
+    sell = np.zeros((len(dates), len(stks)), dtype=bool)
+    for j, stk in enumerate(tqdm(stks, desc="计算信号")):
+        k = stk.get_kdata(query)
+        if len(k) == 0:
+            continue
+        my_sg = sg.clone()
+        my_sg.to = k
+        buy[:, j] = np.isin(dates, datetime_numbers(my_sg.get_buy_signal()))
+        sell[:, j] = np.isin(dates, datetime_numbers(my_sg.get_sell_signal()))
+    return Panel(dates, codes, buy), Panel(dates, codes, sell)
@@ -0,0 +1,101 @@
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+# 当前工作进程已加载的 hikyuu 参数，每个进程只能 load_hikyuu 一次
+_loaded_options = None
+
+
+def load_options(stock_list, ktype_list=('day',), preload_num=None, **kwargs):
+    """
+    生成仅加载指定证券的 load_hikyuu 参数
+
+    参数:
+        stock_list: 证券代码列表，如 ['sz000001', 'sh600000']，大小写均可，统一转换为 load_hikyuu 使用的小写
+        ktype_list: 需要加载的 K 线类型
+        preload_num: 预加载数量，如 {'day_max': 100000}，None 表示使用默认值
+        kwargs: 覆盖其他默认参数，如 load_history_finance=True
+
+    返回:
+        load_hikyuu 参数字典
+    """
+    options = {
+        'stock_list': sorted({code.lower() for code in stock_list}),
+        'ktype_list': list(ktype_list),
+        'load_history_finance': False,
+        'load_weight': False,
+        'start_spot': False,
+        'spot_worker_num': 1,
+    }
+    if preload_num is not None:
+        options['preload_num'] = preload_num
+    options.update(kwargs)
+    return options
+
+
+def ensure_loaded(options):
+    """在当前工作进程中初始化 hikyuu，同一进程只加载一次"""
+    global _loaded_options
+    if _loaded_options is None:
+        import hikyuu
+        hikyuu.load_hikyuu(**options)
+        _loaded_options = options
+    return _loaded_options
+
+
+def stock_codes(stks):
+    """证券或证券代码序列统一转换为 market_code 列表"""
+    return [s if isinstance(s, str) else s.market_code for s in stks]
+
+
+def query_to_spec(query):
+    """Query 转换为可在进程间传递的元组"""
+    from hikyuu import Query
+    if query.query_type == Query.DATE:
+        return ('date', query.start_datetime.number, query.end_datetime.number, query.ktype, query.recover_type)
+    return ('index', query.start, query.end, query.ktype, query.recover_type)
+
+
+def spec_to_query(spec):
+    """query_to_spec 的逆操作，在工作进程中重建 Query"""
+    from hikyuu import Query, Datetime
+    kind, start, end, ktype, recover_type = spec
+    if kind == 'date':
+        return Query(Datetime(start), Datetime(end), ktype, recover_type)
+    return Query(start, end, ktype, recover_type)
+
+
+def chunked(seq, size):
+    seq = list(seq)
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+
+def run_tasks(func, tasks, workers=None, desc="并行任务", fresh_process=True, errors=None):
+    """
+    将任务分发到工作进程执行，按完成顺序生成 (task, result)
+
+    参数:
+        func: 模块级函数，接收单个 task
+        tasks: 任务列表，task 需可 pickle
+        workers: 工作进程数，默认 CPU 核数
+        desc: 进度条描述
+        fresh_process: 每个任务使用新进程，以便各任务只加载自己需要的证券
+        errors: 列表，出错的任务以 (task, 异常) 追加到其中并继续执行；
+                None 时在全部任务结束后抛出 RuntimeError，避免出错的任务被当作空结果
+    """
+    kwargs = {'max_workers': workers, 'mp_context': mp.get_context('spawn')}
+    if fresh_process:
+        kwargs['max_tasks_per_child'] = 1
+    failed = [] if errors is None else errors
+    with ProcessPoolExecutor(**kwargs) as executor:
+        futures = {executor.submit(func, task): task for task in tasks}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed.append((task, e))
+                continue
+            yield task, result
+    if errors is None and failed:
+        raise RuntimeError(f"{len(failed)} 个任务执行出错，首个错误: {failed[0][1]!r}") from failed[0][1]
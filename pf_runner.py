@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from parallel import load_options, ensure_loaded, query_to_spec, spec_to_query, run_tasks
+
+
+def _resolve_config(config):
+    """
+    在工作进程中把配置还原为 get_part 的参数
+
+    配置中的 parts 为需要通过 get_part 构造的参数，如 {'ind': 'default.ind.市净率'}；
+    stks 为证券代码列表，会转换为 Stock 元组
+    """
+    import hikyuu as hku
+    kwargs = dict(config.get('kwargs', {}))
+    for name, part_name in config.get('parts', {}).items():
+        kwargs[name] = hku.get_part(part_name)
+    if 'stks' in config:
+        kwargs['stks'] = tuple([hku.sm[code] for code in config['stks']])
+    if 'ref_stk' in config:
+        kwargs['ref_stk'] = hku.sm[config['ref_stk']]
+    return kwargs
+
+
+def _pf_worker(task):
+    """工作进程：使用预加载的数据运行一个组合配置，返回绩效统计与资金曲线"""
+    config, query_spec, options = task
+    ensure_loaded(options)
+    import hikyuu as hku
+
+    query = spec_to_query(query_spec)
+    dates = hku.sm.get_trading_calendar(query)
+    my_tm = hku.crtTM(dates[0], init_cash=config.get('init_cash', 100000.0),
+                      cost_func=getattr(hku, config.get('cost_func', 'TC_Zero'))())
+    my_pf = hku.get_part(config['part'], tm=my_tm, **_resolve_config(config))
+    my_pf.run(query)
+
+    per = hku.Performance()
+    per.statistics(my_pf.tm, dates[-1])
+    stats = {name: float(value) for name, value in zip(per.names(), per.values())}
+    funds = np.array(my_pf.tm.get_funds_curve(dates), dtype=np.float64)
+    return stats, [d.number for d in dates], funds
+
+
+def run_portfolios(configs, query, workers=None, stock_list=None, **load_kwargs):
+    """
+    在多个工作进程中并行运行多组资产组合配置，并汇总比较
+
+    参数:
+        configs: 组合配置列表，每项为字典，如:
+            {'label': '最低2支-10日',
+             'part': 'default.pf.base_最低单因子轮动',
+             'kwargs': {'bottomn': 2, 'adjust_cycle': 10},
+             'parts': {'ind': 'default.ind.市净率'},
+             'stks': ['SH600000', 'SH600036'],
+             'init_cash': 100000}
+        query: 查询条件
+        workers: 工作进程数，默认 CPU 核数
+        stock_list: 需要预加载的证券代码，默认为所有配置 stks 的并集加上沪深300与上证指数；
+                    有配置未给出 stks（使用部件自身的股票池）时必须指定，否则该股票池不会被加载
+        load_kwargs: 其他 load_hikyuu 参数，如 load_history_finance=True
+
+    返回:
+        (绩效比较表, 资金曲线表)，两者均以 label 区分各配置
+    """
+    if stock_list is None:
+        missing = [config.get('label', config['part']) for config in configs if 'stks' not in config]
+        if missing:
+            raise ValueError(f"配置未给出 stks，无法确定需要加载的证券，请指定 stock_list: {missing}")
+        codes = {'sh000001', 'sh000300'}
+        for config in configs:
+            codes.update(config['stks'])
+            if 'ref_stk' in config:
+                codes.add(config['ref_stk'])
+        stock_list = codes
+    options = load_options(stock_list, **load_kwargs)
+    query_spec = query_to_spec(query)
+
+    labels = [config.get('label', f"{config['part']}-{i}") for i, config in enumerate(configs)]
+    tasks = [(dict(config, label=label), query_spec, options) for config, label in zip(configs, labels)]
+
+    stats_rows = {}
+    curves = {}
+    for task, (stats, dates, funds) in run_tasks(_pf_worker, tasks, workers=workers,
+                                                 desc="组合回测", fresh_process=False):
+        label = task[0]['label']
+        stats_rows[label] = stats
+        index = pd.to_datetime(pd.Series(dates).astype(str), format='%Y%m%d%H%M')
+        curves[label] = pd.Series(funds, index=index)
+
+    order = [label for label in labels if label in stats_rows]
+    stats_df = pd.DataFrame.from_dict(stats_rows, orient='index').loc[order]
+    curves_df = pd.DataFrame(curves)[order] if curves else pd.DataFrame()
+    return stats_df, curves_df
+
+
+# 使用示例
+if __name__ == "__main__":
+    from hikyuu import Query, Datetime
+
+    banks = ['SZ002142', 'SZ000001', 'SH600000', 'SH600015', 'SH600926', 'SH600016', 'SH600919',
+             'SH600036', 'SH601009', 'SH601166', 'SH601169', 'SH601229', 'SH601288', 'SH601838',
+             'SH601328', 'SH601398', 'SH601658', 'SH601818', 'SH601916', 'SH601939', 'SH601988',
+             'SH601998']
+    configs = []
+    for bottomn in (1, 2, 3):
+        for adjust_cycle in (5, 10, 20):
+            configs.append({
+                'label': f"最低{bottomn}支-{adjust_cycle}日",
+                'part': 'default.pf.base_最低单因子轮动',
+                'kwargs': {'bottomn': bottomn, 'adjust_cycle': adjust_cycle},
+                'parts': {'ind': 'default.ind.市净率'},
+                'stks': banks,
+            })
+    stats_df, curves_df = run_portfolios(configs, Query(Datetime(20200101)), workers=4,
+                                         load_history_finance=True)
+    print(stats_df)
+    print(curves_df.tail())
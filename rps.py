@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import h5py
+from tqdm import tqdm
 def read_rps_to_dataframe(h5_file, rps_period=10):
     
     print(f"读取 {h5_file} 中的RPS{rps_period}数据...")
@@ -0,0 +1,280 @@
+import datetime
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+import h5py
+from rps_store import RpsStore, read_day
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+META_FILE = '_rps_meta.json'
+LAYOUTS = ('long', 'wide')
+
+
+def _require_pyarrow():
+    if not HAS_PYARROW:
+        raise ImportError("RPS 的 Arrow/Parquet 导出与读取需要安装 pyarrow")
+
+
+def _to_date(ymd):
+    ymd = int(ymd)
+    return datetime.date(ymd // 10000, ymd // 100 % 100, ymd % 100)
+
+
+def _source_files(source):
+    """单个 daily_rps.h5 或 RpsStore 目录中的全部 HDF5 文件"""
+    if os.path.isdir(source):
+        return RpsStore(source).files()
+    return [source]
+
+
+def _iter_years(source, start=None, end=None):
+    """
+    按年生成 (year, [(yyyymmdd, h5 组), ...])，只包含与 [start, end] 相交的年份的全部交易日；
+    按月分区的存储中同一年份跨多个文件，迭代期间这些文件保持打开
+    """
+    first = None if start is None else int(start) // 10000
+    last = None if end is None else int(end) // 10000
+    index = {}
+    for path in _source_files(source):
+        with h5py.File(path, 'r') as f:
+            for name in f.keys():
+                year = int(name) // 10000
+                if (first is None or year >= first) and (last is None or year <= last):
+                    index.setdefault(year, []).append((int(name), path))
+    for year in sorted(index):
+        handles = {}
+        try:
+            for _, path in index[year]:
+                if path not in handles:
+                    handles[path] = h5py.File(path, 'r')
+            yield year, [(ymd, handles[path][str(ymd)]) for ymd, path in sorted(index[year])]
+        finally:
+            for f in handles.values():
+                f.close()
+
+
+def _periods(days):
+    return sorted({int(k[3:]) for _, group in days for k in group.keys()})
+
+
+def _long_table(days, period):
+    dates, codes, values = [], [], []
+    for ymd, group in days:
+        value = read_day(group, period)
+        if value is None or len(value[0]) == 0:
+            continue
+        dates.append(np.full(len(value[0]), np.datetime64(_to_date(ymd), 'D')))
+        codes.append(value[0])
+        values.append(value[1])
+    if not dates:
+        return None
+    return pa.table({
+        'date': pa.array(np.concatenate(dates)),
+        'code': pa.array(np.concatenate(codes).astype(str)).dictionary_encode(),
+        'rps': pa.array(np.concatenate(values)),
+    })
+
+
+def _wide_table(days, period):
+    rows = {}
+    for ymd, group in days:
+        value = read_day(group, period)
+        if value is None or len(value[0]) == 0:
+            continue
+        rows[ymd] = dict(zip(value[0].tolist(), value[1].tolist()))
+    if not rows:
+        return None
+    codes = sorted({c for row in rows.values() for c in row})
+    index = {c: j for j, c in enumerate(codes)}
+    # 缺失值保存为 NaN 而不是 null，读取时数值列没有有效位图，可零拷贝转换为 numpy
+    matrix = np.full((len(rows), len(codes)), np.nan)
+    for i, row in enumerate(rows.values()):
+        matrix[i, [index[c] for c in row]] = list(row.values())
+    columns = {'date': pa.array(np.array([_to_date(y) for y in rows], dtype='datetime64[D]'))}
+    columns.update({code: pa.array(matrix[:, j]) for j, code in enumerate(codes)})
+    return pa.table(columns)
+
+
+def export_parquet(source, directory, layout='long', periods=None, start=None, end=None, compression='zstd'):
+    """
+    将 RPS 导出为按周期、年份分区的 Parquet 数据集
+
+    目录结构:
+        directory/period={周期}/year={年份}/part-0.parquet
+        long 布局列为 date, code（字典编码）, rps；wide 布局列为 date 及每只股票一列
+
+    参数:
+        source: daily_rps.h5 文件或 rps_store.RpsStore 目录
+        directory: 输出目录
+        layout: 'long' 或 'wide'
+        periods: 只导出这些周期，None 表示全部
+        start, end: yyyymmdd，只重写与 [start, end] 相交的年份，用于每日增量导出
+        compression: Parquet 压缩方式
+
+    返回:
+        写入的文件路径列表
+    """
+    _require_pyarrow()
+    if layout not in LAYOUTS:
+        raise ValueError(f"不支持的布局: {layout}，可选 {LAYOUTS}")
+    os.makedirs(directory, exist_ok=True)
+    meta_file = os.path.join(directory, META_FILE)
+    if os.path.exists(meta_file):
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            stored = json.load(f)['layout']
+        if stored != layout:
+            raise ValueError(f"{directory} 已按 {stored} 布局导出")
+    with open(meta_file, 'w', encoding='utf-8') as f:
+        json.dump({'layout': layout}, f)
+
+    build = _long_table if layout == 'long' else _wide_table
+    paths = []
+    for year, days in _iter_years(source, start, end):
+        for period in _periods(days):
+            if periods is not None and period not in periods:
+                continue
+            table = build(days, period)
+            if table is None:
+                continue
+            part_dir = os.path.join(directory, f"period={period}", f"year={year}")
+            os.makedirs(part_dir, exist_ok=True)
+            path = os.path.join(part_dir, 'part-0.parquet')
+            # 先写临时文件再改名，读取方不会看到写了一半的文件
+            pq.write_table(table, path + '.tmp', compression=compression)
+            os.replace(path + '.tmp', path)
+            paths.append(path)
+    return paths
+
+
+def _layout(directory):
+    with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)['layout']
+
+
+def read_table(directory, period, start=None, end=None, codes=None):
+    """
+    以 Arrow 表读取 RPS，按周期与年份裁剪分区，日期与证券条件下推到 Parquet 读取，多线程解码
+
+    参数:
+        directory: export_parquet 的输出目录
+        period: RPS 周期
+        start, end: yyyymmdd，闭区间，None 表示不限
+        codes: 只读取这些证券，None 表示全部
+
+    返回:
+        pyarrow.Table，long 布局为 date, code, rps；wide 布局为 date 及各证券列
+    """
+    _require_pyarrow()
+    first = None if start is None else int(start) // 10000
+    last = None if end is None else int(end) // 10000
+    files = []
+    for path in sorted(glob.glob(os.path.join(directory, f"period={int(period)}", 'year=*', '*.parquet'))):
+        year = int(os.path.basename(os.path.dirname(path))[5:])
+        if (first is None or year >= first) and (last is None or year <= last):
+            files.append(path)
+    if not files:
+        return None
+
+    condition = None
+    if start is not None:
+        condition = ds.field('date') >= pa.scalar(_to_date(start), pa.date32())
+    if end is not None:
+        upper = ds.field('date') <= pa.scalar(_to_date(end), pa.date32())
+        condition = upper if condition is None else condition & upper
+
+    if _layout(directory) == 'long':
+        if codes is not None:
+            wanted = ds.field('code').isin(pa.array([str(c) for c in codes]))
+            condition = wanted if condition is None else condition & wanted
+        return ds.dataset(files, format='parquet').to_table(filter=condition, use_threads=True)
+
+    # wide 布局各年份的证券列不同，逐个文件读取所需列后合并
+    tables = []
+    for path in files:
+        names = pq.read_schema(path).names
+        columns = names if codes is None else ['date'] + [c for c in codes if c in names]
+        table = ds.dataset(path, format='parquet').to_table(columns=columns, filter=condition, use_threads=True)
+        tables.append(table)
+    return pa.concat_tables(tables, promote_options='default')
+
+
+def read_frame(directory, period, start=None, end=None, codes=None, wide=True):
+    """
+    以 pandas DataFrame 读取 RPS，各列直接使用 Arrow 缓冲区（pd.ArrowDtype），不逐值转换
+
+    参数:
+        directory, period, start, end, codes: 同 read_table
+        wide: 返回以日期为索引、证券为列的宽表；False 时 long 布局返回 date, code, rps 三列
+
+    返回:
+        DataFrame
+    """
+    table = read_table(directory, period, start, end, codes)
+    if table is None:
+        return pd.DataFrame()
+    if _layout(directory) == 'long' and wide:
+        # 宽表需要重排，转换为 numpy 后透视，结果与 RpsStore.read 一致
+        df = table.to_pandas()
+        df['code'] = df['code'].astype(str)
+        df = df.pivot(index='date', columns='code', values='rps')
+        df.index = pd.DatetimeIndex(df.index, name='date')
+        df.columns.name = None
+        return df.sort_index()[sorted(df.columns)]
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    return df.set_index('date').sort_index() if 'code' not in df.columns else df
+
+
+def read_matrix(directory, period, start=None, end=None, codes=None):
+    """
+    读取 wide 布局的 RPS 矩阵
+
+    Parquet 中各证券为独立的列，组成二维矩阵时需要复制一次；单个数据块且无缺失位图的列
+    直接从 Arrow 缓冲区复制，不经过中间数组
+
+    返回:
+        (日期 yyyymmdd 数组, 证券代码列表（排序，与 read_frame、RpsStore.read 一致）,
+         交易日 × 证券 的 float64 矩阵)
+    """
+    if _layout(directory) != 'wide':
+        raise ValueError("read_matrix 需要 wide 布局的导出结果")
+    table = read_table(directory, period, start, end, codes)
+    if table is None:
+        return np.array([], dtype=np.int64), [], np.empty((0, 0))
+    table = table.sort_by('date')
+    dates = table.column('date').to_numpy().astype('datetime64[D]').astype(str)
+    dates = np.array([int(d.replace('-', '')) for d in dates], dtype=np.int64)
+    names = sorted(n for n in table.column_names if n != 'date')
+    matrix = np.empty((table.num_rows, len(names)))
+    for j, name in enumerate(names):
+        column = table.column(name)
+        if column.num_chunks == 1 and column.null_count == 0:
+            matrix[:, j] = column.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            # 不同年份证券不同，合并后缺少的列为 null
+            matrix[:, j] = column.to_numpy(zero_copy_only=False).astype(np.float64)
+    return dates, names, matrix
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="将 RPS 导出为 Parquet 数据集")
+    parser.add_argument('source', help="daily_rps.h5 文件或 RpsStore 目录")
+    parser.add_argument('directory', help="输出目录")
+    parser.add_argument('--layout', choices=LAYOUTS, default='long', help="long 或 wide")
+    parser.add_argument('--periods', default=None, help="逗号分隔的周期，默认全部")
+    parser.add_argument('--start', type=int, default=None, help="开始日期 yyyymmdd")
+    parser.add_argument('--end', type=int, default=None, help="结束日期 yyyymmdd")
+    args = parser.parse_args()
+
+    periods = None if args.periods is None else [int(p) for p in args.periods.split(',')]
+    paths = export_parquet(args.source, args.directory, args.layout, periods, args.start, args.end)
+    print(f"已写入 {len(paths)} 个文件到 {args.directory}")
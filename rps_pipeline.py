@@ -0,0 +1,354 @@
+import json
+import os
+import time
+import numpy as np
+import h5py
+from tqdm import tqdm
+from parallel import load_options, ensure_loaded, chunked, run_tasks
+from rps_store import RpsStore, atomic_h5, write_days, read_day
+
+# 上市满 LIST_DAYS 个自然日的股票才参与排名，有效股票少于 MIN_STOCKS 时跳过
+LIST_DAYS = 365
+MIN_STOCKS = 10
+
+# 输出布局: single 为单个 daily_rps.h5，其余为按年或按月分区的 RpsStore
+LAYOUTS = ('single', 'yearly', 'monthly')
+PARTITION_OF = {'yearly': 'year', 'monthly': 'month'}
+
+
+def _emit(stage, metrics_file=None, **fields):
+    """输出一行 JSON 格式的阶段统计，便于定时任务监控"""
+    record = {'stage': stage, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), **fields}
+    line = json.dumps(record, ensure_ascii=False)
+    print(line, flush=True)
+    if metrics_file:
+        with open(metrics_file, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    return record
+
+
+def _rate(amount, seconds):
+    return round(amount / seconds, 1) if seconds > 0 else None
+
+
+# ----------------------------------------------------------------------
+# 读取收盘价
+# ----------------------------------------------------------------------
+def load_closes(codes, start, end, lead):
+    """
+    读取 [start, end) 区间的收盘价，要求当前进程已加载数据
+
+    参数:
+        codes: 证券代码列表
+        start, end: Datetime.number
+        lead: start 之前额外读取的 K 线根数（最长 RPS 周期）
+
+    返回:
+        [(market_code, code, 上市日期 yyyymmdd, K 线日期数组, 收盘价数组), ...], K 线总根数
+        区间末尾额外保留一根 end 之后的 K 线，与 calculate_daily_rps 一样，停牌日取之后第一根 K 线
+    """
+    from hikyuu import sm, Query, Datetime
+    rows = []
+    bars = 0
+    for code in codes:
+        stk = sm[code]
+        if stk.is_null():
+            continue
+        first = stk.get_kdata(Query(0, 1))
+        if len(first) == 0:
+            continue
+        k = stk.get_kdata(Query(Datetime(start)))
+        if len(k) == 0:
+            continue
+        k_dates = np.array([d.number for d in k.get_datetime_list()], dtype=np.int64)
+        n = int(np.searchsorted(k_dates, end)) + 1
+        full = stk.get_kdata(Query(max(k.start_pos - lead, 0), k.start_pos + n))
+        dates = np.array([d.number for d in full.get_datetime_list()], dtype=np.int64)
+        closes = full.to_np()['close'].astype(np.float64)
+        rows.append((stk.market_code, stk.code, first[0].datetime.ymd, dates, closes))
+        bars += len(closes)
+    return rows, bars
+
+
+def _load_worker(task):
+    """工作进程：只加载本批证券"""
+    codes, start, end, lead = task
+    ensure_loaded(load_options(codes))
+    return load_closes(codes, start, end, lead)
+
+
+# ----------------------------------------------------------------------
+# 排名
+# ----------------------------------------------------------------------
+def _ymd_cutoff(numbers, days=LIST_DAYS):
+    """Datetime.number 往前推 days 个自然日，返回 yyyymmdd"""
+    ymd = (np.asarray(numbers, dtype=np.int64) // 10000).astype(str)
+    day = np.array([f"{s[:4]}-{s[4:6]}-{s[6:]}" for s in ymd], dtype='datetime64[D]') - np.timedelta64(days, 'D')
+    return np.array([int(str(d).replace('-', '')) for d in day], dtype=np.int64)
+
+
+def rank_block(dates, stocks, periods):
+    """
+    计算一段交易日的 RPS
+
+    参数:
+        dates: 交易日 Datetime.number 数组
+        stocks: load_closes 的结果，按证券池顺序排列（涨幅相同时按此顺序排名）
+        periods: RPS 周期列表
+
+    返回:
+        {date_number: {period: (代码数组, RPS 数组) 或 None}}，有效股票不足的日期为空字典，
+        RPS 按涨幅从高到低排列，计算方式与 calculate_daily_rps 相同
+    """
+    dates = np.asarray(dates, dtype=np.int64)
+    n_dates, n_stocks = len(dates), len(stocks)
+    codes = np.array([s[1] for s in stocks], dtype=object)
+    listed = np.array([s[2] for s in stocks], dtype=np.int64)
+    eligible = listed[None, :] <= _ymd_cutoff(dates)[:, None]
+
+    pos = np.zeros((n_dates, n_stocks), dtype=np.int64)
+    has = np.zeros((n_dates, n_stocks), dtype=bool)
+    for j, (_, _, _, k_dates, _) in enumerate(stocks):
+        p = np.searchsorted(k_dates, dates)
+        pos[:, j] = p
+        has[:, j] = p < len(k_dates)
+
+    returns = {}
+    for period in periods:
+        ret = np.full((n_dates, n_stocks), np.nan)
+        for j, (_, _, _, _, closes) in enumerate(stocks):
+            p = pos[:, j]
+            ok = has[:, j] & (p - period >= 0)
+            if not ok.any():
+                continue
+            cur = closes[p[ok]]
+            past = closes[p[ok] - period]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ret[ok, j] = np.where(past > 0, (cur / past - 1) * 100, np.nan)
+        returns[period] = ret
+
+    result = {}
+    for t, date in enumerate(dates):
+        day = {}
+        result[int(date)] = day
+        if eligible[t].sum() < MIN_STOCKS:
+            continue
+        for period in periods:
+            row = returns[period][t]
+            idx = np.flatnonzero(eligible[t] & np.isfinite(row))
+            if len(idx) < MIN_STOCKS:
+                day[period] = None
+                continue
+            order = idx[np.argsort(-row[idx], kind='stable')]
+            total = len(order)
+            day[period] = (codes[order], (total - np.arange(total)) / total * 100)
+    return result
+
+
+# ----------------------------------------------------------------------
+# 输出
+# ----------------------------------------------------------------------
+def _store(output, layout):
+    return RpsStore(output, PARTITION_OF[layout])
+
+
+def output_files(output, layout):
+    """layout 对应的输出文件列表"""
+    if layout == 'single':
+        return [output] if os.path.exists(output) else []
+    if not os.path.isdir(output):
+        return []
+    return _store(output, layout).files()
+
+
+def stored_dates(output, layout):
+    """输出中已有的日期 yyyymmdd 字符串集合"""
+    if layout != 'single':
+        return _store(output, layout).stored_dates() if os.path.isdir(output) else set()
+    if not os.path.exists(output):
+        return set()
+    with h5py.File(output, 'r') as f:
+        return set(f.keys())
+
+
+def write_block(output, layout, ranks):
+    """
+    按 calculate_daily_rps 的格式写入 rank_block 的结果；分区布局下只更新分区摘要，由调用方更新目录
+
+    参数:
+        output: single 布局下为 atomic_h5 的临时文件，分区布局下为存储目录
+
+    返回:
+        写入的 RPS 数量
+    """
+    if layout == 'single':
+        return write_days(output, sorted(ranks.items()))
+    return _store(output, layout).write(ranks, rebuild=False)
+
+
+def compare_block(output, layout, ranks, tolerance=1e-6, limit=20):
+    """
+    将重新计算的结果与输出中已保存的结果比较
+
+    返回:
+        (比较的数值个数, 不一致的数量, 不一致样例)
+    """
+    compared, mismatches, samples = 0, 0, []
+    store = None if layout == 'single' else _store(output, layout)
+    by_file = {}
+    for number, day in ranks.items():
+        path = output if store is None else store.path(store.key(number // 10000))
+        by_file.setdefault(path, []).append((number, day))
+    for path, days in by_file.items():
+        with h5py.File(path, 'r') as f:
+            for number, day in days:
+                group = f[str(number // 10000)]
+                for period, value in day.items():
+                    expected = {} if value is None else dict(zip(value[0], value[1].tolist()))
+                    stored = read_day(group, period)
+                    stored = {} if stored is None else dict(zip(stored[0].tolist(), stored[1].tolist()))
+                    for code in set(expected) | set(stored):
+                        compared += 1
+                        a, b = expected.get(code), stored.get(code)
+                        if a is None or b is None or abs(a - b) > tolerance:
+                            mismatches += 1
+                            if len(samples) < limit:
+                                samples.append({'date': number // 10000, 'period': period, 'code': code,
+                                                'expected': a, 'stored': b})
+    return compared, mismatches, samples
+
+
+def _slice_stocks(stocks, first, last, lead):
+    """截取 [first, last] 交易日排名所需的收盘价，减少传给工作进程的数据量"""
+    rows = []
+    for market_code, code, listed, dates, closes in stocks:
+        lo = max(int(np.searchsorted(dates, first)) - lead, 0)
+        hi = int(np.searchsorted(dates, last)) + 1
+        rows.append((market_code, code, listed, dates[lo:hi], closes[lo:hi]))
+    return rows
+
+
+def _rank_worker(task):
+    """排名并写入（或比较）一段交易日；分区布局下每个分区一个任务，各分区由不同进程并行写入"""
+    output, layout, dates, stocks, periods, mode = task
+    t0 = time.perf_counter()
+    block = rank_block(dates, stocks, periods)
+    rank_seconds = time.perf_counter() - t0
+    result = {'ranks': sum(len(v[0]) for day in block.values() for v in day.values() if v is not None),
+              'rank_seconds': rank_seconds, 'compared': 0, 'mismatches': 0, 'samples': []}
+    t0 = time.perf_counter()
+    if mode == 'verify':
+        result['compared'], result['mismatches'], result['samples'] = compare_block(output, layout, block)
+    else:
+        write_block(output, layout, block)
+    result['write_seconds'] = time.perf_counter() - t0
+    return result
+
+
+# ----------------------------------------------------------------------
+# 主流程
+# ----------------------------------------------------------------------
+def generate(codes, start_date, end_date, periods=(10, 20, 50, 120, 250), output='daily_rps.h5',
+             layout='single', mode='incremental', workers=None, chunk_size=300, block_days=250,
+             metrics_file=None):
+    """
+    计算每日 RPS 并写入 HDF5，要求当前进程已加载数据（用于读取交易日历）
+
+    参数:
+        codes: 证券池代码列表，顺序决定涨幅相同时的排名
+        start_date, end_date: 日期范围 [start_date, end_date), Datetime
+        periods: RPS 周期列表
+        output: 输出文件（layout='single'）或 rps_store.RpsStore 目录（layout='yearly'/'monthly'）
+        layout: 输出布局，文件内部格式与 calculate_daily_rps 相同；分区布局下各分区并行排名与写入
+        mode: 'incremental' 只计算输出中没有的交易日；'full' 重新计算并覆盖日期范围内的交易日，范围外的交易日保留；
+              'verify' 重新计算输出中已有的交易日并与已保存结果比较，不写入
+        workers: 工作进程数，0 表示在当前进程中读取与计算
+        chunk_size: 每个读取任务的证券数量
+        block_days: single 布局每次排名与写入的交易日数量，限制内存占用
+        metrics_file: 追加保存各阶段 JSON 统计的文件
+
+    返回:
+        各阶段统计列表，verify 模式下 verify 阶段的 mismatches 为不一致的数量
+    """
+    from hikyuu import get_stock, Query
+    if layout not in LAYOUTS:
+        raise ValueError(f"不支持的输出布局: {layout}，可选 {LAYOUTS}")
+    if mode not in ('incremental', 'full', 'verify'):
+        raise ValueError(f"不支持的模式: {mode}")
+    periods = sorted(set(int(p) for p in periods))
+    started = time.perf_counter()
+    stats = []
+
+    calendar = np.array([k.datetime.number for k in get_stock('sh000001').get_kdata(Query(start_date, end_date))],
+                        dtype=np.int64)
+    stored = stored_dates(output, layout) if mode != 'full' else set()
+    if mode == 'incremental':
+        todo = calendar[[str(d // 10000) not in stored for d in calendar]]
+    elif mode == 'verify':
+        todo = calendar[[str(d // 10000) in stored for d in calendar]]
+    else:
+        todo = calendar
+    stats.append(_emit('calendar', metrics_file, mode=mode, layout=layout, output=output,
+                       trading_dates=len(calendar), todo=len(todo), stocks=len(codes), periods=periods))
+    if len(todo) == 0:
+        stats.append(_emit('done', metrics_file, seconds=round(time.perf_counter() - started, 3)))
+        return stats
+
+    # 读取收盘价
+    t0 = time.perf_counter()
+    start, end = int(todo[0]), int(calendar[-1]) + 1
+    lead = max(periods)
+    if workers == 0:
+        stocks, bars = load_closes(codes, start, end, lead)
+    else:
+        order = {code: i for i, code in enumerate(codes)}
+        stocks, bars = [], 0
+        tasks = [(chunk, start, end, lead) for chunk in chunked(codes, chunk_size)]
+        for _, (rows, n) in run_tasks(_load_worker, tasks, workers, desc="读取K线"):
+            stocks.extend(rows)
+            bars += n
+        stocks.sort(key=lambda s: order.get(s[0], len(order)))
+    seconds = time.perf_counter() - t0
+    stats.append(_emit('load', metrics_file, stocks=len(stocks), bars=bars, seconds=round(seconds, 3),
+                       bars_per_s=_rate(bars, seconds), workers=workers))
+
+    # single 布局按 block_days 分段顺序写入同一个文件，分区布局每个分区一段；
+    # 写入均在临时文件上进行，完成后改名替换，读取方在更新期间始终读到上一个完整版本
+    if layout == 'single':
+        segments = [todo[i:i + block_days] for i in range(0, len(todo), block_days)]
+    else:
+        store = _store(output, layout)
+        keys = [store.key(d // 10000) for d in todo]
+        segments = [todo[np.array(keys) == key] for key in dict.fromkeys(keys)]
+    size_before = sum(os.path.getsize(p) for p in output_files(output, layout))
+
+    t0 = time.perf_counter()
+    tasks = [(output, layout, seg, _slice_stocks(stocks, seg[0], seg[-1], lead), periods, mode) for seg in segments]
+    if layout == 'single' and mode != 'verify':
+        # full 模式同样在现有文件的副本上覆盖范围内的交易日，不删除范围外的数据
+        with atomic_h5(output) as tmp:
+            results = [_rank_worker((tmp,) + task[1:]) for task in tqdm(tasks, desc="计算RPS")]
+    elif workers == 0 or layout == 'single':
+        results = [_rank_worker(task) for task in tqdm(tasks, desc="计算RPS")]
+    else:
+        results = [r for _, r in run_tasks(_rank_worker, tasks, workers, desc="计算RPS", fresh_process=False)]
+    if layout != 'single' and mode != 'verify':
+        store.rebuild_catalog()
+    wall = round(time.perf_counter() - t0, 3)
+
+    ranks = sum(r['ranks'] for r in results)
+    rank_seconds = sum(r['rank_seconds'] for r in results)
+    write_seconds = sum(r['write_seconds'] for r in results)
+    stats.append(_emit('rank', metrics_file, dates=len(todo), ranks=ranks, seconds=round(rank_seconds, 3),
+                       ranks_per_s=_rate(ranks, rank_seconds), segments=len(segments), wall_seconds=wall))
+    if mode == 'verify':
+        samples = [s for r in results for s in r['samples']][:20]
+        stats.append(_emit('verify', metrics_file, dates=len(todo), compared=sum(r['compared'] for r in results),
+                           mismatches=sum(r['mismatches'] for r in results), seconds=round(write_seconds, 3),
+                           samples=samples))
+    else:
+        mb = (sum(os.path.getsize(p) for p in output_files(output, layout)) - size_before) / 2 ** 20
+        stats.append(_emit('write', metrics_file, dates=len(todo), mb=round(mb, 3), seconds=round(write_seconds, 3),
+                           mb_per_s=_rate(mb, write_seconds), segments=len(segments), wall_seconds=wall))
+    stats.append(_emit('done', metrics_file, seconds=round(time.perf_counter() - started, 3)))
+    return stats
@@ -0,0 +1,347 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+import weakref
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from rps_store import read_rps
+from panel import Panel
+
+SOCKET_PATH = '/tmp/sxhcg_rps.sock'
+DEFAULT_PERIODS = (10, 20, 50, 120, 250)
+
+
+def _shared_memory(name=None, create=False, size=0, track=True):
+    """
+    创建或连接共享内存块；track=False 时不由本进程的 resource_tracker 回收，
+    避免进程退出时删除仍由服务端或其他客户端使用的共享内存
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=track)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        if not track:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _number(date):
+    """yyyymmdd 或 Datetime.number 统一为 Datetime.number"""
+    date = int(date)
+    return date if date > 99999999 else date * 10000
+
+
+def _share(values, track=True):
+    """复制数组到新的共享内存块，返回 (共享内存, 指向共享内存的数组)"""
+    shm = _shared_memory(f"sxhcg_{uuid.uuid4().hex[:16]}", create=True, size=max(values.nbytes, 1), track=track)
+    array = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+    array[...] = values
+    return shm, array
+
+
+class _Item:
+    """共享内存中的一个 交易日 × 证券 矩阵，dates 为 Datetime.number，与 panel.Panel 一致"""
+
+    def __init__(self, dates, codes, values):
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.codes = list(codes)
+        self.shm, self.values = _share(np.ascontiguousarray(values, dtype=np.float64))
+        self.code_index = {c: j for j, c in enumerate(self.codes)}
+
+    def describe(self):
+        return {'shm': self.shm.name, 'shape': list(self.values.shape), 'dtype': str(self.values.dtype),
+                'dates': self.dates.tolist(), 'codes': self.codes}
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class RpsServer:
+    """
+    本机 RPS/面板查询服务
+
+    RPS 与收盘价面板只加载一次，以 交易日 × 证券 矩阵放在共享内存中，通过 Unix socket 按行分隔的 JSON 请求查询：
+        {'op': 'info'}                                         各数据项的日期与证券
+        {'op': 'get', 'item': 'RPS10', 'start', 'end', 'codes'} 按日期范围与证券查询
+        {'op': 'top', 'date', 'periods', 'top_n', 'weighted'}   同 RPS_generator.get_top_rps_stocks
+        {'op': 'reload'}                                       重新读取 RPS（如每日更新后）
+
+    不指定证券时结果为原矩阵的连续行，客户端直接映射服务端的共享内存，不复制；
+    指定证券时结果复制到新的共享内存块，由客户端映射后删除
+    """
+
+    def __init__(self, source, periods=DEFAULT_PERIODS, socket_path=SOCKET_PATH):
+        self.source = source
+        self.periods = [int(p) for p in periods]
+        self.socket_path = socket_path
+        self.items = {}
+        self.version = 0
+        self._lock = threading.Lock()
+        self.reload()
+
+    # ------------------------------------------------------------------
+    # 数据
+    # ------------------------------------------------------------------
+    def reload(self):
+        """重新读取 RPS，旧的共享内存块删除后已映射的客户端仍可继续使用"""
+        # 收盘价等面板不随 RPS 更新，保留原有的共享内存块
+        items = {k: v for k, v in self.items.items() if not k.startswith('RPS')}
+        for period in self.periods:
+            df = read_rps(self.source, period)
+            if len(df) == 0:
+                continue
+            dates = np.array(df.index.strftime('%Y%m%d').astype(int), dtype=np.int64) * 10000
+            items[f'RPS{period}'] = _Item(dates, df.columns.tolist(), df.to_numpy(dtype=np.float64))
+        self._replace(items, keep=True)
+        print(f"已加载 {self.source}: {', '.join(items)}")
+
+    def _signature(self):
+        # 写入方以改名方式替换文件（rps_store.atomic_h5），文件或 catalog.json 的 inode 与修改时间变化即有新版本
+        path = os.path.join(self.source, 'catalog.json') if os.path.isdir(self.source) else self.source
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def watch(self, interval=60):
+        """后台线程每 interval 秒检查一次数据源，有新版本时重新读取；读取期间继续使用旧版本回答查询"""
+        def run():
+            signature = self._signature()
+            while True:
+                time.sleep(interval)
+                current = self._signature()
+                if current is not None and current != signature:
+                    signature = current
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        print(f"重新读取 {self.source} 出错: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def add_panel(self, name, panel):
+        """
+        添加 panel.Panel 面板，如 kdata_panel(...)['close']
+
+        参数:
+            name: 数据项名称
+            panel: Panel，dates 为 Datetime.number
+        """
+        item = _Item(panel.dates, panel.codes, panel.values)
+        self._replace({**self.items, name: item}, keep=True)
+
+    def _replace(self, items, keep=False):
+        with self._lock:
+            old = self.items
+            self.items = items
+            self.version += 1
+        for name, item in old.items():
+            if not keep or items.get(name) is not item:
+                item.release()
+
+    def close(self):
+        self._replace({})
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def _get(self, request):
+        item = self.items[request['item']]
+        start, end = request.get('start'), request.get('end')
+        lo = 0 if start is None else int(np.searchsorted(item.dates, _number(start)))
+        hi = len(item.dates) if end is None else int(np.searchsorted(item.dates, _number(end), side='right'))
+        codes = request.get('codes')
+        if codes is None:
+            return {'shm': item.shm.name, 'shape': list(item.values.shape), 'rows': [lo, hi], 'owner': False}
+        cols = [item.code_index[c] for c in codes if c in item.code_index]
+        # 结果块交给客户端删除，服务端不回收，只关闭自己的映射
+        shm, _ = _share(item.values[lo:hi, cols], track=False)
+        shm.close()
+        return {'shm': shm.name, 'shape': [hi - lo, len(cols)], 'rows': [lo, hi], 'cols': cols, 'owner': True}
+
+    def _top(self, request):
+        periods = request.get('periods') or self.periods
+        date = _number(request['date'])
+        weighted = request.get('weighted', True)
+        total, weight_sum, codes = None, 0.0, None
+        for period in periods:
+            item = self.items[f'RPS{period}']
+            i = int(np.searchsorted(item.dates, date))
+            if i >= len(item.dates) or item.dates[i] != date:
+                return {'top': []}
+            if codes is None:
+                codes = item.codes
+            row = item.values[i] if item.codes == codes else \
+                np.array([item.values[i, item.code_index[c]] if c in item.code_index else np.nan for c in codes])
+            weight = 1 / period if weighted else 1.0
+            total = row * weight if total is None else total + row * weight
+            weight_sum += weight
+        score = total / weight_sum if weighted else total
+        # 与 get_top_rps_stocks 一样，只保留所有周期都有 RPS 的股票
+        valid = np.flatnonzero(np.isfinite(score))
+        order = valid[np.argsort(-score[valid], kind='stable')][:int(request.get('top_n', 5))]
+        return {'top': [[codes[j], float(score[j])] for j in order]}
+
+    def handle(self, request):
+        op = request.get('op')
+        with self._lock:
+            if op == 'info':
+                return {'version': self.version, 'items': {k: v.describe() for k, v in self.items.items()}}
+            if op == 'get':
+                return {'version': self.version, **self._get(request)}
+            if op == 'top':
+                return self._top(request)
+        if op == 'reload':
+            self.reload()
+            return {'version': self.version}
+        raise ValueError(f"不支持的请求: {op}")
+
+    # ------------------------------------------------------------------
+    # 服务
+    # ------------------------------------------------------------------
+    def serve_forever(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        response = server.handle(json.loads(line))
+                    except Exception as e:
+                        response = {'error': f"{type(e).__name__}: {e}"}
+                    self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, Handler) as unix_server:
+            unix_server.daemon_threads = True
+            print(f"RPS 查询服务已启动: {self.socket_path}")
+            try:
+                unix_server.serve_forever()
+            finally:
+                self.close()
+                os.remove(self.socket_path)
+
+
+class RpsClient:
+    """
+    RPS 查询服务的客户端，查询结果直接映射共享内存
+
+    示例:
+        client = RpsClient()
+        rps10 = client.rps(10, start=20240101)   # Panel
+        df = rps10.to_dataframe()
+        client.top(20250320, top_n=5)
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+        self._file = self._sock.makefile('rwb')
+        self._info = None
+
+    def _request(self, **request):
+        self._file.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def info(self, refresh=False):
+        if refresh or self._info is None:
+            self._info = self._request(op='info')
+        return self._info
+
+    def items(self):
+        return list(self.info()['items'])
+
+    def _map(self, name, shape, owner):
+        shm = _shared_memory(name, track=owner)
+        if owner:
+            # 结果块只由本客户端使用，映射后即可删除名称，内存在映射关闭后释放
+            shm.unlink()
+        values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        # 映射随返回的数组（及其切片视图）一起释放，不在客户端中累积
+        weakref.finalize(values, shm.close)
+        return values
+
+    def get(self, item, start=None, end=None, codes=None):
+        """
+        查询数据项
+
+        参数:
+            item: 'RPS10' 等 RPS 周期或服务端添加的面板名称
+            start, end: yyyymmdd 或 Datetime.number，闭区间，None 表示不限
+            codes: 证券代码列表，None 表示全部（不复制数据）
+
+        返回:
+            Panel，values 为共享内存上的只读视图
+        """
+        for retry in (True, False):
+            response = self._request(op='get', item=item, start=start, end=end,
+                                     codes=None if codes is None else list(codes))
+            if response['version'] != self.info()['version']:
+                self.info(refresh=True)
+            try:
+                values = self._map(response['shm'], response['shape'], response['owner'])
+                break
+            except FileNotFoundError:
+                # 查询与 reload 同时发生，旧的共享内存块已删除，重新查询
+                if not retry:
+                    raise
+        meta = self.info()['items'][item]
+        lo, hi = response['rows']
+        if not response['owner']:
+            values = values[lo:hi]
+        values.flags.writeable = False
+        cols = response.get('cols')
+        codes = meta['codes'] if cols is None else [meta['codes'][j] for j in cols]
+        return Panel(meta['dates'][lo:hi], codes, values)
+
+    def rps(self, period, start=None, end=None, codes=None):
+        return self.get(f'RPS{period}', start, end, codes)
+
+    def top(self, date, periods=None, top_n=5, weighted=True):
+        """同 RPS_generator.get_top_rps_stocks，返回 [(代码, RPS 加权和), ...]"""
+        response = self._request(op='top', date=int(date), periods=periods, top_n=top_n, weighted=weighted)
+        return [tuple(row) for row in response['top']]
+
+    def reload(self):
+        self._request(op='reload')
+        self.info(refresh=True)
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="本机 RPS/面板查询服务")
+    parser.add_argument('--source', default='daily_rps.h5', help="daily_rps.h5 文件或 RpsStore 目录")
+    parser.add_argument('--periods', default=','.join(map(str, DEFAULT_PERIODS)), help="逗号分隔的 RPS 周期")
+    parser.add_argument('--socket', default=SOCKET_PATH, help="Unix socket 路径")
+    parser.add_argument('--close-pool', default=None,
+                        help="同时加载该证券池的收盘价面板，格式同 RPS_generator --pool")
+    parser.add_argument('--close-start', default='2020-01-01', help="收盘价面板开始日期")
+    parser.add_argument('--watch', type=int, default=0, help="每隔若干秒检查数据源，有新版本时自动重新读取，0 表示不检查")
+    args = parser.parse_args()
+
+    rps_server = RpsServer(args.source, [int(p) for p in args.periods.split(',')], args.socket)
+    if args.close_pool:
+        from hikyuu.interactive import sm, Query, Datetime
+        from RPS_generator import resolve_pool
+        from panel import kdata_panel
+        stks = [sm[code] for code in resolve_pool(args.close_pool)]
+        rps_server.add_panel('close', kdata_panel(stks, Query(Datetime(args.close_start)), fields=('close',))['close'])
+    if args.watch > 0:
+        rps_server.watch(args.watch)
+    rps_server.serve_forever()
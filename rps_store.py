@@ -0,0 +1,539 @@
+import contextlib
+import glob
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import h5py
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+CATALOG_FILE = 'catalog.json'
+ARCHIVE_DIR = 'archive'
+PARTITIONS = ('year', 'month')
+
+
+def _lock(lock):
+    """对已打开的锁文件加排他锁，fcntl 不可用时（Windows）使用 msvcrt 锁定首字节"""
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return
+    lock.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+def _unlock(lock):
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    else:
+        lock.seek(0)
+        msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _replace(src, dst, timeout):
+    """
+    os.replace，Windows 上目标文件被读取方打开时替换会失败，在 timeout 秒内重试，仍失败时抛出 OSError
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError as e:
+            if time.monotonic() >= deadline:
+                raise OSError(f"{dst} 被其他进程占用，{timeout} 秒内无法替换") from e
+            time.sleep(0.1)
+
+
+@contextlib.contextmanager
+def atomic_h5(path, copy=True, replace_timeout=30):
+    """
+    以先写临时文件再改名的方式修改 HDF5 文件
+
+    写入方在临时文件上修改，完成并落盘后一次性替换 path。读取方无需加锁：改名前打开的读取方继续读取旧版本，
+    改名后打开的读取方读取新版本，任何时刻都不会看到写了一半的文件，也不会被写入方的 HDF5 文件锁阻塞。
+    写入方之间通过 path.lock 文件互斥（fcntl 或 Windows 的 msvcrt），避免两个写入方各自基于旧版本修改而丢失数据。
+    Windows 上读取方打开文件期间无法替换，写入方会重试至 replace_timeout 秒
+
+    copy=True 时每次修改都要复制整个文件，成本与文件大小成正比；多年的单文件 daily_rps.h5 每日增量
+    也要复制全部历史，数据量较大时应使用按年或按月分区的 RpsStore，每次只复制一个分区
+
+    参数:
+        path: 目标文件
+        copy: 是否先复制现有文件（增量修改）；False 时在空文件上写入（整体重建）
+        replace_timeout: 替换目标文件失败时的重试时间（秒）
+
+    用法:
+        with atomic_h5('daily_rps.h5') as tmp:
+            with h5py.File(tmp, 'a') as f:
+                ...
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        _lock(lock)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            if copy and os.path.exists(path):
+                shutil.copyfile(path, tmp)
+            yield tmp
+            if os.path.exists(tmp):
+                with open(tmp, 'rb+') as f:
+                    os.fsync(f.fileno())
+                _replace(tmp, path, replace_timeout)
+                if hasattr(os, 'O_DIRECTORY'):
+                    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            _unlock(lock)
+
+
+def write_days(path, days):
+    """
+    按 daily_rps.h5 的格式写入：每个交易日一个组，每个周期一个 (代码, RPS) 字符串数据集；
+    直接修改 path，有读取方时应在 atomic_h5 的临时文件上调用
+
+    参数:
+        path: HDF5 文件
+        days: [(date_number, {period: (代码数组, RPS 数组) 或 None}), ...]，即 rps_pipeline.rank_block 的结果
+
+    返回:
+        写入的 RPS 数量
+    """
+    written = 0
+    str_dtype = h5py.special_dtype(vlen=str)
+    with h5py.File(path, 'a') as f:
+        for number, day in days:
+            name = str(number // 10000)
+            if name in f:
+                del f[name]
+            group = f.create_group(name)
+            for period, value in day.items():
+                if value is None:
+                    continue
+                codes, rps = value
+                data = np.empty((len(codes), 2), dtype=object)
+                data[:, 0] = codes
+                data[:, 1] = [str(v) for v in rps.tolist()]
+                group.create_dataset(f'RPS{period}', data=data, dtype=str_dtype)
+                written += len(codes)
+    return written
+
+
+def read_day(group, period):
+    """
+    读取一个交易日组中某个周期的 RPS
+
+    返回:
+        (代码数组, RPS 数组)，没有该周期时返回 None
+    """
+    key = f'RPS{period}'
+    if key not in group:
+        return None
+    data = group[key].asstr()[()]
+    if len(data) == 0:
+        return np.array([], dtype=object), np.array([], dtype=np.float64)
+    return data[:, 0], data[:, 1].astype(np.float64)
+
+
+def read_files(paths, period, start=None, end=None, codes=None):
+    """
+    读取若干 daily_rps.h5 格式文件中日期范围内某一周期的 RPS
+
+    返回:
+        DataFrame，索引为日期，列为证券代码
+    """
+    keep = None if codes is None else set(codes)
+    rows = {}
+    for path in paths:
+        with h5py.File(path, 'r') as f:
+            for name in sorted(f.keys()):
+                ymd = int(name)
+                if (start is not None and ymd < int(start)) or (end is not None and ymd > int(end)):
+                    continue
+                value = read_day(f[name], period)
+                if value is None:
+                    continue
+                day_codes, rps = value
+                if keep is not None:
+                    mask = np.fromiter((c in keep for c in day_codes), dtype=bool, count=len(day_codes))
+                    day_codes, rps = day_codes[mask], rps[mask]
+                rows[ymd] = pd.Series(rps, index=day_codes)
+    df = pd.DataFrame.from_dict(rows, orient='index')
+    if len(df) == 0:
+        return df
+    df = df.sort_index()
+    df.index = pd.to_datetime(df.index.astype(str), format='%Y%m%d')
+    df.index.name = 'date'
+    return df[sorted(df.columns)]
+
+
+def read_rps(source, period, start=None, end=None, codes=None):
+    """
+    读取单个 daily_rps.h5 或 RpsStore 目录中某一周期的 RPS
+
+    返回:
+        DataFrame，索引为日期，列为证券代码
+    """
+    if os.path.isdir(source):
+        return RpsStore(source).read(period, start, end, codes)
+    return read_files([source], period, start, end, codes)
+
+
+class RpsStore:
+    """
+    按日期分区的 RPS 存储
+
+    目录结构:
+        root/{yyyy}.h5 或 root/{yyyymm}.h5  分区文件，内部格式与 daily_rps.h5 相同，可直接用现有函数读取
+        root/{key}.json                     分区摘要：交易日、周期、证券代码、文件大小
+        root/catalog.json                   全部分区摘要的汇总，读取时据此按日期范围与证券裁剪分区
+        root/archive/                       已归档的分区及其摘要
+
+    每个分区只由一个进程写入，写入后只更新自己的摘要，因此各分区可以并行写入；
+    汇总目录由 rebuild_catalog 合并各分区摘要生成
+    """
+
+    def __init__(self, root, partition=None):
+        self.root = root
+        catalog = self._read_catalog()
+        stored = catalog.get('partition') if catalog else None
+        if partition is None:
+            partition = stored or 'year'
+        if partition not in PARTITIONS:
+            raise ValueError(f"不支持的分区方式: {partition}，可选 {PARTITIONS}")
+        if stored is not None and stored != partition:
+            raise ValueError(f"{root} 已按 {stored} 分区，不能按 {partition} 写入")
+        self.partition = partition
+        self._catalog = catalog
+
+    # ------------------------------------------------------------------
+    # 分区与路径
+    # ------------------------------------------------------------------
+    def key(self, ymd):
+        """yyyymmdd 所属的分区名"""
+        ymd = int(ymd)
+        return str(ymd // 10000) if self.partition == 'year' else str(ymd // 100)
+
+    def _summary_file(self, key, archived=False):
+        directory = os.path.join(self.root, ARCHIVE_DIR) if archived else self.root
+        return os.path.join(directory, f"{key}.json")
+
+    def _read_summary(self, key):
+        for archived in (False, True):
+            path = self._summary_file(key, archived)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        return None
+
+    def path(self, key):
+        """分区文件路径，已归档的分区返回归档目录中的文件"""
+        summary = self._read_summary(key)
+        if summary is not None:
+            return os.path.join(self.root, summary['file'])
+        return os.path.join(self.root, f"{key}.h5")
+
+    @staticmethod
+    def _dump(path, obj):
+        # 先写临时文件再改名，读取方不会看到写了一半的 JSON
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ------------------------------------------------------------------
+    # 目录
+    # ------------------------------------------------------------------
+    def _read_catalog(self):
+        path = os.path.join(self.root, CATALOG_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def rebuild_catalog(self):
+        """合并各分区摘要生成 catalog.json"""
+        parts = {}
+        for directory in (self.root, os.path.join(self.root, ARCHIVE_DIR)):
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                key = os.path.splitext(os.path.basename(path))[0]
+                if not key.isdigit():
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    parts[key] = json.load(f)
+        os.makedirs(self.root, exist_ok=True)
+        self._catalog = {'partition': self.partition, 'parts': dict(sorted(parts.items()))}
+        self._dump(os.path.join(self.root, CATALOG_FILE), self._catalog)
+        return self._catalog
+
+    def catalog(self, refresh=False):
+        """
+        分区目录
+
+        返回:
+            {'partition': 'year', 'parts': {key: 摘要}}，摘要包含 file, start, end, dates, periods, codes, bytes, archived
+        """
+        if refresh or self._catalog is None:
+            self._catalog = self._read_catalog() or self.rebuild_catalog()
+        return self._catalog
+
+    def stored_dates(self):
+        """已保存的交易日 yyyymmdd 字符串集合"""
+        return {str(d) for part in self.catalog(refresh=True)['parts'].values() for d in part['dates']}
+
+    def files(self):
+        return [os.path.join(self.root, part['file']) for part in self.catalog(refresh=True)['parts'].values()]
+
+    def partitions(self, start=None, end=None, codes=None, period=None):
+        """
+        按日期范围、证券与周期裁剪后需要读取的分区
+
+        参数:
+            start, end: yyyymmdd，闭区间，None 表示不限
+            codes: 证券代码列表，与分区内证券没有交集的分区被跳过
+            period: RPS 周期
+
+        返回:
+            分区名列表
+        """
+        codes = None if codes is None else set(codes)
+        keys = []
+        for key, part in self.catalog()['parts'].items():
+            if part['end'] is None:
+                # 没有交易日的空分区
+                continue
+            if start is not None and part['end'] < int(start):
+                continue
+            if end is not None and part['start'] > int(end):
+                continue
+            if period is not None and int(period) not in part['periods']:
+                continue
+            if codes is not None and codes.isdisjoint(part['codes']):
+                continue
+            keys.append(key)
+        return keys
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def _update_summary(self, key):
+        """由分区文件的实际内容重新生成分区摘要"""
+        summary = self._read_summary(key)
+        file = summary['file'] if summary is not None else f"{key}.h5"
+        path = os.path.join(self.root, file)
+        dates, codes, periods = [], set(), set()
+        with h5py.File(path, 'r') as f:
+            for name in f.keys():
+                dates.append(int(name))
+                for ds in f[name].keys():
+                    periods.add(int(ds[3:]))
+                    if len(f[name][ds]):
+                        codes.update(f[name][ds].asstr()[:, 0].tolist())
+        dates.sort()
+        summary = {'file': file, 'dates': dates, 'codes': sorted(codes), 'periods': sorted(periods),
+                   'archived': file.startswith(ARCHIVE_DIR), 'start': dates[0] if dates else None,
+                   'end': dates[-1] if dates else None, 'bytes': os.path.getsize(path)}
+        self._dump(self._summary_file(key, summary['archived']), summary)
+        return summary
+
+    def write(self, ranks, rebuild=True):
+        """
+        写入 rps_pipeline.rank_block 的结果，各交易日写入所属分区，只覆盖 ranks 中的交易日
+
+        参数:
+            ranks: {date_number: {period: (代码数组, RPS 数组) 或 None}}
+            rebuild: 是否在写入后更新 catalog.json；并行写入时由调度方统一更新
+
+        返回:
+            写入的 RPS 数量
+        """
+        os.makedirs(self.root, exist_ok=True)
+        by_key = {}
+        for number, day in sorted(ranks.items()):
+            by_key.setdefault(self.key(number // 10000), []).append((number, day))
+        written = 0
+        for key, days in by_key.items():
+            with atomic_h5(self.path(key)) as tmp:
+                written += write_days(tmp, days)
+            self._update_summary(key)
+        if rebuild:
+            self.rebuild_catalog()
+        return written
+
+    def drop(self, keys, rebuild=True):
+        """删除分区"""
+        for key in keys:
+            summary = self._read_summary(key)
+            path = self.path(key)
+            if os.path.exists(path):
+                os.remove(path)
+            if summary is not None:
+                os.remove(self._summary_file(key, summary['archived']))
+        if rebuild:
+            self.rebuild_catalog()
+
+    def import_file(self, h5_file):
+        """
+        将单个 daily_rps.h5 按分区拆分导入
+
+        返回:
+            导入的交易日数量
+        """
+        os.makedirs(self.root, exist_ok=True)
+        count = 0
+        with h5py.File(h5_file, 'r') as src:
+            by_key = {}
+            for name in sorted(src.keys()):
+                by_key.setdefault(self.key(name), []).append(name)
+            for key, names in by_key.items():
+                with atomic_h5(self.path(key)) as tmp, h5py.File(tmp, 'a') as dst:
+                    for name in names:
+                        if name in dst:
+                            del dst[name]
+                        src.copy(src[name], dst, name)
+                self._update_summary(key)
+                count += len(names)
+        self.rebuild_catalog()
+        return count
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def load(self, date, period):
+        """
+        读取某一交易日某一周期的 RPS，用法同 RPS_generator.load_rps_data
+
+        返回:
+            {代码: RPS}
+        """
+        ymd = str(int(date))
+        key = self.key(ymd)
+        if key not in self.catalog()['parts']:
+            return {}
+        with h5py.File(self.path(key), 'r') as f:
+            if ymd not in f:
+                return {}
+            value = read_day(f[ymd], period)
+        return {} if value is None else dict(zip(value[0].tolist(), value[1].tolist()))
+
+    def read(self, period, start=None, end=None, codes=None):
+        """
+        读取日期范围内某一周期的 RPS，只打开与查询范围相交的分区
+
+        参数:
+            period: RPS 周期
+            start, end: yyyymmdd，闭区间，None 表示不限
+            codes: 只保留这些证券，None 表示全部
+
+        返回:
+            DataFrame，索引为日期，列为证券代码
+        """
+        return read_files([self.path(key) for key in self.partitions(start, end, codes, period)],
+                          period, start, end, codes)
+
+    # ------------------------------------------------------------------
+    # 整理与归档
+    # ------------------------------------------------------------------
+    def compact(self, key, compression=None, archive=False):
+        """
+        重写分区文件，回收覆盖写入留下的空间
+
+        参数:
+            key: 分区名
+            compression: 数据集压缩方式，如 'gzip'；变长字符串无法压缩，压缩时 (代码, RPS) 改存为定长字节串，
+                         read_day 与原有读取代码（按 bytes 解码）均可读取
+            archive: 是否移入归档目录
+
+        返回:
+            (原大小, 新大小) 字节数
+        """
+        summary = self._read_summary(key)
+        if summary is None:
+            raise ValueError(f"分区 {key} 不存在")
+        src_path = os.path.join(self.root, summary['file'])
+        file = os.path.join(ARCHIVE_DIR, f"{key}.h5") if archive or summary['archived'] else f"{key}.h5"
+        dst_path = os.path.join(self.root, file)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        before = os.path.getsize(src_path)
+        with atomic_h5(dst_path, copy=False) as tmp:
+            with h5py.File(src_path, 'r') as src, h5py.File(tmp, 'w') as dst:
+                for name in src.keys():
+                    group = dst.create_group(name)
+                    for ds in src[name].keys():
+                        data = src[name][ds]
+                        if compression is not None and h5py.check_string_dtype(data.dtype) is not None:
+                            # 变长字符串只压缩指向堆的引用，文件反而变大，改为定长字节串后再压缩
+                            values = np.char.encode(data.asstr()[()].astype(str), 'ascii')
+                            group.create_dataset(ds, data=values, compression=compression)
+                        else:
+                            group.create_dataset(ds, data=data[()], dtype=data.dtype, compression=compression)
+        old_summary = self._summary_file(key, summary['archived'])
+        summary['file'] = file
+        summary['archived'] = file.startswith(ARCHIVE_DIR)
+        summary['bytes'] = os.path.getsize(dst_path)
+        # 先发布新位置再删除旧文件，读取方总能找到完整的分区
+        self._dump(self._summary_file(key, summary['archived']), summary)
+        self.rebuild_catalog()
+        if dst_path != src_path:
+            os.remove(old_summary)
+            os.remove(src_path)
+        return before, summary['bytes']
+
+    def archive(self, before, compression='gzip'):
+        """
+        将结束日期早于 before (yyyymmdd) 的分区压缩后移入归档目录，归档的分区仍可正常读取
+
+        返回:
+            归档的分区名列表
+        """
+        keys = [key for key, part in self.catalog(refresh=True)['parts'].items()
+                if not part['archived'] and part['end'] is not None and part['end'] < int(before)]
+        for key in keys:
+            self.compact(key, compression, archive=True)
+        return keys
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="RPS 分区存储维护")
+    parser.add_argument('root', help="存储目录")
+    parser.add_argument('--partition', choices=PARTITIONS, default=None, help="分区方式，新建存储时默认按年")
+    parser.add_argument('--import-file', default=None, help="将单个 daily_rps.h5 拆分导入")
+    parser.add_argument('--compact', default=None, help="逗号分隔的分区名，重写以回收空间")
+    parser.add_argument('--archive-before', type=int, default=None, help="归档结束日期早于该日 (yyyymmdd) 的分区")
+    args = parser.parse_args()
+
+    store = RpsStore(args.root, args.partition)
+    if args.import_file:
+        print(f"已导入 {store.import_file(args.import_file)} 个交易日")
+    if args.compact:
+        for key in args.compact.split(','):
+            before, after = store.compact(key)
+            print(f"{key}: {before / 2 ** 20:.1f}MB -> {after / 2 ** 20:.1f}MB")
+    if args.archive_before:
+        print(f"已归档: {store.archive(args.archive_before)}")
+    for key, part in store.catalog(refresh=True)['parts'].items():
+        flag = ' (已归档)' if part['archived'] else ''
+        print(f"{key}: {part['start']} - {part['end']}, {len(part['dates'])} 个交易日, "
+              f"{len(part['codes'])} 只股票, RPS{part['periods']}, {part['bytes'] / 2 ** 20:.1f}MB{flag}")
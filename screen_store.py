@@ -0,0 +1,187 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from selection import SelectionMatrix
+
+
+class ScreenStore:
+    """
+    选股结果存储，按 (选股名称, 参数, 日期) 保存每日命中结果
+
+    目录结构:
+        root/{name}-{参数哈希}/meta.json      选股名称与参数
+        root/{name}-{参数哈希}/{yyyymmdd}.npz 当日命中的证券、得分及触发的条件
+
+    每天只需追加当日结果，新进、退出与连续命中天数直接由已保存的结果计算，无需重算历史
+    """
+
+    def __init__(self, name, params=None, root='.screen_store'):
+        self.name = name
+        self.params = params or {}
+        key = json.dumps([name, self.params], sort_keys=True, ensure_ascii=False)
+        self.directory = os.path.join(root, f"{name}-{hashlib.md5(key.encode('utf-8')).hexdigest()[:8]}")
+        os.makedirs(self.directory, exist_ok=True)
+        meta_file = os.path.join(self.directory, 'meta.json')
+        if not os.path.exists(meta_file):
+            with open(meta_file, 'w', encoding='utf-8') as f:
+                json.dump({'name': name, 'params': self.params}, f, ensure_ascii=False)
+        self._cache = None
+
+    @staticmethod
+    def _ymd(date):
+        """Datetime、Datetime.number 或 yyyymmdd 统一转换为 yyyymmdd"""
+        if hasattr(date, 'ymd'):
+            return int(date.ymd)
+        date = int(date)
+        return date // 10000 if date > 99999999 else date
+
+    def _file(self, ymd):
+        return os.path.join(self.directory, f"{ymd}.npz")
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def record(self, date, codes, scores=None, conditions=None, overwrite=False):
+        """
+        保存 date 当日的选股结果
+
+        参数:
+            date: 选股日期
+            codes: 命中的证券代码
+            scores: 与 codes 对应的得分
+            conditions: {条件名称: 与 codes 对应的布尔数组}，记录各证券触发了哪些条件
+            overwrite: 当日已有结果时是否覆盖
+
+        返回:
+            是否写入
+        """
+        ymd = self._ymd(date)
+        path = self._file(ymd)
+        if os.path.exists(path) and not overwrite:
+            return False
+        codes = np.array([c.upper() for c in codes], dtype='U8')
+        order = np.argsort(codes)
+        arrays = {'codes': codes[order]}
+        scores = np.ones(len(codes)) if scores is None else np.asarray(scores, dtype=np.float64)
+        arrays['scores'] = scores[order]
+        for cond, values in (conditions or {}).items():
+            arrays[f'cond_{cond}'] = np.asarray(values, dtype=bool)[order]
+        # 先写临时文件再改名，中断时不会留下不完整的结果
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+        self._cache = None
+        return True
+
+    def record_frame(self, df, overwrite=False):
+        """
+        保存 screener.screen 返回的 DataFrame（code, date, value），可包含多个日期，
+        其余布尔列作为条件保存
+        """
+        written = 0
+        cond_cols = [c for c in df.columns if c not in ('code', 'date', 'value') and df[c].dtype == bool]
+        for date, group in df.groupby('date'):
+            conditions = {c: group[c].to_numpy() for c in cond_cols}
+            written += self.record(date, group['code'].tolist(), group['value'].to_numpy(), conditions, overwrite)
+        return written
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def dates(self):
+        """已保存的日期列表 yyyymmdd"""
+        names = [os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(self.directory, '*.npz'))]
+        return sorted(int(n) for n in names if n.isdigit())
+
+    def has(self, date):
+        return os.path.exists(self._file(self._ymd(date)))
+
+    def load(self, date):
+        """
+        date 当日的结果
+
+        返回:
+            DataFrame: code, score 及各条件列，当日无记录时返回 None
+        """
+        path = self._file(self._ymd(date))
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            df = pd.DataFrame({'code': data['codes'], 'score': data['scores']})
+            for key in data.files:
+                if key.startswith('cond_'):
+                    df[key[5:]] = data[key]
+        return df
+
+    def matrix(self):
+        """
+        全部已保存结果组成的选股矩阵，dates 为 yyyymmdd，结果在进程内缓存直到下一次写入
+
+        返回:
+            SelectionMatrix
+        """
+        if self._cache is None:
+            dates = self.dates()
+            days = []
+            for ymd in dates:
+                with np.load(self._file(ymd)) as data:
+                    days.append((data['codes'], data['scores']))
+            codes = np.unique(np.concatenate([d[0] for d in days])) if days else np.array([], dtype='U8')
+            selected = np.zeros((len(dates), len(codes)), dtype=bool)
+            scores = np.full((len(dates), len(codes)), np.nan)
+            for i, (day_codes, day_scores) in enumerate(days):
+                cols = np.searchsorted(codes, day_codes)
+                selected[i, cols] = True
+                scores[i, cols] = day_scores
+            self._cache = SelectionMatrix(np.array(dates, dtype=np.int64), codes.tolist(), selected, scores)
+        return self._cache
+
+    def _row(self, date):
+        m = self.matrix()
+        ymd = self._ymd(date)
+        i = int(np.searchsorted(m.dates, ymd))
+        if i >= len(m.dates) or m.dates[i] != ymd:
+            raise ValueError(f"没有 {ymd} 的选股结果")
+        return m, i
+
+    # ------------------------------------------------------------------
+    # 日间变化
+    # ------------------------------------------------------------------
+    def new_entries(self, date):
+        """date 当日命中而上一个已保存日期未命中的证券"""
+        m, i = self._row(date)
+        prev = m.selected[i - 1] if i > 0 else np.zeros(len(m.codes), dtype=bool)
+        return [m.codes[j] for j in np.flatnonzero(m.selected[i] & ~prev)]
+
+    def exits(self, date):
+        """上一个已保存日期命中而 date 当日未命中的证券"""
+        m, i = self._row(date)
+        if i == 0:
+            return []
+        return [m.codes[j] for j in np.flatnonzero(m.selected[i - 1] & ~m.selected[i])]
+
+    def streaks(self, date=None):
+        """
+        截至 date（默认最新）各命中证券的连续命中天数（按已保存的日期计）
+
+        返回:
+            Series，以证券代码为索引，按天数降序排列
+        """
+        m = self.matrix()
+        if len(m.dates) == 0:
+            return pd.Series(dtype=np.int64)
+        i = len(m.dates) - 1 if date is None else self._row(date)[1]
+        history = m.selected[:i + 1][::-1]
+        # 从 date 向前累乘，遇到第一个未命中即归零
+        lengths = np.cumprod(history, axis=0).sum(axis=0)
+        hit = lengths > 0
+        return pd.Series(lengths[hit], index=np.asarray(m.codes)[hit], name='streak').sort_values(ascending=False)
+
+    def changes(self, date):
+        """date 当日的新进、退出与持续命中汇总"""
+        streaks = self.streaks(date)
+        return {'new': self.new_entries(date), 'exit': self.exits(date),
+                'hold': streaks[streaks > 1].index.tolist()}
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+from parallel import ensure_loaded, stock_codes, chunked, run_tasks
+from lookback import part_lookback, minimal_options, measure_lookback
+
+
+def _tail_kdata(stk, bars, date=None, ktype='DAY'):
+    """
+    取最后 bars 根 K 线；指定 date 时取截至 date（含）的 bars 根，date 当日无数据（停牌等）时返回 None
+    """
+    from hikyuu import Query, Datetime, Days
+    if date is None:
+        return stk.get_kdata(Query(-bars, ktype=ktype))
+    day = stk.get_kdata(Query(Datetime(date), Datetime(date) + Days(1), ktype))
+    if len(day) == 0:
+        return None
+    end = day.end_pos
+    return stk.get_kdata(Query(max(end - bars, 0), end, ktype))
+
+
+def tail_hits(ind, stks, bars, date=None, ktype='DAY'):
+    """
+    在当前进程中只计算尾部 K 线，返回最后一根 K 线上的命中结果
+
+    参数:
+        ind: 选股指标，最后一个值非 0 且非 NaN 视为命中
+        stks: 证券列表
+        bars: 每只证券取的 K 线根数，应不小于指标的回看长度
+        date: 选股日期（Datetime.number 或 None 表示最新）
+        ktype: K 线类型
+
+    返回:
+        [(code, date, value), ...]
+    """
+    hits = []
+    for stk in stks:
+        k = _tail_kdata(stk, bars, date, ktype)
+        if k is None or len(k) == 0:
+            continue
+        values = ind(k).to_np()
+        value = values[-1] if len(values) > 0 else np.nan
+        if np.isfinite(value) and value != 0:
+            hits.append((stk.market_code, k[-1].datetime.number, float(value)))
+    return hits
+
+
+def _calendar_last(stk, ktype='DAY'):
+    """市场日历（如上证指数）最后一根 K 线的日期, Datetime.number，没有数据时返回 None"""
+    k = _tail_kdata(stk, 1, None, ktype)
+    return k[-1].datetime.number if len(k) > 0 else None
+
+
+def _latest_hits(rows, latest):
+    """只保留日期为 latest 的命中结果，latest 为 None 或当日没有命中时返回空表"""
+    df = pd.DataFrame(rows, columns=['code', 'date', 'value'])
+    if latest is None:
+        return df.iloc[0:0]
+    return df[df['date'] == latest].sort_values('code').reset_index(drop=True)
+
+
+def _screen_worker(task):
+    """
+    工作进程：只加载本批证券所需的尾部数据，计算本批证券的最后一根 K 线，
+    同时返回市场日历的最后一个交易日
+    """
+    part_name, params, codes, bars, date, ktype, calendar = task
+    from hikyuu import Query
+    # 指定历史日期时无法由 Query(-bars) 推出所需的 K 线根数，按默认值加载
+    options = minimal_options(sorted(set(codes) | {calendar}), Query(-bars, ktype=ktype), 0)
+    if date is not None:
+        options.pop('preload_num', None)
+    ensure_loaded(options)
+    import hikyuu as hku
+    stks = [hku.sm[code] for code in codes if not hku.sm[code].is_null()]
+    last = None if hku.sm[calendar].is_null() else _calendar_last(hku.sm[calendar], ktype)
+    return last, tail_hits(hku.get_part(part_name, **params), stks, bars, date, ktype)
+
+
+def screen(part_name, stks, params=None, lookback=None, padding=10, date=None, ktype='DAY',
+           workers=None, chunk_size=300, probe='sh000001', calendar='sh000001'):
+    """
+    全市场尾部选股：按部件的回看长度只取最后若干根 K 线，多进程计算最后一根 K 线的结果
+
+    参数:
+        part_name: 选股指标部件，如 'default.ind.通达信百变一阳指'
+        stks: 证券或证券代码列表
+        params: 部件参数
+        lookback: 回看长度，None 时由 lookback.part_lookback 测量（结果有缓存）
+        padding: 额外的 K 线根数，为 EMA、SMA 等递推指标在其他证券上的收敛留出余量
+        date: 选股日期, Datetime 或 Datetime.number，None 表示最新
+        ktype: K 线类型
+        workers: 工作进程数
+        chunk_size: 每个任务的证券数量
+        probe: 测量回看长度的探针证券
+        calendar: 市场日历证券，date 为 None 时以其最后一根 K 线的日期为选股日期
+
+    返回:
+        DataFrame: code, date, value，只保留最后一根 K 线为选股日期的证券（排除停牌），
+        选股日期没有命中时为空表
+    """
+    params = params or {}
+    if lookback is None:
+        lookback = part_lookback(part_name, params, probe, ktype.lower())
+    bars = lookback + padding
+    if date is not None and not isinstance(date, (int, np.integer)):
+        date = date.number
+    tasks = [(part_name, params, codes, bars, date, ktype, calendar)
+             for codes in chunked(stock_codes(stks), chunk_size)]
+
+    rows = []
+    lasts = set()
+    for _, (last, hits) in run_tasks(_screen_worker, tasks, workers, desc="尾部选股"):
+        lasts.add(last)
+        rows.extend(hits)
+    latest = date if date is not None else max((d for d in lasts if d is not None), default=None)
+    return _latest_hits(rows, latest)
+
+
+def screen_indicator(ind, stks, probe, padding=10, date=None, ktype='DAY', calendar='sh000001'):
+    """
+    对不是部件的指标（如笔记本中临时编写的 RESULT 公式）做尾部选股，要求当前进程已加载数据
+
+    参数:
+        ind: 选股指标
+        stks: 证券列表
+        probe: 测量回看长度的探针证券, Stock
+        padding, date, ktype, calendar: 同 screen
+
+    返回:
+        DataFrame: code, date, value
+    """
+    bars = measure_lookback(ind, probe, ktype.lower()) + padding
+    if date is not None and not isinstance(date, (int, np.integer)):
+        date = date.number
+    latest = date
+    if latest is None:
+        from hikyuu import sm
+        latest = None if sm[calendar].is_null() else _calendar_last(sm[calendar], ktype)
+    return _latest_hits(tail_hits(ind, stks, bars, date, ktype), latest)
+
+
+if __name__ == "__main__":
+    from stock_pool import registry
+    # 股池解析不需要 K 线数据，K 线在工作进程中按回看长度加载
+    print(screen('default.ind.通达信百变一阳指', registry.codes('guchi', valid_only=False)))
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from hikyuu import *
+from panel import Panel, numbers_to_index, trading_dates, align, datetime_numbers, signal_panel, indicator_panel
+
+
+class SelectionMatrix:
+    """
+    选股结果矩阵：交易日 × 证券
+
+    selected 为布尔矩阵，scores 为对应的得分（未选中时为 NaN）
+    """
+
+    def __init__(self, dates, codes, selected, scores=None):
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.codes = list(codes)
+        self.selected = selected
+        if scores is None:
+            scores = np.where(selected, 1.0, np.nan)
+        self.scores = scores
+
+    def picks(self, date):
+        """date 当日选中的证券代码列表，date 可以为 Datetime 或 Datetime.number"""
+        row = Panel(self.dates, self.codes, self.selected).row(date)
+        if row is None:
+            return []
+        return [self.codes[j] for j in np.flatnonzero(row)]
+
+    def counts(self):
+        """每日选中数量"""
+        return pd.Series(self.selected.sum(axis=1), index=numbers_to_index(self.dates))
+
+    def to_dataframe(self, long=True):
+        """
+        导出为 DataFrame
+
+        参数:
+            long: True 时返回 (date, code, score) 长表，只包含选中记录，便于与通达信选股结果逐日比对；
+                  False 时返回 日期 × 证券 的得分宽表
+
+        返回:
+            DataFrame
+        """
+        if not long:
+            return pd.DataFrame(self.scores, index=numbers_to_index(self.dates), columns=self.codes)
+        rows, cols = np.nonzero(self.selected)
+        return pd.DataFrame({
+            'date': numbers_to_index(self.dates[rows]),
+            'code': np.asarray(self.codes, dtype=object)[cols],
+            'score': self.scores[rows, cols],
+        })
+
+    def compare(self, other):
+        """
+        与其他来源的选股结果比较
+
+        参数:
+            other: DataFrame，包含 date、code 两列，如导入的通达信选股结果
+
+        返回:
+            按日期统计的 DataFrame: 双方共同选中、仅本方选中、仅对方选中的数量
+        """
+        mine = self.to_dataframe()[['date', 'code']]
+        theirs = other[['date', 'code']].copy()
+        theirs['date'] = pd.to_datetime(theirs['date'])
+        theirs['code'] = theirs['code'].str.upper()
+        merged = mine.merge(theirs, on=['date', 'code'], how='outer', indicator=True)
+        result = pd.crosstab(merged['date'], merged['_merge'])
+        result.columns.name = None
+        return result.rename(columns={'both': '共同', 'left_only': '仅本方', 'right_only': '仅对方'})
+
+
+def signal_selection(stks, sg, query, score_ind=None, market='SH'):
+    """
+    一次性计算 SE_Signal 在整个区间内的选股矩阵，等价于逐日调用 SE_Signal.get_selected
+
+    参数:
+        stks: 证券列表
+        sg: 信号指示器，买入信号当日视为选中
+        query: 查询条件
+        score_ind: 得分指标，None 时选中得分为 1.0
+
+    返回:
+        SelectionMatrix
+    """
+    buy, _ = signal_panel(sg, stks, query, market)
+    scores = None
+    if score_ind is not None:
+        scores = np.where(buy.values, indicator_panel(score_ind, stks, query, market).values, np.nan)
+    return SelectionMatrix(buy.dates, buy.codes, buy.values, scores)
+
+
+def se_selection(my_se, query, score_ind=None, market='SH'):
+    """
+    计算选股器部件在查询范围内的选股矩阵
+
+    支持提供 selection_matrix 方法的选股器（如 se.最低单因子面板），
+    以及通过 SE_Signal(stks, sys) 方式创建的信号选股器（按名称 'SE_Signal' 识别，不可改名）；
+    其他选股器的选股逻辑无法由买入信号推出，抛出 ValueError
+
+    参数:
+        my_se: 选股器实例
+        query: 查询条件
+        score_ind: 信号选股器使用的得分指标，提供 selection_matrix 的选股器不支持
+        market: 交易日历所属市场，传递给 selection_matrix
+
+    返回:
+        SelectionMatrix
+    """
+    if hasattr(my_se, 'selection_matrix'):
+        if score_ind is not None:
+            raise ValueError(f"{my_se.name} 的得分由选股器自身给出，不支持 score_ind")
+        dates, codes, selected, scores = my_se.selection_matrix(query, market)
+        return SelectionMatrix(dates, codes, selected, scores)
+
+    if my_se.name != 'SE_Signal':
+        raise ValueError(f"不支持的选股器: {my_se.name}，只支持 SE_Signal 或提供 selection_matrix 方法的选股器")
+    sys_list = list(my_se.proto_sys_list)
+    if len(sys_list) == 0:
+        raise ValueError(f"选股器未添加证券: {my_se.name}")
+    dates = trading_dates(query, market)
+    codes = []
+    selected = np.zeros((len(dates), len(sys_list)), dtype=bool)
+    scores = np.full((len(dates), len(sys_list)), np.nan) if score_ind is not None else None
+    for j, my_sys in enumerate(sys_list):
+        stk = my_sys.stock
+        codes.append(stk.market_code)
+        k = stk.get_kdata(query)
+        if len(k) == 0:
+            continue
+        sg = my_sys.sg.clone()
+        sg.to = k
+        selected[:, j] = np.isin(dates, datetime_numbers(sg.get_buy_signal()))
+        if score_ind is not None:
+            values = align(dates, datetime_numbers(k.get_datetime_list()), score_ind(k).to_np())
+            scores[:, j] = np.where(selected[:, j], values, np.nan)
+    return SelectionMatrix(dates, codes, selected, scores)
@@ -0,0 +1,211 @@
+import json
+import os
+import numpy as np
+from hikyuu import *
+from utils import read_guchi
+
+
+class PoolRegistry:
+    """
+    证券池注册表
+
+    统一管理 EBK 文件、板块、ETF 等来源的证券池：
+        - 解析结果缓存到 cache_dir，以来源文件的修改时间为键，来源未变化时不再解析
+        - 可按日期保存成分股快照，用于按时点（point-in-time）确定成分股；
+          早于第一个快照的日期成分股为空，未保存任何快照时使用当前成分股（存在幸存者偏差）
+        - 可将证券池转换为面板列号数组，与 panel.py 中的面板对齐
+    """
+
+    def __init__(self, cache_dir='.pool_cache'):
+        self.cache_dir = cache_dir
+        self._sources = {}
+        self._memory = {}
+
+    # ------------------------------------------------------------------
+    # 注册
+    # ------------------------------------------------------------------
+    def register_ebk(self, name, path):
+        """注册通达信 EBK 自选股文件"""
+        self._sources[name] = ('ebk', os.path.abspath(path))
+
+    def register_block(self, name, category, block_name):
+        """注册板块，如 register_block('沪深300', '指数板块', '沪深300')"""
+        self._sources[name] = ('block', category, block_name)
+
+    def register_etf(self, name='etf'):
+        """注册全部 ETF"""
+        self._sources[name] = ('etf',)
+
+    def register_codes(self, name, codes):
+        """注册固定的证券代码列表"""
+        self._sources[name] = ('codes', tuple(c.upper() for c in codes))
+
+    def names(self):
+        return list(self._sources.keys())
+
+    # ------------------------------------------------------------------
+    # 解析
+    # ------------------------------------------------------------------
+    def _source_mtime(self, source):
+        if source[0] == 'ebk':
+            return os.path.getmtime(source[1])
+        # 板块与 ETF 来自已加载的 hikyuu 数据，进程内只解析一次
+        return None
+
+    def _resolve(self, source):
+        kind = source[0]
+        if kind == 'ebk':
+            codes = [code.upper() for code in read_guchi(source[1])]
+        elif kind == 'block':
+            codes = [s.market_code for s in sm.get_block(source[1], source[2])]
+        elif kind == 'etf':
+            codes = [s.market_code for s in sm if s.type == constant.STOCKTYPE_ETF]
+        else:
+            codes = list(source[1])
+        return codes
+
+    def _cache_file(self, name):
+        return os.path.join(self.cache_dir, f"{name}.json")
+
+    def codes(self, name, valid_only=True):
+        """
+        获取证券池的证券代码列表（大写 market_code，已去重并保持原有顺序）
+
+        参数:
+            name: 证券池名称
+            valid_only: 是否过滤掉当前无效（已退市等）的证券
+
+        返回:
+            证券代码列表
+        """
+        source = self._sources[name]
+        mtime = self._source_mtime(source)
+        key = (name, mtime)
+        if key not in self._memory:
+            codes = None
+            cache_file = self._cache_file(name)
+            if mtime is not None and os.path.exists(cache_file):
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('mtime') == mtime and cached.get('source') == list(source):
+                    codes = cached['codes']
+            if codes is None:
+                codes = list(dict.fromkeys(self._resolve(source)))
+                if mtime is not None:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    with open(cache_file, 'w', encoding='utf-8') as f:
+                        json.dump({'source': list(source), 'mtime': mtime, 'codes': codes}, f, ensure_ascii=False)
+            self._memory[key] = codes
+
+        codes = self._memory[key]
+        if valid_only:
+            codes = [code for code in codes if not sm[code].is_null() and sm[code].valid]
+        return codes
+
+    def stocks(self, name, valid_only=True):
+        """获取证券池的 Stock 列表"""
+        return [sm[code] for code in self.codes(name, valid_only)]
+
+    # ------------------------------------------------------------------
+    # 时点成分股快照
+    # ------------------------------------------------------------------
+    def _snapshot_file(self, name):
+        return os.path.join(self.cache_dir, 'snapshots', f"{name}.json")
+
+    def _load_snapshots(self, name):
+        path = self._snapshot_file(name)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return {int(k): v for k, v in json.load(f).items()}
+
+    def add_snapshot(self, name, date, codes=None):
+        """
+        保存证券池在 date 时的成分股快照
+
+        参数:
+            name: 证券池名称
+            date: 快照日期, Datetime
+            codes: 成分股代码，None 时使用当前解析结果（不过滤无效证券，退市股也属于当时的成分）
+        """
+        if codes is None:
+            codes = self.codes(name, valid_only=False)
+        snapshots = self._load_snapshots(name)
+        snapshots[date.ymd] = sorted(c.upper() for c in codes)
+        path = self._snapshot_file(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({str(k): v for k, v in sorted(snapshots.items())}, f, ensure_ascii=False)
+
+    def snapshot_dates(self, name):
+        return sorted(self._load_snapshots(name).keys())
+
+    def members_at(self, name, date):
+        """
+        date 时的成分股，取不晚于 date 的最近一次快照；早于第一个快照时为空列表，
+        没有任何快照时返回当前成分股
+        """
+        snapshots = self._load_snapshots(name)
+        if not snapshots:
+            return self.codes(name, valid_only=False)
+        ymds = sorted(k for k in snapshots.keys() if k <= date.ymd)
+        if not ymds:
+            return []
+        return snapshots[ymds[-1]]
+
+    def membership(self, name, dates, codes):
+        """
+        生成按时点确定的成分股矩阵
+
+        参数:
+            name: 证券池名称
+            dates: 日期数组, Datetime.number，与面板的 dates 一致
+            codes: 面板的证券代码列表
+
+        返回:
+            交易日 × 证券 的布尔矩阵，规则同 members_at：早于第一个快照的日期全部为 False，
+            没有任何快照时每日均为当前成分股
+        """
+        snapshots = self._load_snapshots(name)
+        dates = np.asarray(dates, dtype=np.int64)
+        if not snapshots:
+            row = np.isin(np.asarray(codes), self.codes(name, valid_only=False))
+            return np.tile(row, (len(dates), 1))
+
+        ymds = np.array(sorted(snapshots.keys()), dtype=np.int64)
+        # 第 0 行为第一个快照之前的空成分股
+        table = np.array([np.zeros(len(codes), dtype=bool)] +
+                         [np.isin(np.asarray(codes), snapshots[ymd]) for ymd in ymds])
+        pos = np.searchsorted(ymds, dates // 10000, side='right')
+        return table[pos]
+
+    # ------------------------------------------------------------------
+    # 面板对齐
+    # ------------------------------------------------------------------
+    def indices(self, name, codes, date=None):
+        """
+        证券池在面板证券列表中的列号数组
+
+        参数:
+            name: 证券池名称
+            codes: 面板的证券代码列表（Panel.codes）
+            date: 指定时使用 date 时的快照成分股，否则使用当前成分股
+
+        返回:
+            np.ndarray，按面板列顺序排列，面板中不存在的证券被忽略
+        """
+        members = self.members_at(name, date) if date is not None else self.codes(name)
+        return np.flatnonzero(np.isin(np.asarray(codes), members))
+
+
+# 默认注册表
+registry = PoolRegistry()
+registry.register_ebk('guchi', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'guchi.EBK'))
+registry.register_block('沪深300', '指数板块', '沪深300')
+registry.register_block('300银行', '指数板块', '300银行')
+registry.register_etf('etf')
+
+
+def get_pool(name, valid_only=True):
+    """从默认注册表获取证券池的 Stock 列表"""
+    return registry.stocks(name, valid_only)
@@ -0,0 +1,289 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import numpy as np
+import h5py
+from tqdm import tqdm
+
+# hikyuu HDF5 日线记录格式，价格为 元 × 1000，成交额为千元，成交量为股
+H5_RECORD = np.dtype([
+    ('datetime', '<u8'),
+    ('openPrice', '<u4'),
+    ('highPrice', '<u4'),
+    ('lowPrice', '<u4'),
+    ('closePrice', '<u4'),
+    ('transAmount', '<u8'),
+    ('transCount', '<u8'),
+])
+
+# hikyuu 证券类型
+STOCKTYPE_A = 1
+STOCKTYPE_INDEX = 2
+
+# 生成的指数: (市场, 代码, 名称, 成分股选择方式)
+INDICES = [
+    ('SH', '000001', '上证指数', 'SH'),
+    ('SZ', '399001', '深证成指', 'SZ'),
+    ('SH', '000300', '沪深300', '沪深300'),
+]
+
+CONFIG_TEMPLATE = """[hikyuu]
+tmpdir = {root}/tmp
+datadir = {root}
+quotation_server = ipc:///tmp/hikyuu_real.ipc
+
+[block]
+type = qianlong
+dir = {root}/block
+指数板块 = zsbk.ini
+行业板块 = hybk.ini
+概念板块 = gnbk.ini
+地域板块 = dybk.ini
+self = self.ini
+
+[preload]
+day = True
+week = False
+month = False
+quarter = False
+halfyear = False
+year = False
+min = False
+min5 = False
+min15 = False
+min30 = False
+min60 = False
+hour2 = False
+day_max = 100000
+
+[baseinfo]
+type = sqlite3
+db = {root}/stock.db
+
+[kdata]
+type = hdf5
+sh_day = {root}/sh_day.h5
+sz_day = {root}/sz_day.h5
+"""
+
+
+class SyntheticMarket:
+    """
+    确定性的合成行情
+
+    相同的参数与随机种子总是生成相同的数据，每只证券使用独立的随机数流，
+    因此只生成部分证券（如基准测试中的小规模数据）时结果与全量生成一致
+
+    参数:
+        n_stocks: 股票数量，按序号交替分配到沪市（600000 起）与深市（000001 起）
+        years: 年数
+        end_date: 最后一个交易日 datetime.date，默认为 2024-12-31
+        seed: 随机种子
+        delist_ratio: 区间内退市的股票比例
+        suspend_ratio: 每只股票停牌日占比
+    """
+
+    def __init__(self, n_stocks=5000, years=20, end_date=None, seed=0, delist_ratio=0.05, suspend_ratio=0.01):
+        self.n_stocks = n_stocks
+        self.years = years
+        self.seed = seed
+        self.delist_ratio = delist_ratio
+        self.suspend_ratio = suspend_ratio
+        end = end_date or datetime.date(2024, 12, 31)
+        start = end.replace(year=end.year - years) + datetime.timedelta(days=1)
+        # 交易日历：工作日，另按固定种子剔除约 2% 作为节假日
+        days = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+        days = days[np.is_busday(days)]
+        holiday = np.random.default_rng([seed, 0]).random(len(days)) < 0.02
+        self.days = days[~holiday]
+        ymd = self.days.astype('datetime64[D]').astype(str)
+        self.dates = np.array([int(d.replace('-', '')) * 10000 for d in ymd], dtype=np.uint64)
+
+        n_days = len(self.dates)
+        # 每只股票的上市、退市与规模只取决于自身的随机数流
+        attrs = np.array([self._stock_attrs(i, n_days) for i in range(n_stocks)]).reshape(n_stocks, 3)
+        self.list_index = attrs[:, 0].astype(np.int64)
+        self.delist_index = attrs[:, 1].astype(np.int64)
+        # 规模因子，决定成交额与指数成分
+        self.size = attrs[:, 2]
+        self.codes = [self.stock_code(i) for i in range(n_stocks)]
+
+    def _stock_attrs(self, i, n_days):
+        rng = np.random.default_rng([self.seed, 1, i])
+        # 约三成在区间开始前上市，其余在区间内均匀上市
+        list_index = 0 if rng.random() < 0.3 else int(rng.integers(0, max(n_days - 250, 1)))
+        delist_index = n_days
+        if rng.random() < self.delist_ratio:
+            delist_index = min(list_index + int(rng.integers(250, max(n_days, 251))), n_days)
+        return list_index, delist_index, rng.lognormal(0, 1)
+
+    @staticmethod
+    def stock_code(i):
+        """第 i 只股票的 market_code，偶数为沪市，奇数为深市"""
+        if i % 2 == 0:
+            return f"SH{600000 + i // 2:06d}"
+        return f"SZ{1 + i // 2:06d}"
+
+    def stock_bars(self, i):
+        """
+        第 i 只股票的日线，H5_RECORD 结构化数组（已去除未上市、退市后及停牌日）
+
+        返回:
+            (bars, 对应的交易日下标)
+        """
+        rng = np.random.default_rng([self.seed, 2, i])
+        n = len(self.dates)
+        vol = rng.uniform(0.015, 0.04)
+        drift = rng.normal(0.0002, 0.0003)
+        rets = rng.normal(drift, vol, n)
+        # 限制价格范围，避免超出 uint32 价格字段
+        close = np.clip(rng.uniform(3, 60) * np.exp(np.cumsum(np.clip(rets, -0.1, 0.1))), 0.5, 100000)
+        gap = rng.normal(0, vol / 3, n)
+        open_ = close * np.exp(-np.clip(rets, -0.1, 0.1)) * np.exp(gap)
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 2, n)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 2, n)))
+        volume = self.size[i] * rng.lognormal(15, 0.5, n)
+
+        keep = np.zeros(n, dtype=bool)
+        keep[self.list_index[i]:self.delist_index[i]] = True
+        keep &= rng.random(n) >= self.suspend_ratio
+        idx = np.flatnonzero(keep)
+
+        bars = np.empty(len(idx), dtype=H5_RECORD)
+        bars['datetime'] = self.dates[idx]
+        bars['openPrice'] = np.round(open_[idx] * 1000)
+        bars['highPrice'] = np.round(high[idx] * 1000)
+        bars['lowPrice'] = np.round(low[idx] * 1000)
+        bars['closePrice'] = np.round(close[idx] * 1000)
+        bars['transCount'] = np.round(volume[idx])
+        bars['transAmount'] = np.round(volume[idx] * close[idx] / 1000)
+        return bars, idx
+
+    def members(self, name):
+        """指数成分股序号"""
+        if name in ('SH', 'SZ'):
+            return [i for i in range(self.n_stocks) if self.codes[i].startswith(name)]
+        if name == '沪深300':
+            return sorted(np.argsort(-self.size)[:300].tolist())
+        raise ValueError(f"未知的成分股选择方式: {name}")
+
+    def blocks(self):
+        """板块 {分类: {板块名称: [序号, ...]}}"""
+        hs300 = self.members('沪深300')
+        industries = {f"行业{k + 1:02d}": [i for i in range(self.n_stocks) if i % 30 == k] for k in range(30)}
+        return {
+            '指数板块': {'沪深300': hs300, '300银行': hs300[::15]},
+            '行业板块': industries,
+        }
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def write(self, root, stocks=None):
+        """
+        写入 hikyuu 本地数据目录：sh_day.h5、sz_day.h5、stock.db、block/*.ini 及 hikyuu.ini
+
+        参数:
+            root: 输出目录
+            stocks: 只写入前 stocks 只股票，None 表示全部
+
+        返回:
+            hikyuu.ini 路径，可通过 hikyuu_init(路径) 加载
+        """
+        root = os.path.abspath(root)
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+        count = self.n_stocks if stocks is None else min(stocks, self.n_stocks)
+        n_days = len(self.dates)
+        index_sum = {name: np.zeros(n_days) for _, _, _, name in INDICES}
+        index_cnt = {name: np.zeros(n_days) for _, _, _, name in INDICES}
+        groups = {name: set(self.members(name)) for _, _, _, name in INDICES}
+
+        files = {m: h5py.File(os.path.join(root, f"{m.lower()}_day.h5"), 'w') for m in ('SH', 'SZ')}
+        try:
+            for f in files.values():
+                f.create_group('data')
+            for i in tqdm(range(count), desc="生成K线"):
+                bars, idx = self.stock_bars(i)
+                code = self.codes[i]
+                files[code[:2]]['data'].create_dataset(code, data=bars)
+                # 指数按成分股的日收益率等权平均
+                if len(idx) > 1:
+                    rets = np.diff(bars['closePrice'].astype(np.float64)) / bars['closePrice'][:-1]
+                    for name, members in groups.items():
+                        if i in members:
+                            index_sum[name][idx[1:]] += rets
+                            index_cnt[name][idx[1:]] += 1
+            for market, code, _, name in INDICES:
+                rets = np.divide(index_sum[name], index_cnt[name], out=np.zeros(n_days), where=index_cnt[name] > 0)
+                close = 1000 * np.cumprod(1 + rets)
+                bars = np.empty(n_days, dtype=H5_RECORD)
+                bars['datetime'] = self.dates
+                bars['openPrice'] = bars['highPrice'] = bars['lowPrice'] = bars['closePrice'] = np.round(close * 1000)
+                bars['transAmount'] = bars['transCount'] = 0
+                files[market]['data'].create_dataset(f"{market}{code}", data=bars)
+        finally:
+            for f in files.values():
+                f.close()
+
+        self._write_stock_db(os.path.join(root, 'stock.db'), count)
+        self._write_blocks(os.path.join(root, 'block'), count)
+        config = os.path.join(root, 'hikyuu.ini')
+        with open(config, 'w', encoding='utf-8') as f:
+            f.write(CONFIG_TEMPLATE.format(root=root.replace('\\', '/')))
+        return config
+
+    def _ymd(self, index):
+        return int(self.dates[min(index, len(self.dates) - 1)] // 10000)
+
+    def _write_stock_db(self, path, count):
+        """使用 hikyuu 自带的建表脚本创建 stock.db，再写入证券列表"""
+        from hikyuu.data.common_sqlite3 import create_database
+        if os.path.exists(path):
+            os.remove(path)
+        with sqlite3.connect(path) as connect:
+            create_database(connect)
+            cur = connect.cursor()
+            market_id = dict(cur.execute("SELECT market, marketid FROM Market").fetchall())
+            rows = []
+            for i in range(count):
+                code = self.codes[i]
+                delisted = self.delist_index[i] < len(self.dates)
+                rows.append((market_id[code[:2]], code[2:], f"合成{code[2:]}", STOCKTYPE_A, int(not delisted),
+                             self._ymd(self.list_index[i]),
+                             self._ymd(self.delist_index[i]) if delisted else 99999999))
+            for market, code, name, _ in INDICES:
+                rows.append((market_id[market], code, name, STOCKTYPE_INDEX, 1, self._ymd(0), 99999999))
+            cur.execute("DELETE FROM Stock")
+            cur.executemany("INSERT INTO Stock(marketid, code, name, type, valid, startDate, endDate) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            connect.commit()
+
+    def _write_blocks(self, directory, count):
+        """写入钱龙格式的板块文件，每行为 市场标识(1 沪 / 0 深),代码"""
+        os.makedirs(directory, exist_ok=True)
+        files = {'指数板块': 'zsbk.ini', '行业板块': 'hybk.ini', '概念板块': 'gnbk.ini', '地域板块': 'dybk.ini'}
+        blocks = self.blocks()
+        for category, filename in files.items():
+            with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+                for name, members in blocks.get(category, {}).items():
+                    f.write(f"[{name}]\n")
+                    for i in members:
+                        if i < count:
+                            code = self.codes[i]
+                            f.write(f"{1 if code.startswith('SH') else 0},{code[2:]}\n")
+        open(os.path.join(directory, 'self.ini'), 'w', encoding='utf-8').close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成合成行情数据，用于基准测试")
+    parser.add_argument('root', help="输出目录")
+    parser.add_argument('--stocks', type=int, default=5000, help="股票数量")
+    parser.add_argument('--years', type=int, default=20, help="年数")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    market = SyntheticMarket(args.stocks, args.years, seed=args.seed)
+    config = market.write(args.root)
+    print(f"已生成 {args.stocks} 只股票 × {len(market.dates)} 个交易日")
+    print(f"加载方式: from hikyuu import hikyuu_init; hikyuu_init('{config}')")
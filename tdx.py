@@ -0,0 +1,507 @@
+import re
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 通达信公式编译器
+#
+# 将通达信公式解析为去重后的表达式有向无环图（相同的子表达式只保留一个节点），
+# 在 交易日 × 证券 的面板上按拓扑顺序一次计算全部证券。节点的结果在最后一次被引用后
+# 立即回收，逐元素运算直接写入回收的缓冲区，不再为每个运算保留完整的临时指标。
+#
+# 面板按交易日历对齐，停牌日为 NaN：滚动窗口跨越停牌日时结果为 NaN，SMA/EMA 在停牌日
+# 保持前值，因此停牌前后的结果可能与 hikyuu 逐证券计算略有不同。
+
+_TOKEN = re.compile(
+    r"\s*(?:(\d+\.\d*|\.\d+|\d+)|([A-Za-z_一-鿿][\w一-鿿]*)"
+    r"|(:=|>=|<=|<>|!=|==|&&|\|\||[-+*/(),;:<>=!]))")
+_COMMENT = re.compile(r"\{[^}]*\}")
+
+INPUTS = {
+    'OPEN': 'open', 'O': 'open',
+    'HIGH': 'high', 'H': 'high',
+    'LOW': 'low', 'L': 'low',
+    'CLOSE': 'close', 'C': 'close',
+    'VOL': 'volume', 'V': 'volume', 'VOLUME': 'volume',
+    'AMOUNT': 'amount',
+}
+
+# 函数名: (参数个数, 需为常数的参数位置)
+FUNCTIONS = {
+    'REF': (2, (1,)),
+    'MA': (2, (1,)),
+    'SUM': (2, (1,)),
+    'EMA': (2, (1,)),
+    'SMA': (3, (1, 2)),
+    'LLV': (2, (1,)),
+    'HHV': (2, (1,)),
+    'COUNT': (2, (1,)),
+    'CROSS': (2, ()),
+    'IF': (3, ()),
+    'ABS': (1, ()),
+    'MAX': (2, ()),
+    'MIN': (2, ()),
+}
+
+_BINARY = {
+    '+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide,
+    '>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal,
+    '=': np.equal, '==': np.equal, '<>': np.not_equal, '!=': np.not_equal,
+    'AND': np.logical_and, 'OR': np.logical_or,
+}
+_COMMUTATIVE = {'+', '*', '=', '==', '<>', '!=', 'AND', 'OR', 'MAX', 'MIN'}
+_ELEMENTWISE = {'+', '-', '*', '/'}
+
+
+class Formula:
+    """
+    编译后的通达信公式
+
+    支持 := 中间变量、NAME: 输出变量、算术与比较运算、AND/OR/NOT，
+    以及 REF、MA、SUM、EMA、SMA、LLV、HHV、COUNT、CROSS、IF、ABS、MAX、MIN
+
+    多个公式可以通过 add 编译进同一个图中，共享相同的子表达式
+    """
+
+    def __init__(self, source=None, params=None, prefix=''):
+        self._nodes = []        # [(op, args)]，args 为节点编号或常数
+        self._index = {}        # (op, args) -> 节点编号
+        self.outputs = {}       # 输出名称 -> 节点编号
+        self.variables = {}     # 全部变量名称（含中间变量） -> 节点编号
+        if source is not None:
+            self.add(source, params, prefix)
+
+    # ------------------------------------------------------------------
+    # 构图
+    # ------------------------------------------------------------------
+    def _node(self, op, *args):
+        if op in _COMMUTATIVE:
+            args = tuple(sorted(args, key=lambda a: (isinstance(a, tuple), a)))
+        # 常数折叠
+        if all(isinstance(a, tuple) for a in args) and op in _BINARY:
+            with np.errstate(all='ignore'):
+                return ('num', float(_BINARY[op](args[0][1], args[1][1])))
+        key = (op, args)
+        if key not in self._index:
+            self._index[key] = len(self._nodes)
+            self._nodes.append(key)
+        return self._index[key]
+
+    def add(self, source, params=None, prefix=''):
+        """
+        编译一段公式并加入图中
+
+        参数:
+            source: 公式文本，语句以分号或换行分隔
+            params: 公式参数，如 {'N': 10}
+            prefix: 输出名称前缀，多个公式共用一个图时用于区分
+
+        返回:
+            本段公式的输出名称列表
+        """
+        parser = _Parser(self, params or {})
+        statements = [s for s in re.split(r"[;\n]", _COMMENT.sub('', source)) if s.strip()]
+        names = []
+        for i, statement in enumerate(statements):
+            name, kind, node = parser.statement(statement)
+            if name is None:
+                name = f'OUT{i}'
+            self.variables[prefix + name] = node
+            parser.scope[name] = node
+            if kind != ':=':
+                names.append(prefix + name)
+        if not names and statements:
+            names.append(prefix + name)
+        for name in names:
+            self.outputs[name] = self.variables[name]
+        return names
+
+    def __len__(self):
+        return len(self._nodes)
+
+    # ------------------------------------------------------------------
+    # 计算
+    # ------------------------------------------------------------------
+    def fields(self):
+        """公式用到的 K 线字段"""
+        return sorted({args[0][1] for op, args in self._nodes if op == 'input'})
+
+    def evaluate(self, inputs, names=None):
+        """
+        在面板上计算公式
+
+        参数:
+            inputs: {字段名: 交易日 × 证券 的二维数组}，字段名见 fields()
+            names: 需要的变量名称，默认为全部输出
+
+        返回:
+            {名称: 二维数组}
+        """
+        names = list(self.outputs) if names is None else list(names)
+        wanted = {self.variables[n] for n in names if not isinstance(self.variables[n], tuple)}
+        shape = np.shape(next(iter(inputs.values())))
+
+        # 只计算输出依赖的节点，并记录每个节点最后一次被引用的位置
+        needed = set()
+        stack = list(wanted)
+        while stack:
+            i = stack.pop()
+            if i in needed:
+                continue
+            needed.add(i)
+            stack.extend(a for a in self._nodes[i][1] if isinstance(a, int))
+        last_use = {}
+        for i in sorted(needed):
+            for a in self._nodes[i][1]:
+                if isinstance(a, int):
+                    last_use[a] = i
+
+        values = {}
+        pool = []
+        for i in sorted(needed):
+            op, args = self._nodes[i]
+            if op == 'input':
+                values[i] = np.asarray(inputs[args[0][1]], dtype=np.float64)
+                continue
+            operands = [values[a] if isinstance(a, int) else a[1] for a in args]
+            out = pool.pop() if (pool and op in _ELEMENTWISE) else None
+            values[i] = _KERNELS[op](operands, shape, out)
+            for a in set(a for a in args if isinstance(a, int)):
+                if last_use.get(a) == i and a not in wanted:
+                    buf = values.pop(a)
+                    if self._nodes[a][0] != 'input' and buf is not values[i]:
+                        pool.append(buf)
+
+        result = {}
+        for name in names:
+            node = self.variables[name]
+            result[name] = np.full(shape, node[1]) if isinstance(node, tuple) else values[node]
+        return result
+
+    def evaluate_panel(self, stks, query, names=None, market='SH'):
+        """
+        读取证券池的 K 线面板并计算公式
+
+        返回:
+            {名称: Panel}
+        """
+        from panel import Panel, kdata_panel
+        panels = kdata_panel(stks, query, fields=tuple(self.fields()), market=market)
+        first = next(iter(panels.values()))
+        result = self.evaluate({f: p.values for f, p in panels.items()}, names)
+        return {name: Panel(first.dates, first.codes, v) for name, v in result.items()}
+
+
+class _Parser:
+    """递归下降解析器，优先级: OR < AND < 比较 < 加减 < 乘除 < 一元"""
+
+    def __init__(self, formula, params):
+        self.formula = formula
+        self.params = {k.upper(): float(v) for k, v in params.items()}
+        self.scope = {}
+
+    def statement(self, text):
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+        name = kind = None
+        if len(self.tokens) > 2 and self.tokens[0][0] == 'name' and self.tokens[1][1] in (':=', ':'):
+            name, kind = self.tokens[0][1].upper(), self.tokens[1][1]
+            self.pos = 2
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"公式语法错误: {text.strip()}")
+        return name, kind, node
+
+    @staticmethod
+    def _tokenize(text):
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            m = _TOKEN.match(text, pos)
+            if not m or m.end() == pos:
+                raise ValueError(f"无法识别的字符: {text[pos:]}")
+            number, name, op = m.groups()
+            if number is not None:
+                tokens.append(('num', float(number)))
+            elif name is not None:
+                tokens.append(('name', name))
+            else:
+                tokens.append(('op', {'&&': 'AND', '||': 'OR'}.get(op, op)))
+            pos = m.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _accept(self, *values):
+        kind, value = self._peek()
+        if kind is not None and (value in values or (kind == 'name' and value.upper() in values)):
+            self.pos += 1
+            return value.upper() if kind == 'name' else value
+        return None
+
+    def _expect(self, value):
+        if self._accept(value) is None:
+            raise ValueError(f"缺少 '{value}'")
+
+    def expr(self):
+        node = self.and_expr()
+        while self._accept('OR'):
+            node = self.formula._node('OR', node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.compare()
+        while self._accept('AND'):
+            node = self.formula._node('AND', node, self.compare())
+        return node
+
+    def compare(self):
+        node = self.additive()
+        while True:
+            op = self._accept('>=', '<=', '<>', '!=', '==', '>', '<', '=')
+            if op is None:
+                return node
+            node = self.formula._node(op, node, self.additive())
+
+    def additive(self):
+        node = self.term()
+        while True:
+            op = self._accept('+', '-')
+            if op is None:
+                return node
+            node = self.formula._node(op, node, self.term())
+
+    def term(self):
+        node = self.unary()
+        while True:
+            op = self._accept('*', '/')
+            if op is None:
+                return node
+            node = self.formula._node(op, node, self.unary())
+
+    def unary(self):
+        if self._accept('-'):
+            return self.formula._node('-', ('num', 0.0), self.unary())
+        if self._accept('+'):
+            return self.unary()
+        if self._accept('NOT', '!'):
+            return self.formula._node('NOT', self.unary())
+        return self.primary()
+
+    def primary(self):
+        kind, value = self._peek()
+        if kind is None:
+            raise ValueError("公式不完整")
+        self.pos += 1
+        if kind == 'num':
+            return ('num', value)
+        if value == '(':
+            node = self.expr()
+            self._expect(')')
+            return node
+        if kind != 'name':
+            raise ValueError(f"意外的符号: {value}")
+
+        name = value.upper()
+        if name in FUNCTIONS and self._accept('('):
+            args = [self.expr()]
+            while self._accept(','):
+                args.append(self.expr())
+            self._expect(')')
+            count, constants = FUNCTIONS[name]
+            if len(args) != count:
+                raise ValueError(f"{name} 需要 {count} 个参数")
+            for i in constants:
+                if not isinstance(args[i], tuple):
+                    raise ValueError(f"{name} 的第 {i + 1} 个参数必须为常数")
+            return self.formula._node(name, *args)
+        if name in self.scope:
+            return self.scope[name]
+        if name in self.params:
+            return ('num', self.params[name])
+        if name in INPUTS:
+            return self.formula._node('input', ('field', INPUTS[name]))
+        raise ValueError(f"未定义的变量: {value}")
+
+
+# ----------------------------------------------------------------------
+# 计算内核，输入均为 交易日 × 证券 的二维数组（或常数），沿第 0 维计算
+# ----------------------------------------------------------------------
+def _nan_mask(*arrays):
+    mask = None
+    for a in arrays:
+        if isinstance(a, np.ndarray):
+            m = np.isnan(a)
+            mask = m if mask is None else (mask | m)
+    return mask
+
+
+def _arith(func):
+    def kernel(ops, shape, out):
+        if out is None:
+            out = np.empty(shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            func(ops[0], ops[1], out=out)
+        return out
+    return kernel
+
+
+def _logic(func):
+    """比较与逻辑运算结果为 1.0 / 0.0，任一操作数为 NaN 时结果为 NaN"""
+    def kernel(ops, shape, out):
+        a, b = ops
+        if func in (np.logical_and, np.logical_or):
+            a, b = np.not_equal(a, 0), np.not_equal(b, 0)
+        with np.errstate(invalid='ignore'):
+            result = np.broadcast_to(func(a, b), shape).astype(np.float64)
+        mask = _nan_mask(*ops)
+        if mask is not None:
+            result[np.broadcast_to(mask, shape)] = np.nan
+        return result
+    return kernel
+
+
+def _not(ops, shape, out):
+    result = np.equal(ops[0], 0).astype(np.float64)
+    result[np.isnan(ops[0])] = np.nan
+    return result
+
+
+def _shift(x, n):
+    out = np.full(x.shape, np.nan)
+    if n < len(x):
+        out[n:] = x[:len(x) - n]
+    return out
+
+
+def _ref(ops, shape, out):
+    return _shift(np.broadcast_to(ops[0], shape), int(ops[1]))
+
+
+def _rolling_sum(x, n):
+    """窗口内有 NaN 时为 NaN，前 n-1 行为 NaN；n 为 0 时为累计和"""
+    nan = np.isnan(x)
+    filled = np.where(nan, 0.0, x)
+    if n <= 0:
+        out = np.cumsum(filled, axis=0)
+        out[np.cumsum(nan, axis=0) > 0] = np.nan
+        return out
+    csum = np.cumsum(filled, axis=0)
+    cnan = np.cumsum(nan, axis=0)
+    out = np.full(x.shape, np.nan)
+    if n > len(x):
+        return out
+    out[n - 1:] = csum[n - 1:]
+    out[n:] -= csum[:-n]
+    bad = cnan[n - 1:].copy()
+    bad[1:] -= cnan[:-n]
+    out[n - 1:][bad > 0] = np.nan
+    return out
+
+
+def _ma(ops, shape, out):
+    n = int(ops[1])
+    return _rolling_sum(np.broadcast_to(ops[0], shape), n) / (n if n > 0 else np.arange(1, shape[0] + 1)[:, None])
+
+
+def _sum(ops, shape, out):
+    return _rolling_sum(np.broadcast_to(ops[0], shape), int(ops[1]))
+
+
+def _count(ops, shape, out):
+    cond = np.where(np.isnan(ops[0]), 0.0, np.not_equal(ops[0], 0))
+    return _rolling_sum(np.broadcast_to(cond, shape).astype(np.float64), int(ops[1]))
+
+
+def _extreme(reduce, accumulate):
+    def kernel(ops, shape, out):
+        x = np.broadcast_to(ops[0], shape)
+        n = int(ops[1])
+        if n <= 0:
+            return accumulate(x, axis=0)
+        result = np.full(shape, np.nan)
+        if n <= shape[0]:
+            result[n - 1:] = reduce(sliding_window_view(x, n, axis=0), axis=-1)
+        return result
+    return kernel
+
+
+def _sma(ops, shape, out):
+    """SMA(X, N, M): Y = (M * X + (N - M) * Y') / N，以第一个有效值为初值，X 为 NaN 时保持前值"""
+    x = np.broadcast_to(ops[0], shape)
+    n, m = float(ops[1]), float(ops[2])
+    result = np.empty(shape)
+    prev = np.full(shape[1:], np.nan)
+    for t in range(shape[0]):
+        cur = x[t]
+        y = np.where(np.isnan(prev), cur, (m * cur + (n - m) * prev) / n)
+        prev = np.where(np.isnan(cur), prev, y)
+        result[t] = np.where(np.isnan(cur), np.nan, prev)
+    return result
+
+
+def _ema(ops, shape, out):
+    return _sma([ops[0], ops[1] + 1, 2.0], shape, out)
+
+
+def _cross(ops, shape, out):
+    a, b = (np.broadcast_to(o, shape) for o in ops)
+    with np.errstate(invalid='ignore'):
+        result = ((_shift(a, 1) < _shift(b, 1)) & (a > b)).astype(np.float64)
+    result[np.isnan(a) | np.isnan(b)] = np.nan
+    return result
+
+
+def _if(ops, shape, out):
+    cond, a, b = ops
+    result = np.where(np.not_equal(cond, 0), a, b)
+    result = np.array(np.broadcast_to(result, shape), dtype=np.float64)
+    result[np.broadcast_to(np.isnan(cond), shape)] = np.nan
+    return result
+
+
+def _elementwise(func):
+    def kernel(ops, shape, out):
+        return np.array(np.broadcast_to(func(*ops), shape), dtype=np.float64)
+    return kernel
+
+
+_KERNELS = {
+    '+': _arith(np.add), '-': _arith(np.subtract), '*': _arith(np.multiply), '/': _arith(np.divide),
+    **{op: _logic(_BINARY[op]) for op in ('>', '<', '>=', '<=', '=', '==', '<>', '!=', 'AND', 'OR')},
+    'NOT': _not,
+    'REF': _ref, 'MA': _ma, 'SUM': _sum, 'COUNT': _count,
+    'LLV': _extreme(np.min, np.fmin.accumulate), 'HHV': _extreme(np.max, np.fmax.accumulate),
+    'SMA': _sma, 'EMA': _ema, 'CROSS': _cross, 'IF': _if,
+    'ABS': _elementwise(np.abs), 'MAX': _elementwise(np.maximum), 'MIN': _elementwise(np.minimum),
+}
+
+
+def compile_formula(source, params=None):
+    """编译通达信公式，返回 Formula"""
+    return Formula(source, params)
+
+
+if __name__ == "__main__":
+    from hikyuu import *
+    from stock_pool import get_pool
+
+    # 20250324.ipynb 中的 RESULT 公式
+    source = """
+    VAR2:=REF(LOW,1);
+    VAR3:=SMA(ABS(LOW-VAR2),3,1)/SMA(MAX(LOW-VAR2,0.001),3,1)*100;
+    VAR4:=EMA(VAR3*10,3);
+    VAR5:=LLV(LOW,13);
+    VAR6:=HHV(VAR4,13);
+    VAR7:=EMA(IF(LOW<=VAR5,(VAR4+VAR6*2)/2,0),3)/618;
+    VAR8:=IF(VAR7>500,500,VAR7);
+    XG2:=IF(VAR8>1,1,0);
+    DKXC:=EMA((CLOSE+HIGH+LOW)/3,N);
+    XG4:=DKXC>=REF(DKXC,1) AND LOW>=DKXC;
+    RESULT:XG2 AND XG4;
+    """
+    formula = compile_formula(source, {'N': 10})
+    print(f"节点数: {len(formula)}, 字段: {formula.fields()}")
+    result = formula.evaluate_panel(get_pool('guchi'), Query(-300))['RESULT']
+    print(result.to_dataframe().iloc[-1].loc[lambda s: s > 0])
@@ -0,0 +1,180 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+from hikyuu import *
+from panel import datetime_numbers
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+TRADE_DTYPE = np.dtype([
+    ('datetime', 'i8'),       # Datetime.number
+    ('code', 'U8'),
+    ('business', 'i1'),       # BUSINESS 枚举值
+    ('plan_price', 'f8'),
+    ('real_price', 'f8'),
+    ('goal_price', 'f8'),
+    ('number', 'f8'),
+    ('cost', 'f8'),
+    ('stoploss', 'f8'),
+    ('cash', 'f8'),
+    ('part', 'i1'),           # 信号来源 SystemPart 枚举值
+])
+
+POSITION_DTYPE = np.dtype([
+    ('code', 'U8'),
+    ('take_datetime', 'i8'),
+    ('clean_datetime', 'i8'),  # 未平仓为 0
+    ('number', 'f8'),
+    ('total_number', 'f8'),
+    ('buy_money', 'f8'),
+    ('sell_money', 'f8'),
+    ('total_cost', 'f8'),
+    ('total_risk', 'f8'),
+])
+
+FUNDS_DTYPE = np.dtype([
+    ('datetime', 'i8'),
+    ('funds', 'f8'),
+])
+
+KINDS = ('trades', 'positions', 'funds')
+
+
+def _number(d):
+    """Datetime 转 Datetime.number，空值或 +infinity（未平仓）为 0"""
+    return 0 if d is None or d == Datetime() or d == Datetime.max() else d.number
+
+
+def trade_records(tm):
+    """交易账户的全部交易记录，TRADE_DTYPE 结构化数组"""
+    return np.array([
+        (t.datetime.number, t.stock.market_code if not t.stock.is_null() else '', int(t.business),
+         t.plan_price, t.real_price, t.goal_price, t.number, t.cost.total, t.stoploss, t.cash, int(t.from_))
+        for t in tm.get_trade_list()
+    ], dtype=TRADE_DTYPE)
+
+
+def tm_records(tm, dates=None):
+    """
+    将交易账户转换为列式记录
+
+    参数:
+        tm: 交易账户
+        dates: 资金曲线日期，Datetime 序列，None 时为账户建立日至最后交易日的交易日历
+
+    返回:
+        {'trades': ..., 'positions': ..., 'funds': ...} 三个结构化数组
+    """
+    trades = trade_records(tm)
+    positions = np.array([
+        (p.stock.market_code, _number(p.take_datetime), _number(p.clean_datetime), p.number,
+         p.total_number, p.buy_money, p.sell_money, p.total_cost, p.total_risk)
+        for p in list(tm.get_history_position_list()) + list(tm.get_position_list())
+    ], dtype=POSITION_DTYPE)
+
+    if dates is None:
+        last = tm.get_trade_list()[-1].datetime if len(tm.get_trade_list()) > 0 else tm.init_datetime
+        dates = sm.get_trading_calendar(Query(tm.init_datetime, last + Days(1)))
+    funds = np.empty(len(dates), dtype=FUNDS_DTYPE)
+    funds['datetime'] = datetime_numbers(dates)
+    funds['funds'] = np.asarray(tm.get_funds_curve(dates), dtype=np.float64)
+    return {'trades': trades, 'positions': positions, 'funds': funds}
+
+
+def export_tm(tm, directory, run_id, dates=None, fmt='npz'):
+    """
+    以二进制列式格式导出交易账户，代替 tm.tocsv
+
+    参数:
+        tm: 交易账户
+        directory: 输出目录，同一目录下可存放多次运行
+        run_id: 运行标识，作为文件名与 run_id 列
+        dates: 资金曲线日期，见 tm_records
+        fmt: 'npz' 或 'parquet'（需要安装 pyarrow）
+
+    返回:
+        写入的文件路径列表
+    """
+    return write_records(tm_records(tm, dates), directory, run_id, fmt)
+
+
+def write_records(records, directory, run_id, fmt='npz'):
+    """将 tm_records 的结果写入 directory，文件名为 {run_id}.npz 或 {kind}/{run_id}.parquet"""
+    run_id = str(run_id)
+    os.makedirs(directory, exist_ok=True)
+    if fmt == 'npz':
+        path = os.path.join(directory, f"{run_id}.npz")
+        np.savez(path, run_id=np.array(run_id), **records)
+        return [path]
+    if fmt == 'parquet':
+        if not HAS_PYARROW:
+            raise ImportError("导出 parquet 需要安装 pyarrow")
+        paths = []
+        for kind in KINDS:
+            table = pa.Table.from_pandas(pd.DataFrame(records[kind]), preserve_index=False)
+            table = table.append_column('run_id', pa.array([run_id] * table.num_rows, pa.string()))
+            os.makedirs(os.path.join(directory, kind), exist_ok=True)
+            path = os.path.join(directory, kind, f"{run_id}.parquet")
+            pq.write_table(table, path)
+            paths.append(path)
+        return paths
+    raise ValueError(f"不支持的格式: {fmt}")
+
+
+def load_runs(directory, kind='trades', run_ids=None):
+    """
+    读取目录下所有运行的某类记录，合并为一个 DataFrame
+
+    npz 文件先按结构化数组整体拼接，再一次性构造 DataFrame，
+    parquet 文件通过 pyarrow 多线程读取
+
+    参数:
+        directory: export_tm 的输出目录
+        kind: 'trades'、'positions' 或 'funds'
+        run_ids: 只读取指定的运行，None 表示全部
+
+    返回:
+        包含 run_id 列的 DataFrame，datetime 类字段为 Datetime.number 整数
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind 必须为 {KINDS} 之一")
+    wanted = None if run_ids is None else {str(r) for r in run_ids}
+
+    parquet_dir = os.path.join(directory, kind)
+    if os.path.isdir(parquet_dir):
+        if not HAS_PYARROW:
+            raise ImportError("读取 parquet 需要安装 pyarrow")
+        files = sorted(glob.glob(os.path.join(parquet_dir, '*.parquet')))
+        if wanted is not None:
+            files = [f for f in files if os.path.splitext(os.path.basename(f))[0] in wanted]
+        if not files:
+            return pd.DataFrame()
+        return pq.ParquetDataset(files).read(use_threads=True).to_pandas()
+
+    files = sorted(glob.glob(os.path.join(directory, '*.npz')))
+    arrays = []
+    ids = []
+    for path in files:
+        run_id = os.path.splitext(os.path.basename(path))[0]
+        if wanted is not None and run_id not in wanted:
+            continue
+        with np.load(path) as data:
+            arr = data[kind]
+        arrays.append(arr)
+        ids.append(np.full(len(arr), run_id, dtype=f"U{max(len(run_id), 1)}"))
+    if not arrays:
+        return pd.DataFrame()
+    df = pd.DataFrame(np.concatenate(arrays))
+    df['run_id'] = np.concatenate(ids)
+    return df
+
+
+def to_datetime(series):
+    """Datetime.number 列转换为 pandas 日期，0 转换为 NaT"""
+    return pd.to_datetime(series.astype(str), format='%Y%m%d%H%M', errors='coerce')
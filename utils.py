@@ -2,6 +2,7 @@ import pandas as pd
 from tqdm import tqdm
 import numpy as np
 import h5py
+import os
 def read_rps_file(h5_file, rps_period=10):
     
     print(f"读取 {h5_file} 中的RPS{rps_period}数据...")
@@ -72,7 +73,26 @@ def read_rps_file(h5_file, rps_period=10):
     return df
 
 
+# read_guchi 的解析结果缓存: {文件路径: (修改时间, 代码列表)}
+_guchi_cache = {}
+
+
 def read_guchi(file_path):
+    """读取通达信 EBK 自选股文件，文件未修改时直接返回上次的解析结果"""
+    try:
+        mtime = os.path.getmtime(file_path)
+    except OSError as e:
+        print(f"导入 EBK 文件时出错: {e}")
+        return []
+    cached = _guchi_cache.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return list(cached[1])
+    stock_list = _parse_ebk(file_path)
+    _guchi_cache[file_path] = (mtime, stock_list)
+    return list(stock_list)
+
+
+def _parse_ebk(file_path):
     stock_list = []
     try:
         # 尝试打开文件，通常是 GB2312 编码
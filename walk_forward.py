@@ -0,0 +1,327 @@
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from hikyuu import *
+from panel import kdata_panel, indicator_panel, numbers_to_index
+from fast_backtest import extract_signals, simulate, _check_supported
+from parallel import load_options, ensure_loaded, stock_codes, query_to_spec, spec_to_query, chunked, run_tasks
+
+
+def make_windows(n, train, test, step=None, anchored=False):
+    """
+    生成滚动窗口
+
+    参数:
+        n: 总 bar 数
+        train: 样本内窗口长度
+        test: 样本外窗口长度
+        step: 滚动步长，默认等于 test，使样本外区间首尾相接；不能小于 test，否则样本外区间重叠
+        anchored: True 时样本内起点固定为 0（扩展窗口）
+
+    返回:
+        [(train_start, train_end, test_start, test_end), ...]，均为左闭右开的下标
+    """
+    step = test if step is None else step
+    if step < test:
+        raise ValueError(f"滚动步长 {step} 小于样本外窗口长度 {test}，样本外区间会重叠")
+    windows = []
+    start = 0
+    while start + train + test <= n:
+        train_start = 0 if anchored else start
+        windows.append((train_start, start + train, start + train, start + train + test))
+        start += step
+    return windows
+
+
+def _param_grid(param_grid):
+    names = list(param_grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[param_grid[n] for n in names])]
+
+
+def _score(equity, metric):
+    """窗口评价指标，equity 为该窗口的权益曲线"""
+    if len(equity) < 2 or equity[0] <= 0:
+        return -np.inf
+    if metric == 'total_return':
+        return equity[-1] / equity[0] - 1
+    rets = np.diff(equity) / equity[:-1]
+    if metric == 'sharpe':
+        std = rets.std()
+        return rets.mean() / std * np.sqrt(252) if std > 0 else -np.inf
+    if metric == 'calmar':
+        peak = np.maximum.accumulate(equity)
+        mdd = (1 - equity / peak).max()
+        total = equity[-1] / equity[0] - 1
+        return total / mdd if mdd > 0 else total
+    raise ValueError(f"不支持的评价指标: {metric}")
+
+
+def _stitch(segments):
+    """拼接各窗口的样本外权益曲线，每段按上一段期末净值接续，返回净值序列（起点为 1）"""
+    values = []
+    level = 1.0
+    for seg in segments:
+        if len(seg) == 0:
+            continue
+        curve = seg / seg[0] * level if seg[0] > 0 else np.full(len(seg), level)
+        values.append(curve)
+        level = curve[-1]
+    return np.concatenate(values) if values else np.array([])
+
+
+def _walk(windows, n_params, evaluate, metric):
+    """
+    对每个窗口：样本内选出最优参数，再在样本外运行
+
+    evaluate(i, start, end) 返回第 i 组参数在该区间的权益曲线
+    """
+    results = []
+    for train_start, train_end, test_start, test_end in windows:
+        scores = [_score(evaluate(i, train_start, train_end), metric) for i in range(n_params)]
+        best = int(np.argmax(scores))
+        results.append((best, scores[best], evaluate(best, test_start, test_end)))
+    return results
+
+
+def _sys_walk_worker(task):
+    """
+    工作进程：只加载本批证券，每只证券、每组参数在全区间上计算一次信号，
+    运行分配给本任务的窗口（第 group 组，共 groups 组），返回各窗口的选参结果与样本外权益
+    """
+    part_name, params, codes, query_spec, schedule, metric, init_cash, mm_spec, group, groups = task
+    ensure_loaded(load_options(codes))
+    import hikyuu as hku
+
+    systems = []
+    for p in params:
+        my_sys = hku.get_part(part_name, **p)
+        if my_sys.mm is None:
+            mm_name, mm_n = mm_spec
+            my_sys.mm = hku.MM_FixedCount(mm_n) if mm_name == 'MM_FixedCount' else hku.MM_Nothing()
+        _check_supported(my_sys)
+        systems.append(my_sys)
+
+    query = spec_to_query(query_spec)
+    results = []
+    for code in codes:
+        stk = hku.sm[code]
+        if stk.is_null():
+            continue
+        kdata = stk.get_kdata(query)
+        windows = make_windows(len(kdata), *schedule)
+        mine = [w for w in range(len(windows)) if w % groups == group]
+        if not mine:
+            continue
+        arr = kdata.to_np()
+        open_, close = arr['open'], arr['close']
+        # 全区间只计算一次信号，各窗口截取
+        signals = [extract_signals(my_sys.sg, kdata) for my_sys in systems]
+
+        def evaluate(i, start, end):
+            my_sys = systems[i]
+            dates, buy, sell = signals[i]
+            mm_name = my_sys.mm.name
+            result = simulate(
+                dates[start:end], open_[start:end], close[start:end], buy[start:end], sell[start:end],
+                init_cash, mm=mm_name,
+                mm_n=my_sys.mm.get_param("n") if mm_name == 'MM_FixedCount' else 0,
+                stoploss_p=my_sys.st.get_param("p") if my_sys.st is not None else None,
+                buy_delay=my_sys.get_param("buy_delay"), sell_delay=my_sys.get_param("sell_delay"),
+                min_trade_number=stk.min_trade_number)
+            return result.equity
+
+        dates = signals[0][0]
+        for w, (best, score, equity) in zip(mine, _walk([windows[w] for w in mine], len(params), evaluate, metric)):
+            window = windows[w]
+            results.append((stk.market_code, w, dates[window[2]:window[3]], best, score, equity))
+    return results
+
+
+def sys_walk_forward(part_name, stks, query, param_grid, train=500, test=120, step=None,
+                     anchored=False, metric='total_return', init_cash=100000.0, mm=None,
+                     workers=None, chunk_size=20):
+    """
+    交易系统部件的滚动样本外检验
+
+    每只证券、每组参数只在整个区间上计算一次信号，各窗口直接截取信号数组，
+    使用 fast_backtest 的快速回测在样本内选参、在样本外运行。
+    证券按 chunk_size 分批，通过 parallel.run_tasks 在多个工作进程中执行；
+    批数少于工作进程数时，同一批证券的窗口再分组并行
+
+    参数:
+        part_name: 交易系统部件名称，如 'default.sys.双均线金叉'
+        stks: 证券或证券代码列表
+        query: 整个检验区间
+        param_grid: 参数网格
+        train, test, step, anchored: 窗口设置，单位为 bar，见 make_windows
+        metric: 样本内选参指标, 'total_return'、'sharpe' 或 'calmar'
+        init_cash: 每个窗口的初始资金
+        mm: 部件未指定资金管理时使用的资金管理器，MM_Nothing() 或 MM_FixedCount(n)，默认 MM_Nothing()
+        workers: 工作进程数，默认 CPU 核数
+        chunk_size: 每个任务包含的证券数量，工作进程只加载这些证券
+
+    返回:
+        (各窗口选参结果 DataFrame, {证券代码: 拼接后的样本外净值 Series})
+    """
+    params = _param_grid(param_grid)
+    schedule = (train, test, step, anchored)
+    # 提前检查窗口设置，避免在工作进程中才报错
+    make_windows(0, *schedule)
+    mm_spec = ('MM_Nothing', 0) if mm is None else \
+        (mm.name, mm.get_param("n") if mm.name == 'MM_FixedCount' else 0)
+    query_spec = query_to_spec(query)
+    code_chunks = chunked(stock_codes(stks), chunk_size)
+    groups = max(1, (workers or os.cpu_count() or 1) // max(len(code_chunks), 1))
+    tasks = [(part_name, params, codes, query_spec, schedule, metric, init_cash, mm_spec, group, groups)
+             for codes in code_chunks for group in range(groups)]
+
+    windows = {}
+    for _, results in run_tasks(_sys_walk_worker, tasks, workers, desc="滚动检验"):
+        for code, w, dates, best, score, equity in results:
+            windows.setdefault(code, {})[w] = (dates, best, score, equity)
+
+    rows = []
+    curves = {}
+    for code in sorted(windows):
+        segments, oos_dates = [], []
+        for w in sorted(windows[code]):
+            dates, best, score, equity = windows[code][w]
+            rows.append({'code': code, 'window': w, 'test_start': dates[0], 'test_end': dates[-1],
+                         'in_sample': score, 'out_of_sample': _score(equity, metric), **params[best]})
+            segments.append(equity)
+            oos_dates.append(dates)
+        curves[code] = pd.Series(_stitch(segments), index=numbers_to_index(np.concatenate(oos_dates)))
+    return pd.DataFrame(rows), curves
+
+
+def rotation_equity(factor, close, bottomn, adjust_cycle, start, end):
+    """
+    最低单因子轮动的快速模拟：每 adjust_cycle 个交易日按因子值选出最低的 bottomn 支，
+    调仓日收盘等权买入，持有至下一个调仓日
+
+    参数:
+        factor: 交易日 × 证券 的因子面板（应已做 REF(ind, 1) 处理）
+        close: 同形状的收盘价面板
+        bottomn: 持有数量
+        adjust_cycle: 调仓周期（交易日）
+        start, end: 模拟区间的行号，左闭右开
+
+    返回:
+        区间内的净值数组，起点为 1
+    """
+    n = end - start
+    if n <= 0:
+        return np.array([])
+    f = factor[start:end]
+    c = close[start:end]
+    adjust_rows = np.arange(0, n, adjust_cycle)
+    filled = np.where(np.isfinite(f[adjust_rows]), f[adjust_rows], np.inf)
+    k = min(bottomn, filled.shape[1])
+    if k < filled.shape[1]:
+        picks = np.argpartition(filled, k - 1, axis=1)[:, :k]
+    else:
+        picks = np.tile(np.arange(filled.shape[1]), (len(adjust_rows), 1))
+    valid = np.isfinite(np.take_along_axis(filled, picks, axis=1))
+    weights = np.zeros_like(filled)
+    np.put_along_axis(weights, picks, valid.astype(float), axis=1)
+    counts = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, counts, out=np.zeros_like(weights), where=counts > 0)
+
+    # 第 t 日的持仓为最近一个调仓日（含当日）选出的组合，收益计入 t+1 日
+    holding = weights[np.arange(n) // adjust_cycle]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rets = c[1:] / c[:-1] - 1
+    rets = np.where(np.isfinite(rets), rets, 0.0)
+    daily = (holding[:-1] * rets).sum(axis=1)
+    return np.concatenate([[1.0], np.cumprod(1 + daily)])
+
+
+def _rotation_worker(task):
+    """工作进程：在一个窗口的面板切片上选参并运行样本外区间，只做数组运算，不需要加载 hikyuu 数据"""
+    factor, close, params, window, metric = task
+    base = window[0]
+
+    def evaluate(i, start, end):
+        p = params[i]
+        return rotation_equity(factor, close, p.get('bottomn', 2), p.get('adjust_cycle', 10),
+                               start - base, end - base)
+
+    return _walk([window], len(params), evaluate, metric)[0]
+
+
+def rotation_walk_forward(ind, stks, query, param_grid, train=500, test=120, step=None,
+                          anchored=False, metric='total_return', workers=None):
+    """
+    单因子轮动组合（如 pf.base_最低单因子轮动）的滚动样本外检验
+
+    因子面板与收盘价面板在整个区间上只计算一次（需在当前进程中已加载数据），
+    各窗口截取面板切片，通过 parallel.run_tasks 在多个工作进程中并行选参与运行。
+
+    组合由 rotation_equity 近似模拟：调仓日收盘价等权成交，不计交易成本，不按最小交易单位取整，
+    也没有 PF_Simple 的资金分配与现金余额规则，样本外净值与实际组合存在差异，
+    可用 rotation_cross_check 在单个窗口上与 PF_Simple 对照
+
+    参数:
+        ind: 单因子，如 get_part('default.ind.市净率')
+        stks: 轮动证券池
+        query: 整个检验区间
+        param_grid: 参数网格，支持 bottomn 与 adjust_cycle，如 {'bottomn': [1, 2, 3], 'adjust_cycle': [5, 10, 20]}
+        train, test, step, anchored: 窗口设置，单位为交易日，见 make_windows
+        metric: 样本内选参指标
+        workers: 工作进程数，默认 CPU 核数
+
+    返回:
+        (各窗口选参结果 DataFrame, 拼接后的样本外净值 Series)
+    """
+    params = _param_grid(param_grid)
+    factor = indicator_panel(REF(ind, 1), stks, query)
+    close = kdata_panel(stks, query, fields=('close',))['close']
+    windows = make_windows(len(factor.dates), train, test, step, anchored)
+
+    # 每个任务只传递本窗口覆盖的面板行
+    tasks = [(factor.values[window[0]:window[3]], close.values[window[0]:window[3]], params, window, metric)
+             for window in windows]
+    results = {task[3]: result for task, result in
+               run_tasks(_rotation_worker, tasks, workers, desc="滚动检验", fresh_process=False)}
+
+    rows = []
+    segments = []
+    for w, window in enumerate(windows):
+        best, score, equity = results[window]
+        rows.append({'window': w, 'test_start': factor.dates[window[2]],
+                     'test_end': factor.dates[window[3] - 1],
+                     'in_sample': score, 'out_of_sample': _score(equity, metric), **params[best]})
+        segments.append(equity)
+    oos_dates = np.concatenate([factor.dates[w[2]:w[3]] for w in windows]) if windows else np.array([], dtype=np.int64)
+    return pd.DataFrame(rows), pd.Series(_stitch(segments), index=numbers_to_index(oos_dates))
+
+
+def rotation_cross_check(ind, stks, query, bottomn=2, adjust_cycle=10, init_cash=1000000.0,
+                         part_name='default.pf.base_最低单因子轮动'):
+    """
+    在单个区间（如一个样本外窗口）上对照 rotation_equity 的近似净值与实际 PF 部件的净值
+
+    参数:
+        ind: 单因子
+        stks: 轮动证券池
+        query: 对照区间
+        bottomn, adjust_cycle: 轮动参数
+        init_cash: PF 部件的初始资金，资金越大最小交易单位取整的影响越小
+        part_name: 资产组合部件
+
+    返回:
+        DataFrame: approx, pf 两列净值（起点为 1）及 diff，以日期为索引
+    """
+    factor = indicator_panel(REF(ind, 1), stks, query)
+    close = kdata_panel(stks, query, fields=('close',))['close']
+    approx = rotation_equity(factor.values, close.values, bottomn, adjust_cycle, 0, len(factor.dates))
+
+    dates = sm.get_trading_calendar(query)
+    my_tm = crtTM(dates[0], init_cash=init_cash)
+    my_pf = get_part(part_name, tm=my_tm, ind=ind, bottomn=bottomn, stks=stks, adjust_cycle=adjust_cycle)
+    my_pf.run(query)
+    funds = np.array(my_tm.get_funds_curve(dates), dtype=np.float64)
+    df = pd.DataFrame({'approx': approx, 'pf': funds / funds[0]}, index=numbers_to_index(factor.dates))
+    df['diff'] = df['approx'] - df['pf']
+    return df